@@ -1,21 +1,108 @@
+from django.conf import settings
 from django.contrib import admin, messages
-from apps.payments.models import Wallet, Transaction, TransactionStatus
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from apps.payments.models import Wallet, Transaction, TransactionStatus, PaymentEvent
 from .forms import TransactionForm
+from .reconciliation import settle_transactions
+
+# Below this many rows the exact COUNT(*) is cheap enough to keep
+EXACT_COUNT_THRESHOLD = getattr(settings, "PAYMENTS_ADMIN_EXACT_COUNT_THRESHOLD", 100000)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Use the planner's row estimate instead of COUNT(*) for unfiltered
+    changelists of large tables on PostgreSQL.
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if connection.vendor == "postgresql" and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                    [self.object_list.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > EXACT_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class WalletFilter(admin.SimpleListFilter):
+    """
+    Filter by the email of a wallet's owner typed into a search box, instead
+    of listing every wallet as a choice.
+    """
+    template = "admin/payments/wallet_filter.html"
+    field_name = None
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value():
+            wallet_id = Wallet.objects.filter(
+                user__email__iexact=self.value().strip()).values_list("pk", flat=True).first()
+            if wallet_id is None:
+                return queryset.none()
+            return queryset.filter(**{f"{self.field_name}_id": wallet_id})
+
+
+class CreditedWalletFilter(WalletFilter):
+    title = "credited wallet (email)"
+    parameter_name = "credit_to_email"
+    field_name = "credit_to"
+
+
+class DebitedWalletFilter(WalletFilter):
+    title = "debited wallet (email)"
+    parameter_name = "debit_to_email"
+    field_name = "debit_to"
 
 
 class WalletAdmin(admin.ModelAdmin):
     list_display = ('user', 'balance',)
-    readonly_fields = ('user', 'balance', 'deleted_at',)
+    list_select_related = ('user',)
+    # Striping is changed with the stripe_wallet command, it moves balances
+    readonly_fields = ('user', 'balance', 'balance_minor', 'stripe_count', 'deleted_at',)
     search_fields = ('user__email',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 class TransactionAdmin(admin.ModelAdmin):
     form = TransactionForm
     list_display = ('reference', 'value', 'status',
                     'credit_to', 'debit_to', "created_at")
-    list_filter = ('status', 'credit_to', 'debit_to')
+    list_select_related = ('credit_to__user', 'debit_to__user')
+    list_filter = ('status', CreditedWalletFilter, DebitedWalletFilter)
+    autocomplete_fields = ('credit_to', 'debit_to')
+    date_hierarchy = 'created_at'
     search_fields = ('reference', 'payment_provider_txn_id',)
-    readonly_fields = ('deleted_at', 'updated_by',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ('deleted_at', 'updated_by', 'owner', 'value_minor',)
+    actions = ('mark_successful',)
+
+    @admin.action(description="Mark selected pending transactions as successful")
+    def mark_successful(self, request, queryset):
+        outcomes = settle_transactions(
+            ids=list(queryset.values_list("pk", flat=True)), updated_by=request.user)
+        settled = [outcome for outcome in outcomes if outcome.ok]
+        failed = [outcome for outcome in outcomes if not outcome.ok]
+        if settled:
+            messages.success(request, f"{len(settled)} transactions were marked successful.")
+        for outcome in failed:
+            self.message_user(request, f"{outcome.reference}: {outcome.message}",
+                              level=messages.ERROR)
 
     def save_model(self, request, obj, form, change):
         # Call the clean method to trigger validation and apply logic
@@ -29,6 +116,9 @@ class TransactionAdmin(admin.ModelAdmin):
 
             form.instance.reference = reference
             form.instance.value = value
+            wallet = form.instance.credit_to or form.instance.debit_to
+            if wallet and not form.instance.owner_id:
+                form.instance.owner_id = wallet.user_id
 
             if message:
                 messages.success(request, message)
@@ -44,12 +134,21 @@ class TransactionAdmin(admin.ModelAdmin):
                 [
                     item.name
                     for item in obj._meta.fields
-                    if item.name not in ["deleted_at", "updated_by", ]
+                    if item.name not in ["deleted_at", "updated_by", "owner", ]
                 ]
             )
         else:
             return self.readonly_fields
 
 
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ('payment_provider_txn_id', 'event_type', 'status',
+                    'attempts', 'created_at', 'processed_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('payment_provider_txn_id',)
+    readonly_fields = ('payload', 'claimed_at', 'processed_at', 'created_at')
+
+
 admin.site.register(Wallet, WalletAdmin)
 admin.site.register(Transaction, TransactionAdmin)
+admin.site.register(PaymentEvent, PaymentEventAdmin)
@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from apps.shopping.models import Order
+from .models import (
+    ArchivedTransaction, Transaction, TransactionStatus, bump_wallet_versions,
+)
+
+RETENTION_DAYS = getattr(settings, "PAYMENTS_ARCHIVE_RETENTION_DAYS", 730)
+
+
+def archivable(retention_days=RETENTION_DAYS):
+    """
+    Soft-deleted transactions, and settled ones older than the retention
+    window. Pending transactions and transactions an order points at stay in
+    the hot table.
+    """
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    return (
+        Transaction.objects
+        .filter(Q(deleted_at__isnull=False) | Q(created_at__lt=cutoff))
+        .exclude(status=TransactionStatus.PENDING)
+        .exclude(Exists(Order.objects.filter(transaction=OuterRef("pk"))))
+    )
+
+
+def archive_transactions(retention_days=RETENTION_DAYS, batch_size=1000, limit=None):
+    """
+    Move archivable transactions to ArchivedTransaction, one short DB
+    transaction per batch. Returns the number of rows moved.
+    """
+    columns = [field.attname for field in ArchivedTransaction._meta.concrete_fields
+               if field.name != "archived_at"]
+    table = Transaction._meta.db_table
+    moved = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        with transaction.atomic():
+            rows = list(
+                archivable(retention_days).select_for_update(skip_locked=True)
+                .order_by("id").values(*columns)[:size]
+            )
+            if not rows:
+                break
+            # Listings with archived=false change
+            bump_wallet_versions(
+                wallet_ids=[row[name] for row in rows for name in ("credit_to_id", "debit_to_id")],
+                user_ids=[row["owner_id"] for row in rows],
+            )
+            ArchivedTransaction.objects.bulk_create(
+                [ArchivedTransaction(**row) for row in rows])
+            ids = [row["id"] for row in rows]
+            # A plain DELETE: SoftDeletionModel.delete() would only soft delete
+            with connections[Transaction.objects.db].cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        moved += len(rows)
+    return moved
+
+
+def live_archived():
+    return ArchivedTransaction.objects.filter(deleted_at__isnull=True)
+
+
+def unified(rows, archived_rows):
+    """
+    Union of two `transaction_values()` querysets, one over Transaction and one
+    over ArchivedTransaction, ordered like the listing. Orderings of the parts
+    are cleared, most databases reject ORDER BY inside a compound query.
+    """
+    return (rows.order_by().union(archived_rows.order_by(), all=True)
+            .order_by("-created_at", "-id"))
@@ -0,0 +1,173 @@
+import inspect
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .archive import unified
+from .conditional import awallet_state, is_not_modified, list_etag, not_modified, with_etag
+from .exceptions import PaymentGatewayUnavailable, PaymentVerificationFailed
+from .idempotency import async_idempotent, wallet_funding_key
+from .instrumentation import is_enabled, observe
+from .listing import represent, with_converted
+from .models import Wallet
+from .pagination import apaginate_by_keyset, astream_serialized, get_page_size
+from .utils import averify_payment
+from .views import (
+    fund_wallet, parse_currency, transaction_list_querysets, wallet_representation,
+    wallet_representation_etag,
+)
+
+db_logger = logging.getLogger("db")
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView with coroutine handlers. Authentication, permissions, throttles
+    and error responses go through APIView's own steps, so they behave like
+    the sync views; the sync ones run in a worker thread. DRF's dispatch is
+    sync only, under ASGI each request to it would hold a thread for its
+    whole duration.
+    """
+
+    permission_classes = [IsAuthenticated]
+    # Other renderers, like the browsable API, render with the sync ORM
+    renderer_classes = [JSONRenderer]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Skip APIView.as_view: before Django 5.0 its csrf_exempt wrapper
+        # turns the coroutine view back into a sync one
+        view = super(APIView, cls).as_view(**initkwargs)
+        view.cls = cls
+        view.initkwargs = initkwargs
+        # Like APIView: SessionAuthentication runs its own CSRF check
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authenticators and throttles may query the database or cache
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        if isinstance(self.response, Response):
+            self.response.render()
+        if is_enabled():
+            observe("payments_request_seconds", time.perf_counter() - start,
+                    endpoint=type(self).__name__, method=request.method)
+        return self.response
+
+
+class AsyncTransactionListAPIView(AsyncAPIView):
+    """Async TransactionListAPIView, same parameters and output."""
+
+    async def get(self, request):
+        _type = request.query_params.get("type")
+        cursor = request.query_params.get("cursor")
+        page_size = request.query_params.get("page_size")
+        stream = request.query_params.get("stream") in ("1", "true")
+        include_archived = request.query_params.get("archived") not in ("0", "false")
+        try:
+            currency = parse_currency(request.query_params.get("currency"))
+        except ValueError:
+            return Response({"currency": "Must be a 3 letter currency code."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        user = request.user
+        state = await awallet_state(user)
+        etag = list_etag(state, request.query_params)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+
+        wallet = state[0] if state else None
+        if _type == "wallet" and wallet is None:
+            raise Wallet.DoesNotExist()
+        rows, archived_rows = transaction_list_querysets(
+            user, wallet, _type, request.query_params.get("reference"), include_archived)
+
+        async def present(chunk):
+            data = represent(chunk)
+            if currency:
+                # Rate lookups go through the sync ORM
+                data = await sync_to_async(with_converted)(data, currency)
+            return data
+
+        if stream:
+            if archived_rows is not None:
+                rows = unified(rows, archived_rows)
+            return with_etag(astream_serialized(rows, present), etag)
+
+        if cursor or page_size:
+            try:
+                rows, next_cursor = await apaginate_by_keyset(
+                    rows, cursor, get_page_size(page_size), union_with=archived_rows)
+            except ValidationError as e:
+                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+            return with_etag(Response(
+                {"next": next_cursor, "results": await present(rows)},
+                status=status.HTTP_200_OK
+            ), etag)
+
+        if archived_rows is not None:
+            rows = unified(rows, archived_rows)
+        return with_etag(Response(await present([row async for row in rows]),
+                                  status=status.HTTP_200_OK), etag)
+
+
+class AsyncWalletAPIView(AsyncAPIView):
+    """Async WalletAPIView, same parameters and output."""
+
+    async def get(self, request):
+        try:
+            currency = parse_currency(request.query_params.get("currency"))
+        except ValueError:
+            return Response({"currency": "Must be a 3 letter currency code."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        wallet = await Wallet.objects.aget(user=request.user)
+        # Both read the cached dollar rate, which may block on a refresh
+        etag = await sync_to_async(wallet_representation_etag)(wallet, currency)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        data = await sync_to_async(wallet_representation)(wallet, currency)
+        return with_etag(Response(data, status=status.HTTP_200_OK), etag)
+
+    @async_idempotent(wallet_funding_key)
+    async def post(self, request):
+        req_data = request.data
+        wallet = await Wallet.objects.select_related("user").aget(user=request.user)
+
+        try:
+            payment_verify = await averify_payment(req_data)
+        except PaymentGatewayUnavailable as e:
+            # The "db" handler writes with the sync ORM
+            await sync_to_async(db_logger.warning)(
+                f'payment verification unavailable - {e.message}')
+            return Response({"message": e.message}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except PaymentVerificationFailed as e:
+            return Response({"message": e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The async ORM can't run transaction.atomic, the writes run in the
+        # sync thread like the sync view's
+        return await sync_to_async(fund_wallet)(wallet, req_data, payment_verify)
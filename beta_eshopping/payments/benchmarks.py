@@ -0,0 +1,172 @@
+import asyncio
+import itertools
+import subprocess
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from .management.commands._bench import percentile
+
+_transaction_ids = itertools.count(int(time.time() * 1000))
+
+
+def wallet_get(i, user):
+    return "get", reverse("payments:user-wallet"), None
+
+
+def wallet_post(i, user):
+    # Fresh provider id per request, so no request is an idempotent replay
+    data = {"transaction_id": next(_transaction_ids), "dollar_value": 10}
+    return "post", reverse("payments:user-wallet"), data
+
+
+def transactions_list(i, user):
+    return "get", reverse("payments:user-transactions"), {"type": "wallet"}
+
+
+def transactions_page(i, user):
+    return "get", reverse("payments:user-transactions"), {"page_size": 50}
+
+
+SCENARIOS = {
+    "wallet_get": wallet_get,
+    "wallet_post": wallet_post,
+    "transactions_list": transactions_list,
+    "transactions_page": transactions_page,
+}
+
+
+def run_scenario(request_factory, users, concurrency, total_requests):
+    """
+    Drive `total_requests` requests through the full Django/DRF stack from
+    `concurrency` threads, rotating through `users`, and summarize latency,
+    throughput and SQL queries per request.
+    """
+    counter = itertools.count()
+    samples = []
+    lock = threading.Lock()
+
+    def worker():
+        client = APIClient()
+        try:
+            while True:
+                i = next(counter)
+                if i >= total_requests:
+                    return
+                user = users[i % len(users)]
+                client.force_authenticate(user)
+                method, path, data = request_factory(i, user)
+
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = getattr(client, method)(path, data, format="json")
+                    if response.streaming:
+                        b"".join(response.streaming_content)
+                    latency = time.perf_counter() - start
+                with lock:
+                    samples.append((latency, len(queries), response.status_code))
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = [sample[0] for sample in samples]
+    queries = [sample[1] for sample in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample[2] >= 400),
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else 0,
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "queries_per_request_avg": round(sum(queries) / len(queries), 2) if queries else 0,
+        "queries_per_request_max": max(queries, default=0),
+    }
+
+
+async def run_asgi_scenario(view, request_factory, users, concurrency, total_requests):
+    """
+    Drive `total_requests` requests into `view` with `concurrency` of them
+    in flight on one event loop, the way Django's ASGI handler runs views in
+    a single worker: coroutine views on the loop, sync views through
+    thread-sensitive `sync_to_async`. Run it with `async_to_sync`.
+    """
+    factory = APIRequestFactory()
+    counter = itertools.count()
+    samples = []
+    view_is_async = asyncio.iscoroutinefunction(view)
+
+    def call_sync(request):
+        response = view(request)
+        response.render()
+        return response
+
+    async def worker():
+        while True:
+            i = next(counter)
+            if i >= total_requests:
+                return
+            user = users[i % len(users)]
+            method, path, data = request_factory(i, user)
+            request = getattr(factory, method)(path, data, format="json")
+            force_authenticate(request, user)
+
+            start = time.perf_counter()
+            if view_is_async:
+                response = await view(request)
+            else:
+                response = await sync_to_async(call_sync)(request)
+            samples.append((time.perf_counter() - start, response.status_code))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [sample[0] for sample in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample[1] >= 400),
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else 0,
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Relative change per scenario for the metrics worth watching between commits."""
+    changes = {}
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        changes[name] = {
+            metric: round((result[metric] - previous[metric]) / previous[metric] * 100, 1)
+            for metric in ("throughput_rps", "latency_p95_ms", "queries_per_request_avg")
+            if previous.get(metric)
+        }
+    return changes
@@ -0,0 +1,82 @@
+import hashlib
+import json
+
+from django.db.models import Case, F, When
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from .models import Wallet
+from .striping import stripe_versions
+
+# Clients must revalidate, but may keep and replay the body on 304
+CACHE_CONTROL = "private, no-cache"
+
+
+def _states(user):
+    # Striped wallets add their stripes' versions, the subquery only runs for them
+    return Wallet.objects.filter(user=user).annotate(state_version=Case(
+        When(stripe_count=0, then=F("version")),
+        default=F("version") + stripe_versions(),
+    )).values_list("pk", "state_version")
+
+
+def wallet_state(user):
+    """(wallet id, version) of the user's wallet, or None."""
+    return _states(user).first()
+
+
+async def awallet_state(user):
+    return await _states(user).afirst()
+
+
+def wallet_version(wallet):
+    if not wallet.stripe_count:
+        return wallet.version
+    return Wallet.objects.filter(pk=wallet.pk).annotate(
+        state_version=F("version") + stripe_versions()
+    ).values_list("state_version", flat=True).get()
+
+
+def make_etag(*parts):
+    """Strong ETag over everything the response body depends on."""
+    digest = hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def list_etag(state, query_params):
+    # Converted values depend on rates, those responses aren't cached
+    if state is None or query_params.get("currency"):
+        return None
+    return make_etag("transactions", *state, sorted(query_params.lists()))
+
+
+def wallet_etag(wallet, naira_rate, currency=None, rate=None):
+    return make_etag("wallet", wallet.pk, wallet_version(wallet), naira_rate, currency, rate)
+
+
+def is_not_modified(request, etag):
+    if etag is None:
+        return False
+    # If-None-Match uses the weak comparison, W/"x" matches "x". parse_etags
+    # keeps the prefix, proxies that compress the body add it
+    tags = {_opaque(tag) for tag in parse_etags(request.headers.get("If-None-Match", ""))}
+    return "*" in tags or _opaque(etag) in tags
+
+
+def _opaque(tag):
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    response["Cache-Control"] = CACHE_CONTROL
+    return response
+
+
+def with_etag(response, etag):
+    if etag is not None:
+        response["ETag"] = etag
+        response["Cache-Control"] = CACHE_CONTROL
+    return response
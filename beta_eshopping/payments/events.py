@@ -0,0 +1,158 @@
+import hmac
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    PaymentEvent, PaymentEventStatus, Transaction, TransactionStatus, Wallet,
+)
+from .serializers import GetTransactionSerializer
+from .utils import process_payment, verify_payment
+
+db_logger = logging.getLogger("db")
+
+MAX_ATTEMPTS = getattr(settings, "PAYMENT_EVENTS_MAX_ATTEMPTS", 5)
+# Events claimed by a worker that died are handed out again after this long
+CLAIM_TIMEOUT = timedelta(
+    seconds=getattr(settings, "PAYMENT_EVENTS_CLAIM_TIMEOUT", 300))
+
+
+def is_valid_signature(signature):
+    secret_hash = getattr(settings, "FLUTTERWAVE_WEBHOOK_HASH", None)
+    if not secret_hash or not signature:
+        return False
+    return hmac.compare_digest(signature, secret_hash)
+
+
+def enqueue_event(payload):
+    data = payload.get("data") or {}
+    return PaymentEvent.objects.create(
+        event_type=payload.get("event"),
+        payment_provider_txn_id=data.get("id"),
+        payload=payload,
+    )
+
+
+def claim_events(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=PaymentEventStatus.PENDING) |
+                Q(status=PaymentEventStatus.PROCESSING,
+                  claimed_at__lt=now - CLAIM_TIMEOUT)
+            )
+            .order_by("id")[:batch_size]
+        )
+        for event in events:
+            event.status = PaymentEventStatus.PROCESSING
+            event.claimed_at = now
+            event.attempts += 1
+        PaymentEvent.objects.bulk_update(
+            events, ["status", "claimed_at", "attempts"])
+    return events
+
+
+# Checkouts that fund a wallet send `meta.purpose` with this value and the
+# amount in dollars as `meta.dollar_value`
+WALLET_FUNDING = "wallet_funding"
+
+
+class UnmatchedEvent(Exception):
+    """A charge that is neither a known transaction nor a wallet funding."""
+
+
+def is_wallet_funding(meta):
+    return meta.get("purpose") == WALLET_FUNDING and bool(meta.get("dollar_value"))
+
+
+def apply_event(event):
+    """
+    Apply a `charge.completed` event. An existing transaction for the
+    provider id is moved to its verified status. Otherwise the event must be
+    a wallet funding for the customer's wallet, or `UnmatchedEvent` is
+    raised: order payments are recorded by the checkout itself.
+    """
+    if event.event_type != "charge.completed":
+        return
+
+    data = event.payload.get("data") or {}
+    meta = data.get("meta") or {}
+    req_data = {"transaction_id": data.get("id")}
+    funding = is_wallet_funding(meta)
+    if funding:
+        req_data["dollar_value"] = meta["dollar_value"]
+
+    # Checked before the gateway round trip, neither changes on a retry
+    if not Transaction.objects.filter(payment_provider_txn_id=data.get("id")).exists():
+        if not funding:
+            raise UnmatchedEvent(f"No transaction for {data.get('id')} and not a wallet funding")
+        email = (data.get("customer") or {}).get("email")
+        Wallet.objects.get(user__email=email)
+
+    # Gateway round trip happens before any row is locked
+    payment_verify = verify_payment(req_data)
+
+    with transaction.atomic():
+        existing = Transaction.objects.select_for_update().filter(
+            payment_provider_txn_id=data.get("id")).first()
+        if existing:
+            if existing.status != TransactionStatus.PENDING:
+                return
+            wallet = existing.credit_to
+        elif funding:
+            email = (data.get("customer") or {}).get("email")
+            wallet = Wallet.objects.get(user__email=email)
+        else:
+            raise UnmatchedEvent(f"Transaction {data.get('id')} no longer exists")
+
+        transaction_data = process_payment(
+            req_data, wallet, payment_verify=payment_verify)
+        if existing:
+            if transaction_data["status"] == TransactionStatus.PENDING:
+                return
+            serializer = GetTransactionSerializer(existing, partial=True, data={
+                "status": transaction_data["status"],
+                "reason_for_failure": transaction_data.get("reason_for_failure"),
+            })
+        else:
+            serializer = GetTransactionSerializer(data=transaction_data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        if wallet and serializer.instance.status == TransactionStatus.SUCCESSFUL:
+            wallet.deposit(serializer.instance.value,
+                           related_transaction=serializer.instance)
+
+
+def process_events(batch_size=100):
+    events = claim_events(batch_size)
+    for event in events:
+        try:
+            apply_event(event)
+        except UnmatchedEvent as e:
+            event.error = str(e)
+            event.status = PaymentEventStatus.PARKED
+        except Wallet.DoesNotExist:
+            # Retrying won't create the wallet, don't re-verify with the gateway
+            event.error = "No wallet for the customer's email"
+            event.status = PaymentEventStatus.FAILED
+        except Exception as e:
+            db_logger.exception(e)
+            event.error = str(e)
+            event.status = (PaymentEventStatus.FAILED
+                            if event.attempts >= MAX_ATTEMPTS
+                            else PaymentEventStatus.PENDING)
+        else:
+            event.error = None
+            event.status = PaymentEventStatus.PROCESSED
+            event.processed_at = timezone.now()
+
+    PaymentEvent.objects.bulk_update(
+        events, ["status", "error", "processed_at"])
+    return len(events)
@@ -7,3 +7,31 @@ class InsufficientFunds(Exception):
     def __init__(self, message=errMsg):
         self.message = message
         super().__init__(self.message)
+
+
+class PaymentGatewayUnavailable(Exception):
+    errMsg = "Payment provider is currently unavailable. Please try again shortly."
+
+    def __init__(self, message=errMsg):
+        self.message = message
+        super().__init__(self.message)
+
+
+class PaymentVerificationFailed(Exception):
+    errMsg = "The payment could not be verified."
+
+    def __init__(self, message=errMsg, status_code=None):
+        self.message = message
+        # HTTP status the payment provider answered with
+        self.status_code = status_code
+        super().__init__(self.message)
+
+
+class InvalidTransfer(Exception):
+    errMsg = "The transfer batch is invalid."
+
+    def __init__(self, message=errMsg, index=None):
+        self.message = message
+        # Position of the offending transfer in the batch
+        self.index = index
+        super().__init__(self.message)
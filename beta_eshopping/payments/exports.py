@@ -0,0 +1,104 @@
+import csv
+import datetime
+import io
+import json
+import zlib
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from .listing import field_names, owner_scope, to_representation, transaction_values
+from .models import Transaction
+from .archive import live_archived
+
+EXPORT_CHUNK_SIZE = getattr(settings, "PAYMENTS_EXPORT_CHUNK_SIZE", 2000)
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def parse_export_date(value):
+    """
+    Parse an ISO date or datetime bound into an aware datetime, dates are
+    midnight in the current time zone. Raises ValueError when invalid.
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(value)
+        parsed = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_rows(owner=None, wallet_ids=None, start=None, end=None,
+                include_archived=True, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Iterate the listing representation of matching transactions in id order.
+    `iterator()` reads through a server-side cursor on PostgreSQL, so only
+    `chunk_size` rows are held in memory at a time.
+    """
+    conditions = []
+    if owner is not None:
+        conditions.append(owner_scope(owner))
+    if wallet_ids:
+        conditions.append(Q(credit_to__in=wallet_ids) | Q(debit_to__in=wallet_ids))
+    if start:
+        conditions.append(Q(created_at__gte=start))
+    if end:
+        conditions.append(Q(created_at__lt=end))
+
+    rows = transaction_values(Transaction.active_objects.filter(*conditions))
+    if include_archived:
+        rows = rows.order_by().union(
+            transaction_values(live_archived().filter(*conditions)).order_by(), all=True)
+
+    for row in rows.order_by("id").iterator(chunk_size=chunk_size):
+        yield to_representation(row)
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(field_names())
+    for i, row in enumerate(rows, 1):
+        writer.writerow(["" if value is None else value for value in row.values()])
+        # Hand the buffer over every few hundred rows rather than per row
+        if i % 500 == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def iter_ndjson(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, cls=JSONEncoder, ensure_ascii=False))
+        if len(lines) == 500:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(export_format, rows, compress=False):
+    chunks = iter_csv(rows) if export_format == "csv" else iter_ndjson(rows)
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,97 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeFlutterwaveGateway:
+    """
+    Local stand-in for the Flutterwave verify endpoint, for tests and load
+    tests. `latency` (seconds) is added to every response, `status` is the
+    payment status reported back and `fail_with` makes the gateway answer
+    with that HTTP status instead.
+
+        with FakeFlutterwaveGateway(latency=0.2) as gateway:
+            client = FlutterwaveClient(base_url=gateway.url, secret_key="test")
+    """
+
+    path_pattern = re.compile(r"^/transactions/(?P<id>[^/]+)/verify$")
+
+    def __init__(self, latency=0, status="successful", amount=100,
+                 currency="USD", payment_type="card", fail_with=None):
+        self.latency = latency
+        self.status = status
+        self.amount = amount
+        self.currency = currency
+        self.payment_type = payment_type
+        self.fail_with = fail_with
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def payload(self, transaction_id):
+        return {
+            "status": "success",
+            "message": "Transaction fetched successfully",
+            "data": {
+                "id": int(transaction_id) if transaction_id.isdigit() else transaction_id,
+                "tx_ref": f"FLW-{transaction_id}",
+                "amount": self.amount,
+                "currency": self.currency,
+                "payment_type": self.payment_type,
+                "status": self.status,
+                "message": None if self.status == "successful" else "Declined",
+            },
+        }
+
+    def start(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with gateway._lock:
+                    gateway.requests += 1
+                if gateway.latency:
+                    time.sleep(gateway.latency)
+
+                match = gateway.path_pattern.match(self.path)
+                if gateway.fail_with:
+                    self._send(gateway.fail_with, {"status": "error"})
+                elif not match:
+                    self._send(404, {"status": "error", "message": "Not found"})
+                else:
+                    self._send(200, gateway.payload(match.group("id")))
+
+            def _send(self, code, body):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
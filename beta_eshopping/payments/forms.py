@@ -36,9 +36,10 @@ class TransactionForm(forms.ModelForm):
                 'debit_to', "Credited and Debited Wallet cannot be provided at the same time!")
 
         if debit_to:
-            if value > debit_to.balance:
+            balance = debit_to.current_balance()
+            if value > balance:
                 self.add_error(
-                    'value', f"Insufficient funds. {debit_to.user.first_name} balance is {debit_to.balance} USD")
+                    'value', f"Insufficient funds. {debit_to.user.first_name} balance is {balance} USD")
 
     def process_transaction(self):
         status = self.cleaned_data.get("status")
@@ -52,7 +53,10 @@ class TransactionForm(forms.ModelForm):
             reference = update_transaction_reference(
                 credit_to, debit_to, reference)
             if credit_to or debit_to:
+                # Admin edits are rare; lock the wallet row so the balance
+                # check in clean() is re-applied against the committed value
                 message = process_successful_transaction(
-                    credit_to, debit_to, value
+                    credit_to, debit_to, value, lock=True,
+                    related_transaction=self.instance if self.instance.pk else None
                 )
         return reference, value, message,
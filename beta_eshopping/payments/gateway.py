@@ -0,0 +1,230 @@
+import asyncio
+import threading
+import time
+import weakref
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .exceptions import PaymentGatewayUnavailable, PaymentVerificationFailed
+
+try:
+    # Only needed by the async views
+    import httpx
+except ImportError:
+    httpx = None
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitBreaker:
+    """
+    Stop calling the gateway after `failure_threshold` consecutive failures
+    and let a single trial request through once `reset_timeout` has passed.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise PaymentGatewayUnavailable()
+            # Half-open: push the deadline out so only this caller tries
+            self._opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+def secret_key_setting(secret_key=None):
+    secret_key = secret_key or getattr(settings, "FLUTTERWAVE_SECRET_KEY", "")
+    if not secret_key:
+        raise ImproperlyConfigured("FLUTTERWAVE_SECRET_KEY must be set")
+    return secret_key
+
+
+def verified_payload(breaker, response):
+    """
+    Body of a verify response. Rate limiting and server errors count against
+    the breaker; other non-2xx answers are about the request, not the
+    gateway's health, and raise PaymentVerificationFailed.
+    """
+    if response is None or response.status_code == 429 or response.status_code >= 500:
+        breaker.record_failure()
+        raise PaymentGatewayUnavailable()
+    breaker.record_success()
+    if not 200 <= response.status_code < 300:
+        try:
+            message = response.json().get("message")
+        except (ValueError, AttributeError):
+            message = None
+        raise PaymentVerificationFailed(message or PaymentVerificationFailed.errMsg,
+                                        status_code=response.status_code)
+    return response.json()
+
+
+class FlutterwaveClient:
+    def __init__(self, base_url=None, secret_key=None, connect_timeout=None,
+                 read_timeout=None, retries=None, backoff_factor=None,
+                 pool_size=None, breaker=None):
+        self.base_url = (base_url or getattr(
+            settings, "FLUTTERWAVE_BASE_URL", "https://api.flutterwave.com/v3")).rstrip("/")
+        self.secret_key = secret_key_setting(secret_key)
+        self.timeout = (
+            connect_timeout or getattr(settings, "FLUTTERWAVE_CONNECT_TIMEOUT", 3),
+            read_timeout or getattr(settings, "FLUTTERWAVE_READ_TIMEOUT", 10),
+        )
+        retries = getattr(settings, "FLUTTERWAVE_RETRIES", 2) if retries is None else retries
+        backoff_factor = backoff_factor or getattr(settings, "FLUTTERWAVE_BACKOFF_FACTOR", 0.3)
+        pool_size = pool_size or getattr(settings, "FLUTTERWAVE_POOL_SIZE", 20)
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=getattr(settings, "FLUTTERWAVE_BREAKER_THRESHOLD", 5),
+            reset_timeout=getattr(settings, "FLUTTERWAVE_BREAKER_RESET", 30),
+        )
+
+        # Verification is a GET, so retrying it is safe
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.secret_key}",
+            "Content-Type": "application/json",
+        })
+
+    def verify_transaction(self, transaction_id):
+        self.breaker.before_call()
+        try:
+            response = self.session.get(
+                f"{self.base_url}/transactions/{transaction_id}/verify",
+                timeout=self.timeout,
+            )
+        except requests.RequestException:
+            response = None
+        return verified_payload(self.breaker, response)
+
+
+class AsyncFlutterwaveClient:
+    """
+    `FlutterwaveClient` for async views, on an `httpx.AsyncClient`. Same
+    settings, retry policy and circuit breaker, but waiting on the gateway
+    doesn't hold a thread.
+    """
+
+    def __init__(self, base_url=None, secret_key=None, connect_timeout=None,
+                 read_timeout=None, retries=None, backoff_factor=None,
+                 pool_size=None, breaker=None):
+        if httpx is None:
+            raise ImproperlyConfigured("The async payments views require httpx")
+        self.base_url = (base_url or getattr(
+            settings, "FLUTTERWAVE_BASE_URL", "https://api.flutterwave.com/v3")).rstrip("/")
+        secret_key = secret_key_setting(secret_key)
+        self.retries = getattr(settings, "FLUTTERWAVE_RETRIES", 2) if retries is None else retries
+        self.backoff_factor = backoff_factor or getattr(settings, "FLUTTERWAVE_BACKOFF_FACTOR", 0.3)
+        pool_size = pool_size or getattr(settings, "FLUTTERWAVE_POOL_SIZE", 20)
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=getattr(settings, "FLUTTERWAVE_BREAKER_THRESHOLD", 5),
+            reset_timeout=getattr(settings, "FLUTTERWAVE_BREAKER_RESET", 30),
+        )
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "Authorization": f"Bearer {secret_key}",
+                "Content-Type": "application/json",
+            },
+            timeout=httpx.Timeout(
+                read_timeout or getattr(settings, "FLUTTERWAVE_READ_TIMEOUT", 10),
+                connect=connect_timeout or getattr(settings, "FLUTTERWAVE_CONNECT_TIMEOUT", 3),
+            ),
+            limits=httpx.Limits(max_connections=pool_size,
+                                max_keepalive_connections=pool_size),
+        )
+
+    async def verify_transaction(self, transaction_id):
+        self.breaker.before_call()
+        response = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff_factor * 2 ** (attempt - 1))
+            try:
+                response = await self.client.get(f"/transactions/{transaction_id}/verify")
+            except httpx.HTTPError:
+                response = None
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                break
+        return verified_payload(self.breaker, response)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_client = None
+_client_lock = threading.Lock()
+# httpx connection pools belong to the event loop they were opened on
+_async_clients = weakref.WeakKeyDictionary()
+_async_override = None
+
+
+def get_gateway_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = FlutterwaveClient()
+    return _client
+
+
+def set_gateway_client(client):
+    """Swap the process-wide client, e.g. for one pointed at a fake gateway."""
+    global _client
+    _client = client
+
+
+def get_async_gateway_client():
+    """The async client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = (_async_override or AsyncFlutterwaveClient)()
+    return client
+
+
+def set_async_gateway_client(factory):
+    """
+    Build each loop's async client with `factory`, e.g. one pointed at a
+    fake gateway. Pass None to restore the default.
+    """
+    global _async_override
+    _async_override = factory
+    _async_clients.clear()
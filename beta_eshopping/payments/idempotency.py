@@ -0,0 +1,184 @@
+import asyncio
+import time
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord, IdempotencyStatus
+
+# How long a duplicate waits for the first request before giving up
+WAIT_TIMEOUT = getattr(settings, "PAYMENTS_IDEMPOTENCY_WAIT_TIMEOUT", 15)
+POLL_INTERVAL = getattr(settings, "PAYMENTS_IDEMPOTENCY_POLL_INTERVAL", 0.1)
+# In-progress records older than this belong to a request that died
+LOCK_TIMEOUT = timedelta(
+    seconds=getattr(settings, "PAYMENTS_IDEMPOTENCY_LOCK_TIMEOUT", 120))
+# Responses the client is expected to retry, these are never replayed. 502
+# is a payment the gateway has not settled yet, or one it declined.
+RETRYABLE_STATUSES = (
+    status.HTTP_500_INTERNAL_SERVER_ERROR,
+    status.HTTP_502_BAD_GATEWAY,
+    status.HTTP_503_SERVICE_UNAVAILABLE,
+)
+
+
+def wallet_funding_key(request):
+    header = request.headers.get("Idempotency-Key")
+    if header:
+        return f"user:{request.user.pk}:{header}"
+    transaction_id = request.data.get("transaction_id")
+    if transaction_id:
+        return f"user:{request.user.pk}:flutterwave:{transaction_id}"
+    return None
+
+
+def transfer_key(request):
+    header = request.headers.get("Idempotency-Key")
+    if header:
+        return f"user:{request.user.pk}:transfers:{header}"
+    return None
+
+
+def claim(key, user=None, attempts=3):
+    """
+    Return (record, created); created is False when the key was seen before.
+    The record is None if the key kept being released under us, callers
+    treat that like a request that is still in progress.
+    """
+    for _ in range(attempts):
+        try:
+            with transaction.atomic():
+                return IdempotencyRecord.objects.create(key=key, user=user), True
+        except IntegrityError:
+            pass
+        record = IdempotencyRecord.objects.filter(key=key).first()
+        if record is not None:
+            break
+        # The first request released the key in between, claim it again
+    else:
+        return None, False
+
+    if (record.status == IdempotencyStatus.IN_PROGRESS and
+            record.created_at < timezone.now() - LOCK_TIMEOUT):
+        # Take over from the dead request; only one caller can win the update
+        taken = IdempotencyRecord.objects.filter(
+            pk=record.pk, created_at=record.created_at
+        ).update(created_at=timezone.now())
+        if taken:
+            return record, True
+    return record, False
+
+
+def wait_for_completion(record, timeout=WAIT_TIMEOUT, interval=POLL_INTERVAL):
+    deadline = time.monotonic() + timeout
+    while record is not None:
+        if record.status == IdempotencyStatus.COMPLETED:
+            return record
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(interval)
+        # None once the first request failed and released the key
+        record = IdempotencyRecord.objects.filter(pk=record.pk).first()
+    return None
+
+
+def complete(record, response):
+    record.status = IdempotencyStatus.COMPLETED
+    record.response_status = response.status_code
+    record.response_body = response.data
+    record.completed_at = timezone.now()
+    record.save(update_fields=[
+        "status", "response_status", "response_body", "completed_at"])
+
+
+def release(record):
+    IdempotencyRecord.objects.filter(pk=record.pk).delete()
+
+
+def idempotent(key_func):
+    """
+    Replay the stored response for requests whose key was already handled.
+    Concurrent duplicates wait for the first request to finish. Retryable
+    errors are not stored so the client can try again.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = key_func(request)
+            if not key:
+                return view_method(self, request, *args, **kwargs)
+
+            record, created = claim(key, request.user)
+            if not created:
+                record = wait_for_completion(record)
+                if record is None:
+                    return Response(
+                        {"message": "A request with this key is already being processed."},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                return Response(record.response_body, status=record.response_status)
+
+            try:
+                response = view_method(self, request, *args, **kwargs)
+            except Exception:
+                release(record)
+                raise
+            if response.status_code in RETRYABLE_STATUSES:
+                release(record)
+            else:
+                complete(record, response)
+            return response
+        return wrapper
+    return decorator
+
+
+async def await_completion(record, timeout=WAIT_TIMEOUT, interval=POLL_INTERVAL):
+    """`wait_for_completion` without holding a thread while polling."""
+    deadline = time.monotonic() + timeout
+    while record is not None:
+        if record.status == IdempotencyStatus.COMPLETED:
+            return record
+        if time.monotonic() >= deadline:
+            return None
+        await asyncio.sleep(interval)
+        record = await IdempotencyRecord.objects.filter(pk=record.pk).afirst()
+    return None
+
+
+def async_idempotent(key_func):
+    """`idempotent` for coroutine view methods."""
+    def decorator(view_method):
+        @wraps(view_method)
+        async def wrapper(self, request, *args, **kwargs):
+            key = key_func(request)
+            if not key:
+                return await view_method(self, request, *args, **kwargs)
+
+            # claim() relies on a savepoint, which the async ORM can't open
+            record, created = await sync_to_async(claim)(key, request.user)
+            if not created:
+                record = await await_completion(record)
+                if record is None:
+                    return Response(
+                        {"message": "A request with this key is already being processed."},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                return Response(record.response_body, status=record.response_status)
+
+            try:
+                response = await view_method(self, request, *args, **kwargs)
+            except Exception:
+                await sync_to_async(release)(record)
+                raise
+            if response.status_code in RETRYABLE_STATUSES:
+                await sync_to_async(release)(record)
+            else:
+                await sync_to_async(complete)(record, response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,176 @@
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+FAMILIES = {
+    "payments_phase_seconds": ("Time spent in payment flow phases", SECONDS_BUCKETS),
+    "payments_request_seconds": ("Payments API request duration", SECONDS_BUCKETS),
+    "payments_request_db_seconds": ("Time spent in SQL per payments API request", SECONDS_BUCKETS),
+    "payments_request_queries": ("SQL queries per payments API request", QUERY_BUCKETS),
+}
+
+
+def is_enabled():
+    return getattr(settings, "PAYMENTS_METRICS_ENABLED", False)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+_histograms = {}
+_registry_lock = threading.Lock()
+
+
+def observe(family, value, **labels):
+    key = (family, tuple(sorted(labels.items())))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _histograms.setdefault(key, Histogram(FAMILIES[family][1]))
+    histogram.observe(value)
+
+
+def reset():
+    with _registry_lock:
+        _histograms.clear()
+
+
+@contextmanager
+def phase(name):
+    if not is_enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("payments_phase_seconds", time.perf_counter() - start, phase=name)
+
+
+def timed(name):
+    """Record the duration of every call under `payments_phase_seconds{phase=name}`."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not is_enabled():
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    observe("payments_phase_seconds", time.perf_counter() - start, phase=name)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe("payments_phase_seconds", time.perf_counter() - start, phase=name)
+        return wrapper
+    return decorator
+
+
+class QueryCounter:
+    """`connection.execute_wrapper` hook counting and timing SQL statements."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - start
+
+
+class InstrumentedViewMixin:
+    """Record duration, SQL time and query count of every request to the view."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_enabled():
+            return super().dispatch(request, *args, **kwargs)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+        labels = {"endpoint": type(self).__name__, "method": request.method}
+        observe("payments_request_seconds", time.perf_counter() - start, **labels)
+        observe("payments_request_db_seconds", counter.seconds, **labels)
+        observe("payments_request_queries", counter.queries, **labels)
+        return response
+
+
+def _format_labels(labels, **extra):
+    labels = list(labels) + list(extra.items())
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def render_prometheus(extra_counters=None):
+    """
+    Text exposition of every histogram, plus `extra_counters`:
+    {name: (help, {label tuple: value})}.
+    """
+    with _registry_lock:
+        items = sorted(_histograms.items())
+
+    lines = []
+    for family, (help_text, buckets) in FAMILIES.items():
+        family_items = [(labels, h) for (name, labels), h in items if name == family]
+        if not family_items:
+            continue
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} histogram")
+        for labels, histogram in family_items:
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{family}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+            lines.append(f'{family}_bucket{_format_labels(labels, le="+Inf")} {count}')
+            lines.append(f"{family}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{family}_count{_format_labels(labels)} {count}")
+
+    for name, (help_text, values) in (extra_counters or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in values.items():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
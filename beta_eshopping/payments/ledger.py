@@ -0,0 +1,155 @@
+import uuid
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case, DecimalField, Exists, F, Max, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+
+from .models import LedgerEntry, Wallet, WalletBalanceSnapshot, WalletStripe
+from .striping import stripe_balance
+
+ZERO = Decimal("0.00")
+LEDGER_OPENING_ACCOUNT = "opening"
+
+
+def latest_snapshot(wallet, at=None):
+    snapshots = WalletBalanceSnapshot.objects.filter(wallet=wallet)
+    if at is not None:
+        snapshots = snapshots.filter(taken_at__lte=at)
+    return snapshots.order_by("-taken_at", "-id").first()
+
+
+def balance_at(wallet, at=None):
+    """Balance of a wallet at `at` (default: now) from a snapshot plus its tail."""
+    snapshot = latest_snapshot(wallet, at)
+    entries = LedgerEntry.objects.filter(wallet=wallet)
+    balance = ZERO
+    if snapshot:
+        balance = snapshot.balance
+        entries = entries.filter(id__gt=snapshot.last_entry_id)
+    if at is not None:
+        entries = entries.filter(created_at__lte=at)
+    return balance + (entries.aggregate(total=Sum("amount"))["total"] or ZERO)
+
+
+def statement(wallet, start, end):
+    """Return the opening balance at `start` and the wallet's entries up to `end`."""
+    opening = balance_at(wallet, start)
+    entries = LedgerEntry.objects.filter(
+        wallet=wallet, created_at__gt=start, created_at__lte=end
+    ).select_related("transaction").order_by("id")
+    return opening, entries
+
+
+def take_snapshots(batch_size=1000):
+    """
+    Snapshot every wallet with ledger activity since its last snapshot, using
+    the `balance_after` of its latest entry, or the whole balance when that
+    entry has none. Returns the number created.
+    """
+    watermark = WalletBalanceSnapshot.objects.aggregate(
+        last=Max("last_entry_id"))["last"] or 0
+    wallet_ids = list(
+        LedgerEntry.objects.filter(wallet__isnull=False, id__gt=watermark)
+        .values_list("wallet_id", flat=True).distinct()
+    )
+
+    created = 0
+    for i in range(0, len(wallet_ids), batch_size):
+        latest = (
+            LedgerEntry.objects.filter(wallet_id__in=wallet_ids[i:i + batch_size])
+            .values("wallet_id").annotate(last_id=Max("id"))
+        )
+        snapshots, unknown = [], []
+        for entry in LedgerEntry.objects.filter(id__in=[row["last_id"] for row in latest]):
+            if entry.balance_after is None:
+                # A move on one stripe of a striped wallet, it carries no balance
+                unknown.append(entry.wallet_id)
+            else:
+                snapshots.append(WalletBalanceSnapshot(
+                    wallet_id=entry.wallet_id, balance=entry.balance_after,
+                    last_entry=entry, taken_at=entry.created_at))
+        created += len(WalletBalanceSnapshot.objects.bulk_create(snapshots))
+        created += sum(1 for wallet_id in unknown if snapshot_whole_balance(wallet_id))
+    return created
+
+
+def snapshot_whole_balance(wallet_id):
+    """
+    Snapshot a wallet from its row and its stripes. Every stripe is locked
+    for the few reads this takes, so no move is half written and the total
+    is the balance as of the wallet's latest entry.
+    """
+    with transaction.atomic():
+        wallet = Wallet.objects.select_for_update(no_key=True).filter(pk=wallet_id).first()
+        if wallet is None:
+            return None
+        stripes = (WalletStripe.objects.select_for_update().filter(wallet=wallet)
+                   .order_by("index").values_list("balance", flat=True))
+        balance = (wallet.balance or ZERO) + sum(stripes, ZERO)
+        entry = LedgerEntry.objects.filter(wallet=wallet).order_by("-id").first()
+        if entry is None:
+            return None
+        return WalletBalanceSnapshot.objects.create(
+            wallet=wallet, balance=balance, last_entry=entry, taken_at=entry.created_at)
+
+
+def open_balances(batch_size=1000):
+    """
+    Write an opening entry for wallets that have no ledger history yet, so the
+    ledger accounts for balances that predate it.
+    """
+    opened = 0
+    while True:
+        with transaction.atomic():
+            # No join: FOR UPDATE can't lock the nullable side of an outer join
+            wallets = list(
+                Wallet.objects.select_for_update()
+                .filter(~Exists(LedgerEntry.objects.filter(wallet=OuterRef("pk"))))
+                .order_by("pk")[:batch_size]
+            )
+            if not wallets:
+                return opened
+            entries = []
+            for wallet in wallets:
+                group = uuid.uuid4()
+                balance = wallet.balance or ZERO
+                entries += [
+                    LedgerEntry(group=group, account=f"wallet:{wallet.pk}", wallet=wallet,
+                                amount=balance, balance_after=balance),
+                    LedgerEntry(group=group, account=LEDGER_OPENING_ACCOUNT,
+                                amount=-balance),
+                ]
+            LedgerEntry.objects.bulk_create(entries)
+            opened += len(wallets)
+
+
+def mismatched_wallets():
+    """
+    Wallets whose balance, with the stripes of striped wallets, differs from
+    the latest snapshot plus the ledger tail.
+    """
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+    snapshots = WalletBalanceSnapshot.objects.filter(
+        wallet=OuterRef("pk")).order_by("-taken_at", "-id")
+    tail = (
+        LedgerEntry.objects.filter(wallet=OuterRef("pk"), id__gt=OuterRef("snapshot_entry"))
+        .values("wallet").annotate(total=Sum("amount")).values("total")
+    )
+    return (
+        Wallet.objects
+        .annotate(
+            snapshot_balance=Coalesce(
+                Subquery(snapshots.values("balance")[:1]), Value(ZERO), output_field=decimal),
+            snapshot_entry=Coalesce(
+                Subquery(snapshots.values("last_entry_id")[:1]), Value(0)),
+        )
+        .annotate(ledger_balance=F("snapshot_balance") + Coalesce(
+            Subquery(tail), Value(ZERO), output_field=decimal))
+        .annotate(current_balance=Case(
+            When(stripe_count=0, then=F("balance")),
+            default=F("balance") + stripe_balance(), output_field=decimal))
+        .exclude(current_balance=F("ledger_balance"))
+    )
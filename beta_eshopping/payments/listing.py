@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.db.models import Case, CharField, Q, Value, When
+from rest_framework.relations import RelatedField
+from apps.shopping.models import Order
+
+from .instrumentation import timed
+from .models import Wallet
+from .rates import rate_table
+from .serializers import TransactionSerializer
+
+# Same rules as TransactionSerializer.get_transaction_type, computed in SQL
+# from the FK ids so no wallet is ever loaded
+TRANSACTION_TYPE = Case(
+    When(credit_to__isnull=False, debit_to__isnull=False, then=Value(None)),
+    When(credit_to__isnull=False, then=Value("credit")),
+    When(debit_to__isnull=False, then=Value("debit")),
+    default=Value(None),
+    output_field=CharField(),
+)
+
+
+
+def owner_scope(user):
+    """
+    Condition matching the transactions of `user`. Rows the checkout created
+    have no owner until backfill_transaction_owner has run, so until
+    PAYMENTS_TRANSACTION_OWNER_BACKFILLED is set those are matched through
+    the user's wallet and orders, as before the owner column.
+    """
+    if getattr(settings, "PAYMENTS_TRANSACTION_OWNER_BACKFILLED", False):
+        return Q(owner=user)
+    wallets = Wallet.objects.filter(user=user).values("pk")
+    orders = Order.objects.filter(
+        transaction__isnull=False, shopper=user).values("transaction_id")
+    return Q(owner=user) | Q(owner__isnull=True) & (
+        Q(id__in=orders) | Q(credit_to__in=wallets) | Q(debit_to__in=wallets))
+
+
+_fields = None
+
+
+def _readable_fields():
+    """
+    (name, source, to_representation) for every field TransactionSerializer
+    outputs, in its order. Built once from the serializer itself so the fast
+    path can't drift from it.
+    """
+    global _fields
+    if _fields is None:
+        fields = []
+        for name, field in TransactionSerializer().fields.items():
+            if field.write_only:
+                continue
+            # The annotation and FK ids come out of values() in final form
+            if name == "transaction_type":
+                fields.append((name, name, None))
+            elif isinstance(field, RelatedField):
+                fields.append((name, field.source, None))
+            else:
+                fields.append((name, field.source, field.to_representation))
+        _fields = fields
+    return _fields
+
+
+def field_names():
+    return [name for name, _, _ in _readable_fields()]
+
+
+def transaction_values(queryset):
+    """Only the columns the listing outputs, as dicts, with transaction_type annotated."""
+    sources = [source for name, source, _ in _readable_fields()
+               if name != "transaction_type"]
+    return queryset.values(*sources, transaction_type=TRANSACTION_TYPE)
+
+
+def to_representation(row):
+    data = {}
+    for name, source, represent in _readable_fields():
+        value = row[source]
+        # Same None handling as Serializer.to_representation
+        data[name] = value if value is None or represent is None else represent(value)
+    return data
+
+
+@timed("serialize_transaction_rows")
+def represent(rows):
+    return [to_representation(row) for row in rows]
+
+
+def with_converted(data, currency):
+    """
+    Add `converted_value` in `currency` to represented rows, converting the
+    whole list with one rate lookup per distinct source currency.
+    """
+    converted = rate_table.convert_many(
+        ((row["value"], row["currency"]) for row in data), currency)
+    for row, value in zip(data, converted):
+        row["converted_value"] = None if value is None else str(value)
+        row["converted_currency"] = currency
+    return data
@@ -0,0 +1,151 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.apps import apps
+from django.db import connection
+
+
+class BatchedDatabaseLogHandler(logging.Handler):
+    """
+    Drop-in replacement for a synchronous database log handler, e.g. for the
+    "db" logger:
+
+        "handlers": {
+            "db_log": {
+                "class": "apps.payments.log_handlers.BatchedDatabaseLogHandler",
+                "model": "django_db_logger.StatusLog",
+            },
+        }
+
+    `emit` only formats the record and puts it on a bounded in-memory queue.
+    A background thread writes the queue to `model` with one `bulk_create`
+    per `batch_size` records, or every `flush_interval` seconds, on its own
+    connection, so records also survive the rollback of the request that
+    logged them. When the queue is full `emit` waits at most `put_timeout`
+    seconds and then drops the record, counting it in `stats()`.
+    """
+
+    def __init__(self, model="django_db_logger.StatusLog", capacity=10000, batch_size=200,
+                 flush_interval=1.0, put_timeout=0.0, level=logging.NOTSET):
+        super().__init__(level)
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=capacity)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0}
+        atexit.register(self.close)
+
+    def emit(self, record):
+        try:
+            row = self.to_row(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self._ensure_worker()
+        try:
+            if self.put_timeout:
+                self._queue.put(row, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self._count("dropped")
+        else:
+            self._count("queued")
+
+    def to_row(self, record):
+        """Model field values for a record, same fields as django-db-logger's handler."""
+        # Tracebacks must be rendered now, the frames don't outlive the call
+        formatter = self.formatter or logging.Formatter()
+        trace = formatter.formatException(record.exc_info) if record.exc_info else None
+        msg = self.format(record) if self.formatter else record.getMessage()
+        return {
+            "logger_name": record.name,
+            "level": record.levelno,
+            "msg": msg,
+            "trace": trace,
+        }
+
+    def write(self, rows):
+        model = apps.get_model(self.model)
+        model.objects.bulk_create([model(**row) for row in rows])
+
+    def flush(self, timeout=5):
+        """Wait until the records queued so far are written, or `timeout`."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        if self._thread is not None and self._pid == os.getpid():
+            self.flush()
+        super().close()
+
+    def stats(self):
+        with self._stats_lock:
+            return {**self._stats, "pending": self._queue.qsize()}
+
+    def _ensure_worker(self):
+        # A forked worker inherits the handler but not its thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="db-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        try:
+            connection.close_if_unusable_or_obsolete()
+            self.write(batch)
+        except Exception:
+            # Never log through the handler that just failed. The rows are no
+            # longer records, report the batch as one like emit would.
+            self._count("failed", len(batch))
+            self.handleError(logging.makeLogRecord({
+                "name": __name__, "levelno": logging.ERROR, "levelname": "ERROR",
+                "msg": "%s: dropped %d records", "args": (type(self).__name__, len(batch)),
+            }))
+        else:
+            self._count("written", len(batch))
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+
+def handler_stats(logger_name="db"):
+    """Summed `stats()` of the batched handlers attached to a logger."""
+    totals = {}
+    for handler in logging.getLogger(logger_name).handlers:
+        if isinstance(handler, BatchedDatabaseLogHandler):
+            for key, value in handler.stats().items():
+                totals[key] = totals.get(key, 0) + value
+    return totals
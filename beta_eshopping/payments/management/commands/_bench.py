@@ -0,0 +1,73 @@
+"""Helpers shared by the seed and bench commands."""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import models
+from django.utils import timezone
+
+from apps.payments.models import Wallet
+
+BENCH_BALANCE = Decimal("1000.00")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def build(model, label, **values):
+    """
+    Unsaved `model` instance with `values`, its other required columns filled
+    from `label`. Labels must be unique when the model has unique columns.
+    """
+    for field in model._meta.concrete_fields:
+        if (field.name in values or field.attname in values or field.primary_key
+                or field.null or field.has_default() or field.is_relation
+                or (field.blank and field.empty_strings_allowed)
+                or getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)):
+            continue
+        if isinstance(field, models.EmailField):
+            values[field.name] = f"{label}@bench.invalid"
+        elif isinstance(field, models.CharField):
+            values[field.name] = label[-field.max_length:]
+        elif isinstance(field, models.BooleanField):
+            values[field.name] = False
+        elif isinstance(field, (models.IntegerField, models.DecimalField, models.FloatField)):
+            values[field.name] = 0
+        elif isinstance(field, models.DateTimeField):
+            values[field.name] = timezone.now()
+        elif isinstance(field, models.DateField):
+            values[field.name] = timezone.localdate()
+    return model(**values)
+
+
+def build_user(label):
+    user = build(get_user_model(), label)
+    user.set_unusable_password()
+    return user
+
+
+def bench_wallets(count, prefix="bench", balance=BENCH_BALANCE):
+    """
+    Wallets of `count` users that only benchmarks use, created on the first
+    run and reused after, so real users' balances are never touched. Empty
+    ones are funded with `balance`.
+    """
+    User = get_user_model()
+    wallets = []
+    for i in range(count):
+        user = build_user(f"{prefix}-{i}")
+        name = User.USERNAME_FIELD
+        existing = User.objects.filter(**{name: getattr(user, name)}).first()
+        if existing is None:
+            user.save()
+        else:
+            user = existing
+        # The user's post_save may already have created the wallet
+        wallet, _ = Wallet.objects.select_related("user").get_or_create(user=user)
+        if not wallet.current_balance():
+            wallet.deposit(balance)
+        wallets.append(wallet)
+    return wallets
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.payments.archive import RETENTION_DAYS, archive_transactions
+
+
+class Command(BaseCommand):
+    help = "Move old and soft-deleted transactions to the archive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--limit", type=int, help="Stop after moving this many rows")
+
+    def handle(self, *args, **options):
+        moved = archive_transactions(
+            retention_days=options["retention_days"],
+            batch_size=options["batch_size"],
+            limit=options["limit"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} transactions"))
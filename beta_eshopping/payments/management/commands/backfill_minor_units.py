@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from apps.payments.models import ArchivedTransaction, Transaction, Wallet
+from apps.payments.money import minor_units
+
+# model, minor-unit column, its expression from the decimal column
+TARGETS = [
+    (Wallet, "balance_minor", lambda: minor_units("balance")),
+    (Transaction, "value_minor", lambda: minor_units("value", "currency")),
+    (ArchivedTransaction, "value_minor", lambda: minor_units("value", "currency")),
+]
+
+
+class Command(BaseCommand):
+    help = "Fill the minor-unit money columns from the decimal ones, or --verify they agree"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--verify", action="store_true",
+                            help="Only count rows whose minor units disagree with the decimal")
+
+    def handle(self, *args, **options):
+        for model, column, expression in TARGETS:
+            if options["verify"]:
+                self.verify(model, column, expression())
+            else:
+                self.backfill(model, column, expression(), options["batch_size"])
+
+    def backfill(self, model, column, expression, batch_size):
+        # Rows written since the columns were added are filled on save, so
+        # only the null ones are left. Balances are recomputed in the same
+        # UPDATE that reads them, concurrent deposits just wait on the row.
+        manager = model._base_manager
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(
+                manager.filter(**{f"{column}__isnull": True}, id__gt=last_id)
+                .order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            with transaction.atomic():
+                total += manager.filter(id__in=ids).update(**{column: expression})
+            self.stdout.write(f"{model.__name__}: backfilled up to {last_id}")
+        self.stdout.write(self.style.SUCCESS(f"Updated {total} {model.__name__} rows"))
+
+    def verify(self, model, column, expression):
+        manager = model._base_manager
+        missing = manager.filter(**{f"{column}__isnull": True}).count()
+        mismatched = (
+            manager.filter(**{f"{column}__isnull": False})
+            .alias(expected=expression)
+            .exclude(**{column: F("expected")})
+            .count()
+        )
+        message = f"{model.__name__}: {missing} missing, {mismatched} mismatched"
+        if mismatched:
+            raise CommandError(message)
+        self.stdout.write(message)
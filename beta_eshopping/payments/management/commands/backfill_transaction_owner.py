@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from apps.payments.models import Transaction, Wallet, bump_wallet_versions
+from apps.shopping.models import Order
+
+
+class Command(BaseCommand):
+    help = "Backfill Transaction.owner from the wallet or order each transaction belongs to"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        owner = Coalesce(
+            Subquery(Wallet.objects.filter(
+                pk=OuterRef("credit_to")).values("user")[:1]),
+            Subquery(Wallet.objects.filter(
+                pk=OuterRef("debit_to")).values("user")[:1]),
+            Subquery(Order.objects.filter(
+                transaction=OuterRef("pk")).values("shopper")[:1]),
+        )
+
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(
+                Transaction.objects.filter(owner__isnull=True, id__gt=last_id)
+                .order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            # Short transactions so the backfill can run next to live traffic
+            with transaction.atomic():
+                total += Transaction.objects.filter(id__in=ids).update(owner=owner)
+                bump_wallet_versions(user_ids=Transaction.objects.filter(
+                    id__in=ids).values_list("owner", flat=True).distinct())
+            self.stdout.write(f"Backfilled up to transaction {last_id}")
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {total} transactions"))
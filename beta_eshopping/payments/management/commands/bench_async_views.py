@@ -0,0 +1,73 @@
+import json
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payments.async_views import AsyncTransactionListAPIView, AsyncWalletAPIView
+from apps.payments.benchmarks import SCENARIOS, current_commit, run_asgi_scenario
+from apps.payments.fake_gateway import FakeFlutterwaveGateway
+from apps.payments.gateway import (
+    AsyncFlutterwaveClient, FlutterwaveClient, set_async_gateway_client, set_gateway_client,
+)
+from apps.payments.views import TransactionListAPIView, WalletAPIView
+
+from ._bench import bench_wallets
+
+VIEWS = {
+    "wallet_get": (WalletAPIView, AsyncWalletAPIView),
+    "wallet_post": (WalletAPIView, AsyncWalletAPIView),
+    "transactions_list": (TransactionListAPIView, AsyncTransactionListAPIView),
+    "transactions_page": (TransactionListAPIView, AsyncTransactionListAPIView),
+}
+
+
+class Command(BaseCommand):
+    help = ("Compare how many concurrent requests one ASGI worker sustains with the "
+            "sync and the async wallet and transaction views")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenario", action="append", choices=sorted(VIEWS),
+                            help="Scenario to run, can be repeated (default: all)")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--gateway-latency", type=float, default=0.1)
+        parser.add_argument("--output", help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if options["users"] < 1:
+            raise CommandError("--users must be at least 1")
+        users = [wallet.user for wallet in bench_wallets(options["users"])]
+
+        results = {}
+        with FakeFlutterwaveGateway(latency=options["gateway_latency"]) as gateway:
+            set_gateway_client(FlutterwaveClient(
+                base_url=gateway.url, secret_key="bench", pool_size=options["concurrency"]))
+            set_async_gateway_client(lambda: AsyncFlutterwaveClient(
+                base_url=gateway.url, secret_key="bench", pool_size=options["concurrency"]))
+            try:
+                for name in options["scenario"] or sorted(VIEWS):
+                    sync_view, async_view = VIEWS[name]
+                    result = {}
+                    for mode, view in (("sync", sync_view), ("async", async_view)):
+                        result[mode] = async_to_sync(run_asgi_scenario)(
+                            view.as_view(), SCENARIOS[name], users,
+                            options["concurrency"], options["requests"])
+                    if result["sync"]["throughput_rps"]:
+                        result["async_vs_sync_throughput"] = round(
+                            result["async"]["throughput_rps"] / result["sync"]["throughput_rps"], 2)
+                    results[name] = result
+                    self.stderr.write(f"{name}: {result}")
+            finally:
+                set_gateway_client(None)
+                set_async_gateway_client(None)
+
+        output = json.dumps({
+            "commit": current_commit(),
+            "gateway_latency_s": options["gateway_latency"],
+            "scenarios": results,
+        }, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from rest_framework import serializers
+
+from apps.payments.models import Transaction
+from apps.payments.money import to_minor
+from apps.payments.serializers import MoneyField
+
+
+class Command(BaseCommand):
+    help = "Compare aggregating and serializing Transaction.value with value_minor"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000,
+                            help="Rows summed and serialized in Python")
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        transactions = Transaction.active_objects.filter(value__isnull=False)
+        if transactions.filter(value_minor__isnull=True).exists():
+            raise CommandError("Some transactions have no value_minor, run backfill_minor_units")
+        # Only single-currency rows can be compared as one sum
+        transactions = transactions.filter(currency="USD")
+        rows = transactions.order_by("id")[:options["rows"]]
+
+        decimals = list(rows.values_list("value", flat=True))
+        minors = list(rows.values_list("value_minor", flat=True))
+        if to_minor(sum(decimals)) != sum(minors):
+            raise CommandError("value and value_minor disagree, run backfill_minor_units --verify")
+        decimal_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+        money_field = MoneyField()
+        if [decimal_field.to_representation(v) for v in decimals] != \
+                [money_field.to_representation(v) for v in minors]:
+            raise CommandError("MoneyField output differs from DecimalField")
+
+        cases = [
+            ("db sum", "decimal", lambda: transactions.aggregate(total=Sum("value"))),
+            ("db sum", "minor", lambda: transactions.aggregate(total=Sum("value_minor"))),
+            # Fetching is included, that's where the driver builds Decimals
+            ("fetch + sum", "decimal", lambda: sum(rows.values_list("value", flat=True))),
+            ("fetch + sum", "minor", lambda: sum(rows.values_list("value_minor", flat=True))),
+            ("serialize", "decimal",
+             lambda: [decimal_field.to_representation(v) for v in decimals]),
+            ("serialize", "minor",
+             lambda: [money_field.to_representation(v) for v in minors]),
+        ]
+        count = len(decimals)
+        for name, column, func in cases:
+            best = min(self._time(func) for _ in range(options["repeat"]))
+            self.stdout.write(f"{name} ({column}): {best * 1000:.1f}ms"
+                              + ("" if name == "db sum" else f" for {count} rows"))
+
+    def _time(self, func):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
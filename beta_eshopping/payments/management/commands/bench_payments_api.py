@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payments.benchmarks import SCENARIOS, compare, current_commit, run_scenario
+from apps.payments.fake_gateway import FakeFlutterwaveGateway
+from apps.payments.gateway import FlutterwaveClient, set_gateway_client
+
+from ._bench import bench_wallets
+
+
+class Command(BaseCommand):
+    help = "Load-test the payments API against a local Flutterwave stand-in"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                            help="Scenario to run, can be repeated (default: all)")
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--users", type=int, default=100,
+                            help="Number of benchmark users to spread requests over, "
+                                 "created on the first run")
+        parser.add_argument("--gateway-latency", type=float, default=0.1)
+        parser.add_argument("--output", help="Write the JSON report to this file")
+        parser.add_argument("--baseline", help="JSON report of a previous run to compare with")
+
+    def handle(self, *args, **options):
+        if options["users"] < 1:
+            raise CommandError("--users must be at least 1")
+        users = [wallet.user for wallet in bench_wallets(options["users"])]
+
+        results = {}
+        with FakeFlutterwaveGateway(latency=options["gateway_latency"]) as gateway:
+            set_gateway_client(FlutterwaveClient(
+                base_url=gateway.url, secret_key="bench", pool_size=options["concurrency"]))
+            try:
+                for name in options["scenario"] or sorted(SCENARIOS):
+                    results[name] = run_scenario(
+                        SCENARIOS[name], users, options["concurrency"], options["requests"])
+                    self.stderr.write(f"{name}: {results[name]}")
+            finally:
+                set_gateway_client(None)
+
+        report = {
+            "commit": current_commit(),
+            "gateway_latency_s": options["gateway_latency"],
+            "scenarios": results,
+        }
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+            report["change_pct"] = compare(results, baseline.get("scenarios", {}))
+            report["baseline_commit"] = baseline.get("commit")
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
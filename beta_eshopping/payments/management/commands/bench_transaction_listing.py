@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from apps.payments.listing import represent, transaction_values
+from apps.payments.models import Transaction
+from apps.payments.serializers import TransactionSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare TransactionSerializer with the fast listing path on existing transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        queryset = Transaction.active_objects.order_by("-created_at", "-id")[:options["rows"]]
+        renderer = JSONRenderer()
+
+        def serializer_path():
+            return renderer.render(TransactionSerializer(queryset, many=True).data)
+
+        def fast_path():
+            return renderer.render(represent(transaction_values(queryset)))
+
+        expected, actual = serializer_path(), fast_path()
+        if expected != actual:
+            raise CommandError("Fast path output differs from TransactionSerializer")
+
+        rows = len(queryset)
+        for name, func in (("serializer", serializer_path), ("fast path", fast_path)):
+            best = min(self._time(func) for _ in range(options["repeat"]))
+            self.stdout.write(
+                f"{name}: {rows} rows in {best:.3f}s ({rows / best:,.0f} rows/s)")
+
+    def _time(self, func):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
@@ -0,0 +1,54 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.payments.references import generate_reference
+
+
+def _generate(args):
+    prefix, count = args
+    start = time.perf_counter()
+    references = [generate_reference(prefix) for _ in range(count)]
+    return references, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = "Generate transaction references from many processes and check they are unique"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=8)
+        parser.add_argument("--per-process", type=int, default=250000)
+        parser.add_argument("--prefix", default="BESW")
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        per_process = options["per_process"]
+
+        # fork so the children inherit the configured Django settings
+        context = multiprocessing.get_context("fork")
+        start = time.perf_counter()
+        with context.Pool(processes) as pool:
+            results = pool.map(
+                _generate, [(options["prefix"], per_process)] * processes)
+        elapsed = time.perf_counter() - start
+
+        seen = set()
+        duplicates = 0
+        for references, _ in results:
+            for reference in references:
+                if reference in seen:
+                    duplicates += 1
+                seen.add(reference)
+            if references != sorted(references):
+                self.stderr.write("References from one process are not sorted")
+
+        total = processes * per_process
+        per_process_rate = sum(per_process / took for _, took in results) / processes
+        self.stdout.write(
+            f"Generated {total} references in {elapsed:.2f}s across {processes} processes\n"
+            f"Average {per_process_rate:,.0f} references/s per process\n"
+            f"Duplicates: {duplicates}"
+        )
+        if duplicates:
+            self.stderr.write(self.style.ERROR("Duplicate references generated"))
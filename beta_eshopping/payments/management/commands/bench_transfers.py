@@ -0,0 +1,94 @@
+import json
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from apps.payments.benchmarks import current_commit
+from apps.payments.exceptions import InsufficientFunds
+from apps.payments.transfers import Transfer, execute_transfers
+
+from ._bench import bench_wallets, percentile
+
+
+class Command(BaseCommand):
+    help = "Measure transfer throughput of execute_transfers between benchmark wallets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--transfers", type=int, default=100000)
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Transfers per DB transaction")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--wallets", type=int, default=1000,
+                            help="Number of benchmark wallets to move funds between, "
+                                 "created on the first run")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if options["wallets"] < 2:
+            raise CommandError("--wallets must be at least 2")
+        wallet_ids = [wallet.pk for wallet in
+                      bench_wallets(options["wallets"], prefix="bench-transfers")]
+
+        batch_size = options["batch_size"]
+        batches = -(-options["transfers"] // batch_size)
+        next_batch = iter(range(batches))
+        lock = threading.Lock()
+        latencies, counts = [], {"transfers": 0, "rejected": 0, "errors": 0}
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                while True:
+                    with lock:
+                        if next(next_batch, None) is None:
+                            return
+                    batch = []
+                    for _ in range(batch_size):
+                        debit, credit = rng.sample(wallet_ids, 2)
+                        batch.append(Transfer(debit, credit, Decimal("0.01"), None))
+                    start = time.perf_counter()
+                    try:
+                        execute_transfers(batch)
+                        key = "transfers"
+                    except InsufficientFunds:
+                        key = "rejected"
+                    except OperationalError:
+                        key = "errors"
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        counts[key] += len(batch) if key == "transfers" else 1
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(options["seed"] + i,))
+                   for i in range(options["concurrency"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        report = {
+            "commit": current_commit(),
+            "wallets": len(wallet_ids),
+            "batch_size": batch_size,
+            "concurrency": options["concurrency"],
+            **counts,
+            "elapsed_s": round(elapsed, 3),
+            "transfers_per_s": round(counts["transfers"] / elapsed, 1) if elapsed else 0,
+            "batch_latency_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "batch_latency_p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "batch_latency_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
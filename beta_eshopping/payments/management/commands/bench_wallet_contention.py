@@ -0,0 +1,153 @@
+import json
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from rest_framework import status
+
+from apps.payments import rollups
+from apps.payments.benchmarks import current_commit
+from apps.payments.exceptions import InsufficientFunds
+from apps.payments.models import Transaction, TransactionStatus, Wallet
+from apps.payments.striping import restripe
+from apps.payments.utils import generate_transaction_reference, process_successful_transaction
+from apps.payments.views import fund_wallet
+
+from ._bench import bench_wallets, percentile
+
+
+class Command(BaseCommand):
+    help = ("Measure funding/payment throughput on one hot wallet, unstriped and striped. "
+            "Each operation records a transaction like the API does")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operations", type=int, default=5000)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--stripes", type=int, action="append",
+                            help="Stripe counts to compare, default 0 and 16. Can be repeated")
+        parser.add_argument("--withdraw-ratio", type=float, default=0.1)
+        parser.add_argument("--unsharded-rollups", action="store_true",
+                            help="Also run every striped count with one rollup row per "
+                                 "month, to measure what sharding the rollups gains")
+        parser.add_argument("--wallet", type=int,
+                            help="Wallet to run against, its balance and transactions "
+                                 "change. A new one is created by default")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if connections["default"].vendor == "sqlite":
+            raise CommandError("sqlite serializes all writers, run this against PostgreSQL")
+        if options["wallet"]:
+            wallet = Wallet.objects.get(pk=options["wallet"])
+        else:
+            # A wallet of its own, so real balances are left alone
+            wallet, = bench_wallets(1, prefix="bench-contention")
+        stripe_count = wallet.stripe_count
+        runs = [(stripes, True) for stripes in options["stripes"] or [0, 16]]
+        if options["unsharded_rollups"]:
+            runs += [(stripes, False) for stripes, _ in runs if stripes]
+        sharded = rollups.SHARD_STRIPED_ROLLUPS
+        try:
+            report = {
+                "commit": current_commit(),
+                "wallet": wallet.pk,
+                "concurrency": options["concurrency"],
+                "runs": [self.run(wallet, stripes, shard_rollups, options)
+                         for stripes, shard_rollups in runs],
+            }
+        finally:
+            rollups.SHARD_STRIPED_ROLLUPS = sharded
+            restripe(wallet.pk, stripe_count)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def run(self, wallet, stripes, shard_rollups, options):
+        rollups.SHARD_STRIPED_ROLLUPS = shard_rollups
+        restripe(wallet.pk, stripes)
+        before = Wallet.objects.get(pk=wallet.pk).current_balance()
+        remaining = iter(range(options["operations"]))
+        lock = threading.Lock()
+        latencies = []
+        moved = {"deposits": 0, "withdrawals": 0, "rejected": 0, "failed": 0, "net": 0}
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                hot = Wallet.objects.get(pk=wallet.pk)
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                    cents = rng.randint(1, 500)
+                    withdraw = rng.random() < options["withdraw_ratio"]
+                    start = time.perf_counter()
+                    try:
+                        if withdraw:
+                            pay(hot, Decimal(cents) / 100)
+                            key = "withdrawals"
+                        else:
+                            key = "deposits" if fund(hot, Decimal(cents) / 100) else "failed"
+                    except InsufficientFunds:
+                        key = "rejected"
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        moved[key] += 1
+                        if key in ("deposits", "withdrawals"):
+                            moved["net"] += -cents if withdraw else cents
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(options["seed"] + i,))
+                   for i in range(options["concurrency"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        after = Wallet.objects.get(pk=wallet.pk).current_balance()
+        expected = before + Decimal(moved.pop("net")) / 100
+        if after != expected:
+            raise CommandError(f"Balance drifted with {stripes} stripes: "
+                               f"{after} instead of {expected}")
+        return {
+            "stripes": stripes,
+            "sharded_rollups": bool(stripes) and shard_rollups,
+            **moved,
+            "elapsed_s": round(elapsed, 3),
+            "operations_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0,
+            "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "latency_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+
+
+def fund(wallet, amount):
+    """A verified wallet funding through the view's write path, False if it failed."""
+    reference = generate_transaction_reference("FLW-BENCH")
+    payment_verify = {"data": {
+        "id": reference, "tx_ref": reference, "amount": str(amount), "currency": "USD",
+        "payment_type": "bench", "status": "successful",
+    }}
+    response = fund_wallet(wallet, {"dollar_value": str(amount)}, payment_verify)
+    return response.status_code == status.HTTP_201_CREATED
+
+
+def pay(wallet, amount):
+    """A wallet payment, recorded and settled like an admin or order debit."""
+    with transaction.atomic():
+        txn = Transaction.objects.create(
+            value=amount, status=TransactionStatus.SUCCESSFUL, debit_to=wallet,
+            owner_id=wallet.user_id, description="Wallet contention benchmark",
+            reference=generate_transaction_reference("BESW-BENCH"))
+        process_successful_transaction(None, wallet, amount, related_transaction=txn)
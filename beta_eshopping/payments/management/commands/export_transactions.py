@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payments.exports import CONTENT_TYPES, export_rows, export_stream, parse_export_date
+
+
+class Command(BaseCommand):
+    help = "Stream transactions to a CSV or NDJSON file in constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", dest="export_format", choices=sorted(CONTENT_TYPES),
+                            default="csv")
+        parser.add_argument("--output", help="File to write, defaults to stdout")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--start", help="Created on or after (ISO date/datetime)")
+        parser.add_argument("--end", help="Created before (ISO date/datetime)")
+        parser.add_argument("--wallet", type=int, action="append",
+                            help="Only transactions crediting or debiting this wallet id")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = export_rows(
+            wallet_ids=options["wallet"],
+            start=self._parse(options["start"]),
+            end=self._parse(options["end"]),
+            chunk_size=options["chunk_size"],
+        )
+        chunks = export_stream(options["export_format"], rows, options["gzip"])
+
+        out = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if options["output"]:
+                out.close()
+
+    def _parse(self, value):
+        try:
+            return parse_export_date(value)
+        except ValueError:
+            raise CommandError(f"Invalid date: {value}")
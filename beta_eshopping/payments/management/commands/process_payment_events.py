@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.payments.events import process_events
+
+
+class Command(BaseCommand):
+    help = "Apply queued payment provider webhook events"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--once", action="store_true",
+                            help="Process a single batch and exit")
+        parser.add_argument("--idle-sleep", type=float, default=1.0,
+                            help="Seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_events(options["batch_size"])
+            if processed:
+                self.stdout.write(f"Processed {processed} events")
+            if options["once"]:
+                break
+            if processed < options["batch_size"]:
+                time.sleep(options["idle_sleep"])
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.payments.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the per-wallet monthly rollups from raw transactions. Run it "
+            "after bulk loads that bypass Transaction.save, e.g. seed_payments_data")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500,
+                            help="Wallets rebuilt per DB transaction")
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Chunks rebuilt in parallel")
+        parser.add_argument("--wallet", type=int, action="append",
+                            help="Only rebuild this wallet, can be repeated")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rebuilt = rebuild_rollups(chunk_size=options["chunk_size"],
+                                  workers=options["workers"],
+                                  wallet_ids=options["wallet"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rollups of {rebuilt} wallets in {time.perf_counter() - start:.1f}s"))
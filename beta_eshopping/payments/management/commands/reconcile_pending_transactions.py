@@ -0,0 +1,66 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.payments.fake_gateway import FakeFlutterwaveGateway
+from apps.payments.gateway import FlutterwaveClient
+from apps.payments.models import Transaction, TransactionStatus
+from apps.payments.reconciliation import reconcile_stale_pending
+from apps.payments.references import generate_reference
+
+
+class Command(BaseCommand):
+    help = "Re-verify stale pending transactions against the payment gateway"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-minutes", type=int, default=30)
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--limit", type=int)
+        parser.add_argument("--fake-gateway", action="store_true",
+                            help="Verify against a local fake gateway instead of Flutterwave")
+        parser.add_argument("--fake-latency", type=float, default=0.05,
+                            help="Seconds of latency added by the fake gateway")
+        parser.add_argument("--seed-pending", type=int, default=0,
+                            help="Create this many stale pending rows first (fake gateway only)")
+
+    def handle(self, *args, **options):
+        if options["seed_pending"] and not options["fake_gateway"]:
+            raise CommandError("--seed-pending can only be used with --fake-gateway")
+
+        older_than = timedelta(minutes=options["older_than_minutes"])
+        kwargs = {
+            "workers": options["workers"],
+            "batch_size": options["batch_size"],
+            "limit": options["limit"],
+        }
+
+        if not options["fake_gateway"]:
+            stats = reconcile_stale_pending(older_than, **kwargs)
+        else:
+            with FakeFlutterwaveGateway(latency=options["fake_latency"]) as gateway:
+                if options["seed_pending"]:
+                    self._seed(options["seed_pending"], older_than)
+                client = FlutterwaveClient(
+                    base_url=gateway.url, secret_key="fake", pool_size=options["workers"])
+                stats = reconcile_stale_pending(older_than, client=client, **kwargs)
+
+        self.stdout.write(json.dumps(stats.summary()))
+
+    def _seed(self, count, older_than):
+        created_at = timezone.now() - older_than - timedelta(minutes=1)
+        batch = []
+        for i in range(count):
+            reference = generate_reference("SEED")
+            batch.append(Transaction(
+                value=10, status=TransactionStatus.PENDING, reference=reference,
+                payment_provider_txn_id=reference, description="Reconciliation load test",
+            ))
+            if len(batch) == 5000 or i == count - 1:
+                Transaction.objects.bulk_create(batch)
+                # created_at is auto_now_add, so backdate the rows afterwards
+                Transaction.objects.filter(
+                    reference__in=[txn.reference for txn in batch]).update(created_at=created_at)
+                batch = []
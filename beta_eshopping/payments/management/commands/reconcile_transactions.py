@@ -0,0 +1,41 @@
+import csv
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payments.reconciliation import settle_transactions
+
+
+class Command(BaseCommand):
+    help = "Mark the pending transactions listed in a CSV of references as successful"
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_file", help="CSV with a `reference` column")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--updated-by", help="Email of the user recorded as updated_by")
+
+    def handle(self, *args, **options):
+        updated_by = None
+        if options["updated_by"]:
+            updated_by = get_user_model().objects.get(email=options["updated_by"])
+
+        with open(options["csv_file"], newline="") as f:
+            reader = csv.DictReader(f)
+            if "reference" not in (reader.fieldnames or []):
+                raise CommandError("CSV file must have a `reference` column")
+            references = [row["reference"].strip() for row in reader if row["reference"]]
+
+        settled = failed = 0
+        batch_size = options["batch_size"]
+        for i in range(0, len(references), batch_size):
+            outcomes = settle_transactions(
+                references=references[i:i + batch_size], updated_by=updated_by)
+            for outcome in outcomes:
+                if outcome.ok:
+                    settled += 1
+                else:
+                    failed += 1
+                self.stdout.write(
+                    f"{outcome.reference},{'ok' if outcome.ok else 'failed'},{outcome.message}")
+
+        self.stdout.write(self.style.SUCCESS(f"{settled} settled, {failed} failed"))
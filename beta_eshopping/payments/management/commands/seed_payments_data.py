@@ -0,0 +1,87 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.payments.models import Transaction, TransactionStatus, Wallet, bump_wallet_versions
+from apps.payments.references import generate_reference
+from apps.shopping.models import Order
+
+from ._bench import build, build_user
+
+STATUS_WEIGHTS = (
+    (TransactionStatus.SUCCESSFUL, 85),
+    (TransactionStatus.FAILED, 10),
+    (TransactionStatus.PENDING, 5),
+)
+
+
+class Command(BaseCommand):
+    help = "Seed users, wallets, orders and transactions for load tests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--transactions", type=int, default=1000000)
+        parser.add_argument("--order-ratio", type=float, default=0.3,
+                            help="Share of transactions that pay for an order")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        statuses, weights = zip(*STATUS_WEIGHTS)
+
+        # Labels only need to be unique across runs
+        stamp = time.time_ns()
+        with transaction.atomic():
+            users = [build_user(f"seed-{stamp}-{i}") for i in range(options["users"])]
+            users = get_user_model().objects.bulk_create(users, batch_size=batch_size)
+            cents = [rng.randint(0, 100000) for _ in users]
+            wallets = Wallet.objects.bulk_create(
+                [Wallet(user=user, balance=Decimal(minor) / 100, balance_minor=minor)
+                 for user, minor in zip(users, cents)],
+                batch_size=batch_size,
+            )
+        self.stdout.write(f"Created {len(users)} users and wallets")
+
+        remaining = options["transactions"]
+        while remaining:
+            size = min(batch_size, remaining)
+            remaining -= size
+            txns, order_owners = [], []
+            for _ in range(size):
+                wallet = rng.choice(wallets)
+                status = rng.choices(statuses, weights)[0]
+                minor = rng.randint(100, 50000)
+                value = Decimal(minor) / 100
+                is_order = rng.random() < options["order_ratio"]
+                txns.append(Transaction(
+                    value=value,
+                    value_minor=minor,
+                    status=status,
+                    reference=generate_reference("BES" if is_order else "BESW"),
+                    payment_provider_txn_id=generate_reference("FLW"),
+                    credit_to=None if is_order else wallet,
+                    owner_id=wallet.user_id,
+                    currency="USD",
+                    payment_type="card(USD)",
+                    reason_for_failure="Declined" if status == TransactionStatus.FAILED else None,
+                    description=(f"Payment for order #{rng.randint(1, 10 ** 6)}"
+                                 if is_order else f"Funded wallet with {value}"),
+                ))
+                order_owners.append(wallet.user if is_order else None)
+
+            with transaction.atomic():
+                txns = Transaction.objects.bulk_create(txns)
+                orders = [
+                    build(Order, f"seed-{txn.reference}", shopper=owner, transaction=txn)
+                    for txn, owner in zip(txns, order_owners) if owner
+                ]
+                Order.objects.bulk_create(orders)
+                # bulk_create bypasses Transaction.save
+                bump_wallet_versions(user_ids=[txn.owner_id for txn in txns])
+            self.stdout.write(f"{options['transactions'] - remaining} transactions created")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.payments.ledger import open_balances, take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Snapshot wallet balances from the ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--opening-balances", action="store_true",
+                            help="First write opening entries for wallets without ledger history")
+
+    def handle(self, *args, **options):
+        if options["opening_balances"]:
+            opened = open_balances(options["batch_size"])
+            self.stdout.write(f"Opened {opened} wallets")
+
+        created = take_snapshots(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} snapshots"))
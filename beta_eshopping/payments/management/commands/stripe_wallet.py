@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payments.models import Wallet
+from apps.payments.striping import restripe
+
+
+class Command(BaseCommand):
+    help = "Split a hot wallet's balance across stripes, or fold it back with --stripes 0"
+
+    def add_arguments(self, parser):
+        parser.add_argument("wallet", type=int, help="Wallet id")
+        parser.add_argument("--stripes", type=int, default=16)
+
+    def handle(self, *args, **options):
+        if not 0 <= options["stripes"] <= 256:
+            raise CommandError("--stripes must be between 0 and 256")
+        try:
+            wallet = restripe(options["wallet"], options["stripes"])
+        except Wallet.DoesNotExist:
+            raise CommandError(f"Wallet {options['wallet']} does not exist")
+        self.stdout.write(self.style.SUCCESS(
+            f"Wallet {wallet.pk} has {wallet.stripe_count} stripes, "
+            f"balance {wallet.current_balance()}"))
@@ -0,0 +1,36 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payments.models import ExchangeRate
+from apps.payments.rates import rate_table
+from apps.shopping.utitlities import get_current_dollar_rate
+
+
+class Command(BaseCommand):
+    help = "Store exchange rates used by the currency conversion of wallet and transaction views"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rate", action="append", default=[], metavar="BASE/QUOTE=RATE",
+                            help="Set a rate, e.g. USD/EUR=0.92. Can be repeated")
+        parser.add_argument("--skip-dollar-rate", action="store_true",
+                            help="Don't refresh USD/NGN from the dollar rate API")
+
+    def handle(self, *args, **options):
+        rates = {}
+        for value in options["rate"]:
+            try:
+                pair, rate = value.split("=")
+                base, quote = pair.upper().split("/")
+                rates[(base, quote)] = (Decimal(rate), "manual")
+            except (ValueError, InvalidOperation):
+                raise CommandError(f"Invalid rate {value!r}, expected BASE/QUOTE=RATE")
+        if not options["skip_dollar_rate"]:
+            rates[("USD", "NGN")] = (Decimal(str(get_current_dollar_rate())), "dollar_rate_api")
+
+        for (base, quote), (rate, source) in rates.items():
+            ExchangeRate.objects.update_or_create(
+                base=base, quote=quote, defaults={"rate": rate, "source": source})
+            self.stdout.write(f"{base}/{quote} = {rate}")
+        # Only clears this process, others pick the new rates up within the TTL
+        rate_table.clear()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payments.ledger import mismatched_wallets
+
+
+class Command(BaseCommand):
+    help = "Compare Wallet.balance with the ledger for every wallet"
+
+    def handle(self, *args, **options):
+        mismatches = 0
+        for wallet in mismatched_wallets().iterator(chunk_size=1000):
+            mismatches += 1
+            self.stdout.write(
+                f"Wallet {wallet.pk}: balance {wallet.balance}, ledger {wallet.ledger_balance}")
+
+        if mismatches:
+            raise CommandError(f"{mismatches} wallets do not match the ledger")
+        self.stdout.write(self.style.SUCCESS("All wallets match the ledger"))
@@ -1,8 +1,19 @@
-from django.db import models
+import uuid
+from decimal import ROUND_HALF_UP, Decimal
+from django.db import models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from betaeshopping.soft_deletion_model import SoftDeletionModel
 from django.db.models import TextChoices
 from .exceptions import InsufficientFunds
+from .instrumentation import timed
+from .money import WALLET_CURRENCY, MinorUnitField, Money, to_minor
+
+# Counter account for money entering or leaving the platform's wallets
+LEDGER_EXTERNAL_ACCOUNT = "external"
 
 
 class Wallet(SoftDeletionModel):
@@ -11,21 +22,172 @@ class Wallet(SoftDeletionModel):
     balance = models.DecimalField(verbose_name="Balance", max_digits=10,
                                   decimal_places=2, blank=True, null=True,
                                   default=0.00)
+    # Integer cents, written alongside `balance`. Null until
+    # backfill_minor_units has run for the row.
+    balance_minor = MinorUnitField("Balance (minor units)", blank=True, null=True)
+    # Bumped whenever the balance or the wallet's transactions change, the
+    # wallet and transaction list ETags are derived from it
+    version = models.PositiveBigIntegerField("Version", default=0)
+    # Opt-in for hot wallets, see striping.py. Credits to a striped wallet
+    # land on one of its WalletStripe rows, `balance` only holds the rest.
+    stripe_count = models.PositiveSmallIntegerField("Stripes", default=0)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "balance" in update_fields:
+            self.sync_balance_minor()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "balance_minor"}
+        if not self._state.adding:
+            self.version = F("version") + 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        super().save(*args, **kwargs)
+        if not isinstance(self.version, int):
+            self.refresh_from_db(fields=["version"])
+
+    def sync_balance_minor(self):
+        """Set `balance_minor` from `balance`, for writes that bypass `save`."""
+        # Rounded like `value_minor`, a sub-cent balance must not fail saves
+        self.balance_minor = to_minor(self.balance or 0, WALLET_CURRENCY, rounding=ROUND_HALF_UP)
+
+    def current_balance(self):
+        """`balance`, plus the stripes of a striped wallet read in the same query."""
+        if not self.stripe_count:
+            return self.balance
+        from .striping import stripe_balance
+        return Wallet.objects.filter(pk=self.pk).annotate(
+            total=Coalesce(F("balance"), Value(Decimal("0.00"))) + stripe_balance()
+        ).values_list("total", flat=True).get()
+
+    @timed("wallet_deposit")
+    def deposit(self, amount, lock=False, related_transaction=None):
+        """
+        Credit the wallet with a single `UPDATE ... SET balance = balance + x`.
+        Pass lock=True to read and write the row under `select_for_update`.
+        Striped wallets ignore it, a credit only ever locks one stripe.
+        `amount` is a `Money` or a decimal amount in dollars.
+        """
+        money = Money.of(amount, WALLET_CURRENCY)
+        amount = money.amount
+        with transaction.atomic():
+            if self.stripe_count:
+                from .striping import credit_stripe
+                credit_stripe(self, money)
+                self._record_ledger(amount, related_transaction, balance_known=False)
+                return
+            elif lock:
+                self._locked_update(amount)
+            else:
+                # balance_minor stays null until the row is backfilled
+                Wallet.objects.filter(pk=self.pk).update(
+                    balance=Coalesce(F("balance"), Value(Decimal("0.00"))) + amount,
+                    balance_minor=F("balance_minor") + money.minor,
+                    version=F("version") + 1,
+                    updated_at=timezone.now(),
+                )
+                self.refresh_from_db(fields=WALLET_REFRESH_FIELDS)
+            self._record_ledger(amount, related_transaction)
 
-    def deposit(self, amount):
-        self.balance += amount
-        self.save()
+    @timed("wallet_withdraw")
+    def withdraw(self, amount, lock=False, related_transaction=None):
+        """
+        Debit the wallet with a conditional `UPDATE ... WHERE balance >= x`,
+        so concurrent withdrawals can never take the balance below zero.
+        Striped wallets ignore `lock`, only a debit no stripe covers locks the row.
+        """
+        money = Money.of(amount, WALLET_CURRENCY)
+        amount = money.amount
+        with transaction.atomic():
+            if self.stripe_count:
+                from .striping import debit_stripes
+                consolidated = debit_stripes(self, money)
+                self._record_ledger(-amount, related_transaction, balance_known=consolidated)
+                return
+            elif lock:
+                self._locked_update(-amount)
+            else:
+                updated = Wallet.objects.filter(pk=self.pk, balance__gte=amount).update(
+                    balance=F("balance") - amount,
+                    balance_minor=F("balance_minor") - money.minor,
+                    version=F("version") + 1,
+                    updated_at=timezone.now(),
+                )
+                if not updated:
+                    raise InsufficientFunds()
+                self.refresh_from_db(fields=WALLET_REFRESH_FIELDS)
+            self._record_ledger(-amount, related_transaction)
 
-    def withdraw(self, amount):
-        if amount > self.balance:
+    def _locked_update(self, delta):
+        wallet = Wallet.objects.select_for_update(no_key=True).get(pk=self.pk)
+        if wallet.stripe_count:
+            from .striping import fold_stripes
+            fold_stripes([wallet])
+        balance = wallet.balance or Decimal("0.00")
+        if balance + delta < 0:
             raise InsufficientFunds()
-        self.balance -= amount
-        self.save()
+        wallet.balance = balance + delta
+        wallet.save(update_fields=["balance", "updated_at"])
+        self.balance = wallet.balance
+        self.balance_minor = wallet.balance_minor
+        self.version = wallet.version
+        self.updated_at = wallet.updated_at
+
+    def _record_ledger(self, amount, related_transaction=None,
+                       counter_account=None, balance_known=True):
+        # The wallet row is still locked by the balance update, so
+        # balance_after is consistent with the order entries are written in.
+        # Moves on a single stripe don't know the wallet's balance.
+        balance_after = self.balance if balance_known else None
+        group = uuid.uuid4()
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(group=group, account=f"wallet:{self.pk}", wallet=self,
+                        amount=amount, balance_after=balance_after,
+                        transaction=related_transaction),
+            LedgerEntry(group=group, account=counter_account or LEDGER_EXTERNAL_ACCOUNT,
+                        amount=-amount, transaction=related_transaction),
+        ])
 
     def __str__(self):
         return f"{self.user.email}'s Wallet"
 
 
+class WalletStripe(models.Model):
+    """
+    A slice of a striped wallet's balance. The wallet's balance is its own
+    `balance` plus the sum of its stripes, and its ETag version likewise.
+    """
+    wallet = models.ForeignKey(Wallet, related_name="stripes", on_delete=models.CASCADE)
+    index = models.PositiveSmallIntegerField("Index")
+    balance = models.DecimalField("Balance", max_digits=12, decimal_places=2, default=0)
+    balance_minor = MinorUnitField("Balance (minor units)", default=0)
+    version = models.PositiveBigIntegerField("Version", default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["wallet", "index"], name="payments_stripe_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet_id}/{self.index} {self.balance}"
+
+
+WALLET_REFRESH_FIELDS = ["balance", "balance_minor", "version", "updated_at"]
+
+
+def bump_wallet_versions(wallet_ids=(), user_ids=()):
+    """Invalidate the ETags of the given wallets and of the given users' wallets."""
+    wallet_ids = {pk for pk in wallet_ids if pk}
+    user_ids = {pk for pk in user_ids if pk}
+    if wallet_ids or user_ids:
+        wallets = Wallet.objects.filter(Q(pk__in=wallet_ids) | Q(user_id__in=user_ids))
+        wallets.filter(stripe_count=0).update(version=F("version") + 1)
+        # Striped wallets take the bump on a stripe, their row stays unlocked
+        from .striping import bump_stripe_versions
+        bump_stripe_versions(wallets)
+
+
 class TransactionStatus(TextChoices):
     PENDING = 'pending', 'Pending'
     SUCCESSFUL = 'successful', 'Successful'
@@ -35,6 +197,8 @@ class TransactionStatus(TextChoices):
 class Transaction(SoftDeletionModel):
     value = models.DecimalField(verbose_name="Transaction Value",
                                 max_digits=10, decimal_places=2, blank=True, null=True)
+    # `value` in minor units of `currency`, set on every save
+    value_minor = MinorUnitField("Value (minor units)", blank=True, null=True)
     status = models.CharField(verbose_name="Status", max_length=100,
                               choices=TransactionStatus.choices)
     reference = models.CharField(
@@ -57,6 +221,270 @@ class Transaction(SoftDeletionModel):
         "Payment Type", max_length=100, blank=True, null=True)
 
     description = models.CharField("Description", max_length=100)
+    # Denormalized from the wallet or order the transaction belongs to so the
+    # user's history can be read from a single index.
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, verbose_name="Owner", related_name="transactions",
+        on_delete=models.SET_NULL, blank=True, null=True
+    )
+
+    class Meta:
+        # Partial indexes: soft-deleted rows never reach the hot queries
+        indexes = [
+            models.Index(fields=["owner", "-created_at"], name="payments_txn_owner_idx",
+                         condition=Q(deleted_at__isnull=True)),
+            models.Index(fields=["status", "created_at"], name="payments_txn_status_idx",
+                         condition=Q(deleted_at__isnull=True)),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Loaded values of the rollup columns, diffed against on save
+        if all(name in instance.__dict__ for name in ROLLUP_FIELDS):
+            instance._rollup_values = instance.rollup_values()
+        return instance
+
+    @property
+    def money(self):
+        if self.value is None:
+            return None
+        return Money(self._to_minor(), self.currency)
+
+    def sync_value_minor(self):
+        """Set `value_minor` from `value`, for writes that bypass `save`."""
+        self.value_minor = None if self.value is None else self._to_minor()
+
+    def _to_minor(self):
+        # `value` has two places whatever the currency, a zero-exponent
+        # currency can hold cents it has no unit for. Rounded half up, like
+        # `minor_units` in the backfill.
+        return to_minor(self.value, self.currency, rounding=ROUND_HALF_UP)
+
+    def rollup_values(self):
+        return {name: getattr(self, name) for name in ROLLUP_FIELDS}
+
+    def save(self, *args, **kwargs):
+        from .rollups import apply_rollups, contributions
+
+        with transaction.atomic():
+            previous = getattr(self, "_rollup_values", None)
+            if previous is None and self.pk:
+                previous = Transaction.objects.filter(pk=self.pk).values(*ROLLUP_FIELDS).first()
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None or {"value", "currency"} & set(update_fields):
+                self.sync_value_minor()
+                if update_fields is not None:
+                    kwargs["update_fields"] = {*update_fields, "value_minor"}
+            super().save(*args, **kwargs)
+            current = self.rollup_values()
+            if current != previous:
+                apply_rollups(added=contributions(current),
+                              removed=contributions(previous) if previous else [])
+            # Any column can show up in the listing
+            rows = [current, previous or current]
+            bump_wallet_versions(
+                wallet_ids=[row[name] for row in rows for name in ("credit_to_id", "debit_to_id")],
+                user_ids=[row["owner_id"] for row in rows],
+            )
+            self._rollup_values = current
 
     def __str__(self):
         return self.reference
+
+
+# Transaction columns the wallet rollups are computed from
+ROLLUP_FIELDS = ("credit_to_id", "debit_to_id", "owner_id", "status", "value",
+                 "created_at", "deleted_at")
+
+
+class ArchivedTransaction(models.Model):
+    """
+    Old or soft-deleted transactions moved out of the hot table. Rows keep
+    their id and columns, so listings can union both tables.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    uuid = models.UUIDField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(blank=True, null=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+    value = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    value_minor = MinorUnitField(blank=True, null=True)
+    status = models.CharField(max_length=100, choices=TransactionStatus.choices)
+    reference = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    # No constraints: the wallets and users may be gone by the time we read it
+    credit_to = models.ForeignKey(Wallet, blank=True, null=True, related_name="+",
+                                  on_delete=models.DO_NOTHING, db_constraint=False)
+    debit_to = models.ForeignKey(Wallet, blank=True, null=True, related_name="+",
+                                 on_delete=models.DO_NOTHING, db_constraint=False)
+    reason_for_failure = models.CharField(max_length=250, blank=True, null=True)
+    currency = models.CharField(max_length=50, blank=True, null=True)
+    payment_provider_txn_id = models.CharField(max_length=100, blank=True, null=True)
+    updated_by = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True,
+                                   related_name="+", on_delete=models.DO_NOTHING,
+                                   db_constraint=False)
+    payment_type = models.CharField(max_length=100, blank=True, null=True)
+    description = models.CharField(max_length=100)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True,
+                              related_name="+", on_delete=models.DO_NOTHING,
+                              db_constraint=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner", "-created_at"], name="payments_archive_owner_idx",
+                         condition=Q(deleted_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return self.reference or str(self.id)
+
+
+class RollupKind(TextChoices):
+    FUNDED = 'funded', 'Funded'
+    DEBITED = 'debited', 'Debited'
+    ORDER = 'order', 'Order Payment'
+
+
+class WalletRollup(models.Model):
+    """
+    Count and total of a wallet's transactions per month, kind and status.
+    Kept up to date by `Transaction.save` and the bulk settlement paths, and
+    rebuilt from raw transactions by `rebuild_wallet_rollups`. Writes to a
+    striped wallet are spread over one shard per stripe, readers add the
+    shards up; a rebuild puts everything back in shard 0.
+    """
+    wallet = models.ForeignKey(Wallet, related_name="rollups", on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField("Shard", default=0)
+    period = models.DateField("Period")
+    kind = models.CharField("Kind", max_length=20, choices=RollupKind.choices)
+    status = models.CharField("Status", max_length=100, choices=TransactionStatus.choices)
+    count = models.IntegerField("Count", default=0)
+    total = models.DecimalField("Total", max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["wallet", "shard", "period", "kind", "status"],
+                                    name="payments_rollup_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet_id} {self.period:%Y-%m} {self.kind} {self.status}"
+
+
+class ExchangeRate(models.Model):
+    """Latest known rate of a currency pair: 1 `base` = `rate` `quote`."""
+    base = models.CharField("Base Currency", max_length=3)
+    quote = models.CharField("Quote Currency", max_length=3)
+    rate = models.DecimalField("Rate", max_digits=20, decimal_places=10)
+    source = models.CharField("Source", max_length=50, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["base", "quote"], name="payments_fx_pair_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.base}/{self.quote} {self.rate}"
+
+
+class PaymentEventStatus(TextChoices):
+    PENDING = 'pending', 'Pending'
+    PROCESSING = 'processing', 'Processing'
+    PROCESSED = 'processed', 'Processed'
+    # Matches no transaction and is no wallet funding, kept for review
+    PARKED = 'parked', 'Parked'
+    FAILED = 'failed', 'Failed'
+
+
+class PaymentEvent(models.Model):
+    """Raw payment provider webhook, queued until a worker applies it."""
+    provider = models.CharField("Provider", max_length=50, default="flutterwave")
+    event_type = models.CharField("Event Type", max_length=100, blank=True, null=True)
+    payment_provider_txn_id = models.CharField(
+        "Transaction ID", max_length=100, blank=True, null=True, db_index=True)
+    payload = models.JSONField("Payload")
+    status = models.CharField("Status", max_length=20, choices=PaymentEventStatus.choices,
+                              default=PaymentEventStatus.PENDING)
+    attempts = models.PositiveIntegerField("Attempts", default=0)
+    error = models.TextField("Error", blank=True, null=True)
+    claimed_at = models.DateTimeField("Claimed At", blank=True, null=True)
+    processed_at = models.DateTimeField("Processed At", blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="payments_event_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.event_type} {self.payment_provider_txn_id}"
+
+
+class IdempotencyStatus(TextChoices):
+    IN_PROGRESS = 'in_progress', 'In Progress'
+    COMPLETED = 'completed', 'Completed'
+
+
+class IdempotencyRecord(models.Model):
+    """Response of a request replayed to clients that retry the same key."""
+    key = models.CharField("Key", max_length=255, unique=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, blank=True, null=True)
+    status = models.CharField("Status", max_length=20, choices=IdempotencyStatus.choices,
+                              default=IdempotencyStatus.IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return self.key
+
+
+class LedgerEntry(models.Model):
+    """
+    Append-only, double-entry record of balance movements. Every movement
+    writes one entry per account with the same `group` and the amounts of a
+    group sum to zero.
+    """
+    group = models.UUIDField("Group", db_index=True)
+    account = models.CharField("Account", max_length=100)
+    # Entries outlive a hard-deleted wallet, `account` still names it
+    wallet = models.ForeignKey(Wallet, blank=True, null=True, related_name="ledger_entries",
+                               on_delete=models.SET_NULL)
+    amount = models.DecimalField("Amount", max_digits=12, decimal_places=2)
+    balance_after = models.DecimalField("Balance After", max_digits=12, decimal_places=2,
+                                        blank=True, null=True)
+    # Not constrained, the transaction may have been moved to ArchivedTransaction
+    transaction = models.ForeignKey(Transaction, blank=True, null=True,
+                                    related_name="ledger_entries", on_delete=models.DO_NOTHING,
+                                    db_constraint=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["wallet", "id"], name="payments_ledger_wallet_idx"),
+            models.Index(fields=["wallet", "created_at"], name="payments_ledger_wallet_dt_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.account} {self.amount}"
+
+
+class WalletBalanceSnapshot(models.Model):
+    """Wallet balance as of `last_entry`, so history reads only need the tail."""
+    wallet = models.ForeignKey(Wallet, related_name="balance_snapshots",
+                               on_delete=models.CASCADE)
+    balance = models.DecimalField("Balance", max_digits=12, decimal_places=2)
+    last_entry = models.ForeignKey(LedgerEntry, related_name="+", on_delete=models.PROTECT)
+    taken_at = models.DateTimeField("Taken At")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["wallet", "taken_at"], name="payments_snapshot_wallet_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet_id} {self.balance} @ {self.taken_at}"
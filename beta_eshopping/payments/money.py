@@ -0,0 +1,161 @@
+from decimal import Decimal
+from functools import total_ordering
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Case, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Cast, Round
+
+# Digits after the decimal point per currency (ISO 4217), 2 for the rest
+MINOR_UNIT_EXPONENTS = {
+    "BIF": 0, "CLP": 0, "JPY": 0, "KRW": 0, "RWF": 0, "UGX": 0, "XAF": 0, "XOF": 0,
+    "BHD": 3, "KWD": 3, "OMR": 3, "TND": 3,
+    **getattr(settings, "PAYMENTS_MINOR_UNIT_EXPONENTS", {}),
+}
+DEFAULT_EXPONENT = 2
+# Wallet balances are kept in dollars
+WALLET_CURRENCY = "USD"
+
+
+def exponent(currency):
+    return MINOR_UNIT_EXPONENTS.get((currency or "").upper(), DEFAULT_EXPONENT)
+
+
+def to_minor(amount, currency=WALLET_CURRENCY, rounding=None):
+    """
+    Integer minor units (kobo, cents) of a decimal amount. Raises ValueError
+    for amounts with more digits than the currency has, rather than rounding
+    money away, unless a decimal `rounding` mode is given.
+    """
+    if isinstance(amount, Money):
+        return amount.minor
+    scaled = Decimal(str(amount)).scaleb(exponent(currency))
+    if scaled != scaled.to_integral_value():
+        if rounding is None:
+            raise ValueError(f"{amount} has more than {exponent(currency)} decimal places")
+        return int(scaled.to_integral_value(rounding))
+    return int(scaled)
+
+
+def from_minor(minor, currency=WALLET_CURRENCY):
+    places = exponent(currency)
+    return Decimal(minor).scaleb(-places).quantize(Decimal(1).scaleb(-places))
+
+
+def format_minor(minor, currency=WALLET_CURRENCY):
+    """Decimal string of minor units, "1234.50" for 123450, with int operations only."""
+    places = exponent(currency)
+    if not places:
+        return str(minor)
+    whole, fraction = divmod(abs(minor), 10 ** places)
+    return f"{'-' if minor < 0 else ''}{whole}.{fraction:0{places}d}"
+
+
+@total_ordering
+class Money:
+    """
+    An amount as integer minor units and a currency. Arithmetic and
+    comparisons are plain int operations; only amounts of the same currency
+    can be combined.
+    """
+
+    __slots__ = ("minor", "currency")
+
+    def __init__(self, minor, currency=WALLET_CURRENCY):
+        object.__setattr__(self, "minor", int(minor))
+        object.__setattr__(self, "currency", (currency or WALLET_CURRENCY).upper())
+
+    @classmethod
+    def of(cls, amount, currency=WALLET_CURRENCY):
+        if isinstance(amount, Money):
+            return amount
+        return cls(to_minor(amount, currency), currency)
+
+    @property
+    def amount(self):
+        return from_minor(self.minor, self.currency)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Money is immutable")
+
+    def _check(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        if other.currency != self.currency:
+            raise ValueError(f"Cannot combine {self.currency} and {other.currency}")
+        return other
+
+    def __add__(self, other):
+        other = self._check(other)
+        if other is NotImplemented:
+            return other
+        return Money(self.minor + other.minor, self.currency)
+
+    def __sub__(self, other):
+        other = self._check(other)
+        if other is NotImplemented:
+            return other
+        return Money(self.minor - other.minor, self.currency)
+
+    def __neg__(self):
+        return Money(-self.minor, self.currency)
+
+    def __abs__(self):
+        return Money(abs(self.minor), self.currency)
+
+    def __bool__(self):
+        return bool(self.minor)
+
+    def __eq__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return (self.minor, self.currency) == (other.minor, other.currency)
+
+    def __lt__(self, other):
+        other = self._check(other)
+        if other is NotImplemented:
+            return other
+        return self.minor < other.minor
+
+    def __hash__(self):
+        return hash((self.minor, self.currency))
+
+    def __str__(self):
+        return format_minor(self.minor, self.currency)
+
+    def __repr__(self):
+        return f"Money({self.amount}, {self.currency!r})"
+
+
+class MinorUnitField(models.BigIntegerField):
+    """
+    Integer minor units, read back as plain ints so sums stay in integer
+    arithmetic. Accepts `Money` on assignment and in lookups. A bigint holds
+    amounts up to 9.2e16 naira, well past the 10 digit decimal columns.
+    """
+
+    def get_prep_value(self, value):
+        if isinstance(value, Money):
+            value = value.minor
+        return super().get_prep_value(value)
+
+
+def minor_units(amount_field, currency_field=None):
+    """
+    SQL expression of the minor units of a decimal column, for backfills and
+    aggregates over rows that have no minor-unit column yet. Sub-unit amounts
+    are rounded half away from zero, like `to_minor(..., ROUND_HALF_UP)` on
+    save; a bare cast would truncate them on SQLite.
+    """
+    amount = F(amount_field)
+    if currency_field is None:
+        scaled = amount * Value(10 ** exponent(WALLET_CURRENCY))
+    else:
+        scaled = amount * Case(
+            *[When(**{f"{currency_field}__iexact": currency}, then=Value(10 ** places))
+              for currency, places in MINOR_UNIT_EXPONENTS.items()
+              if places != DEFAULT_EXPONENT],
+            default=Value(10 ** DEFAULT_EXPONENT),
+        )
+    scaled = ExpressionWrapper(scaled, output_field=models.DecimalField())
+    return Cast(Round(scaled), models.BigIntegerField())
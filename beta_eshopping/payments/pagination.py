@@ -0,0 +1,150 @@
+import base64
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+
+DEFAULT_PAGE_SIZE = getattr(settings, "PAYMENTS_TRANSACTIONS_PAGE_SIZE", 50)
+MAX_PAGE_SIZE = getattr(settings, "PAYMENTS_TRANSACTIONS_MAX_PAGE_SIZE", 500)
+STREAM_CHUNK_SIZE = getattr(settings, "PAYMENTS_TRANSACTIONS_STREAM_CHUNK_SIZE", 500)
+
+
+def encode_cursor(obj):
+    if isinstance(obj, dict):
+        created_at, pk = obj["created_at"], obj["id"]
+    else:
+        created_at, pk = obj.created_at, obj.pk
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, pk = base64.urlsafe_b64decode(
+            cursor.encode()).decode().split("|")
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (ValueError, TypeError):
+        raise ValidationError({"cursor": "Invalid cursor."})
+    if created_at is None:
+        raise ValidationError({"cursor": "Invalid cursor."})
+    return created_at, pk
+
+
+def get_page_size(value):
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    try:
+        page_size = int(value)
+    except ValueError:
+        raise ValidationError({"page_size": "A valid integer is required."})
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def keyset_page(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE, union_with=None):
+    """The queryset of one page plus one row, see `paginate_by_keyset`."""
+    # Databases that can't slice inside a UNION get the parts unsliced
+    slice_parts = (union_with is None or
+                   connections[queryset.db].features.supports_slicing_ordering_in_compound)
+
+    def page(queryset):
+        if cursor:
+            created_at, pk = decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        if not slice_parts:
+            return queryset.order_by()
+        return queryset.order_by("-created_at", "-id")[:page_size + 1]
+
+    queryset = page(queryset)
+    if union_with is not None:
+        queryset = queryset.union(page(union_with), all=True).order_by(
+            "-created_at", "-id")[:page_size + 1]
+    return queryset
+
+
+def paginate_by_keyset(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE,
+                       union_with=None):
+    """
+    Return one page of a queryset ordered by (-created_at, -id) and the
+    cursor of the next page. The cursor is the (created_at, id) of the last
+    row served, so every page is a single index range scan however deep
+    into the history the client is.
+
+    `union_with` is a second queryset with the same columns (archived rows);
+    the page is then merged from one page of each.
+    """
+    return split_page(
+        list(keyset_page(queryset, cursor, page_size, union_with)), page_size)
+
+
+async def apaginate_by_keyset(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE,
+                              union_with=None):
+    page = keyset_page(queryset, cursor, page_size, union_with)
+    return split_page([row async for row in page], page_size)
+
+
+def split_page(rows, page_size):
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
+
+
+def stream_serialized(queryset, represent, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Stream a queryset as a JSON array, converting `chunk_size` rows at a
+    time with `represent` so memory stays flat regardless of how many rows
+    are returned. The bytes are the same the JSONRenderer would produce for
+    the whole list.
+    """
+    renderer = JSONRenderer()
+
+    def generate():
+        yield b"["
+        chunk = []
+        first = True
+        for row in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield _encode_chunk(renderer, represent(chunk), first)
+                first = False
+                chunk = []
+        if chunk:
+            yield _encode_chunk(renderer, represent(chunk), first)
+        yield b"]"
+
+    return StreamingHttpResponse(generate(), content_type="application/json")
+
+
+def astream_serialized(queryset, represent, chunk_size=STREAM_CHUNK_SIZE):
+    """`stream_serialized` for async views, `represent` is a coroutine function."""
+    renderer = JSONRenderer()
+
+    async def generate():
+        yield b"["
+        chunk = []
+        first = True
+        async for row in queryset.aiterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield _encode_chunk(renderer, await represent(chunk), first)
+                first = False
+                chunk = []
+        if chunk:
+            yield _encode_chunk(renderer, await represent(chunk), first)
+        yield b"]"
+
+    return StreamingHttpResponse(generate(), content_type="application/json")
+
+
+def _encode_chunk(renderer, data, first):
+    # Render the chunk as a list and drop its brackets
+    body = renderer.render(data)[1:-1]
+    return body if first else b"," + body
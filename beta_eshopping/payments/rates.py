@@ -0,0 +1,227 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Q
+from apps.shopping.utitlities import get_current_dollar_rate
+from .models import ExchangeRate
+
+logger = logging.getLogger(__name__)
+
+CENTS = Decimal("0.01")
+
+
+class CachedRate:
+    """
+    In-process cache for an exchange rate lookup.
+
+    Fresh values are served for `ttl` seconds. After that the stale value keeps
+    being served while a single background thread refreshes it, so callers
+    only ever block on the very first lookup in a process.
+    """
+
+    def __init__(self, fetch, ttl):
+        self._fetch = fetch
+        self.ttl = ttl
+        self._value = None
+        self._fetched_at = None
+        self._refresh_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale_hits": 0,
+                       "refreshes": 0, "refresh_errors": 0}
+
+    def get(self):
+        if self._value is None:
+            with self._refresh_lock:
+                # Another thread may have filled the cache while we waited
+                if self._value is None:
+                    self._count("misses")
+                    self._refresh()
+                    return self._value
+            self._count("hits")
+            return self._value
+
+        if time.monotonic() - self._fetched_at < self.ttl:
+            self._count("hits")
+        else:
+            self._count("stale_hits")
+            self._refresh_in_background()
+        return self._value
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def clear(self):
+        with self._refresh_lock:
+            self._value = None
+            self._fetched_at = None
+
+    def _refresh_in_background(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            # A refresh is already running
+            return
+        threading.Thread(target=self._refresh_and_release, daemon=True).start()
+
+    def _refresh_and_release(self):
+        try:
+            self._refresh()
+        except Exception as e:
+            # Keep serving the stale value until the next refresh succeeds
+            self._count("refresh_errors")
+            logger.exception(e)
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self):
+        value = self._fetch()
+        self._value = value
+        self._fetched_at = time.monotonic()
+        self._count("refreshes")
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+
+dollar_rate = CachedRate(
+    get_current_dollar_rate,
+    ttl=getattr(settings, "PAYMENTS_FX_RATE_TTL", 300),
+)
+
+
+class RateTable:
+    """
+    Exchange rates read from the ExchangeRate table through an in-process
+    LRU of resolved pairs.
+
+    Conversions take whole lists, so each distinct currency pair costs at
+    most one lookup per call and the rows of a page never each wait on a
+    query. Pairs missing from the table are resolved from the inverse rate,
+    then through USD. USD/NGN falls back to `dollar_rate`, the rate the
+    wallet serializer has always used.
+    """
+
+    pivot = "USD"
+
+    def __init__(self, maxsize=256, ttl=300, fallbacks=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.fallbacks = fallbacks or {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "unresolved": 0}
+
+    def rate(self, base, quote):
+        return self.rates([(base, quote)])[(base, quote)]
+
+    def rates(self, pairs):
+        """{(base, quote): Decimal rate or None} for every pair, one query for all misses."""
+        requested = set(pairs)
+        result, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for pair in {(base.upper(), quote.upper()) for base, quote in requested}:
+                cached = self._cache.get(pair)
+                if cached is not None and now - cached[1] < self.ttl:
+                    self._cache.move_to_end(pair)
+                    result[pair] = cached[0]
+                    self._stats["hits"] += 1
+                else:
+                    missing.append(pair)
+                    self._stats["misses"] += 1
+        if missing:
+            resolved = self._resolve(missing)
+            with self._lock:
+                for pair, value in resolved.items():
+                    self._cache[pair] = (value, now)
+                    self._cache.move_to_end(pair)
+                    if value is None:
+                        self._stats["unresolved"] += 1
+                while len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+            result.update(resolved)
+        return {(base, quote): result[(base.upper(), quote.upper())]
+                for base, quote in requested}
+
+    def convert_many(self, items, quote):
+        """
+        Convert `(amount, currency)` items to `quote`. Returns the converted
+        amounts in order, None where the amount or the rate is unknown.
+        """
+        items = list(items)
+        rates = self.rates({(currency or self.pivot, quote) for _, currency in items})
+        converted = []
+        for amount, currency in items:
+            rate = rates[(currency or self.pivot, quote)]
+            if amount is None or rate is None:
+                converted.append(None)
+            else:
+                converted.append((Decimal(str(amount)) * rate).quantize(CENTS))
+        return converted
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _resolve(self, pairs):
+        wanted = set()
+        for base, quote in pairs:
+            for currency in (base, quote):
+                wanted |= {(currency, self.pivot), (self.pivot, currency)}
+            wanted |= {(base, quote), (quote, base)}
+        condition = Q()
+        for base, quote in wanted:
+            if base != quote:
+                condition |= Q(base=base, quote=quote)
+        known = {}
+        if condition:
+            known = {
+                (base, quote): rate for base, quote, rate in
+                ExchangeRate.objects.filter(condition).values_list("base", "quote", "rate")
+            }
+
+        def from_fallback(pair):
+            try:
+                return Decimal(str(self.fallbacks[pair]()))
+            except Exception as e:
+                logger.exception(e)
+                return None
+
+        def direct(base, quote):
+            if base == quote:
+                return Decimal(1)
+            if (base, quote) in known:
+                return known[(base, quote)]
+            if (quote, base) in known and known[(quote, base)]:
+                return 1 / known[(quote, base)]
+            if (base, quote) in self.fallbacks:
+                return from_fallback((base, quote))
+            if (quote, base) in self.fallbacks:
+                value = from_fallback((quote, base))
+                return 1 / value if value else None
+            return None
+
+        resolved = {}
+        for base, quote in pairs:
+            value = direct(base, quote)
+            if value is None:
+                to_pivot, from_pivot = direct(base, self.pivot), direct(self.pivot, quote)
+                if to_pivot is not None and from_pivot is not None:
+                    value = to_pivot * from_pivot
+            resolved[(base, quote)] = value
+        return resolved
+
+
+rate_table = RateTable(
+    maxsize=getattr(settings, "PAYMENTS_FX_CACHE_SIZE", 256),
+    ttl=getattr(settings, "PAYMENTS_FX_RATE_TTL", 300),
+    fallbacks={("USD", "NGN"): dollar_rate.get},
+)
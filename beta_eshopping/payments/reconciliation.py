@@ -0,0 +1,275 @@
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    LEDGER_EXTERNAL_ACCOUNT, LedgerEntry, Transaction, TransactionStatus, Wallet,
+    bump_wallet_versions,
+)
+from .gateway import get_gateway_client
+from .rates import rate_table
+from .rollups import apply_rollups, contributions
+from .striping import fold_stripes
+from .management.commands._bench import percentile
+from .utils import map_payment_status, update_transaction_reference
+
+Outcome = namedtuple("Outcome", ["reference", "ok", "message"])
+Verification = namedtuple("Verification", ["status", "message", "amount", "currency"])
+
+# How far a payment made in another currency may be from the transaction
+# value once converted, as a fraction of the value
+RATE_TOLERANCE = Decimal(str(getattr(settings, "PAYMENTS_RECONCILE_RATE_TOLERANCE", "0.02")))
+
+
+def settle_transactions(references=None, ids=None, updated_by=None,
+                        prefix_references=True):
+    """
+    Mark pending transactions successful and apply their credits and debits.
+
+    Everything runs in one DB transaction: wallets are locked in primary key
+    order so concurrent settlements cannot deadlock, balances are computed in
+    Python and written back with one `bulk_update`. Returns an `Outcome` per
+    requested transaction.
+    """
+    outcomes = []
+    with transaction.atomic():
+        txns = Transaction.objects.select_for_update().order_by("id")
+        if references is not None:
+            txns = txns.filter(reference__in=references)
+        if ids is not None:
+            txns = txns.filter(pk__in=ids)
+        txns = list(txns)
+
+        if references is not None:
+            found = {txn.reference for txn in txns}
+            outcomes += [Outcome(ref, False, "Transaction not found")
+                         for ref in references if ref not in found]
+
+        wallet_ids = sorted(
+            {txn.credit_to_id for txn in txns if txn.credit_to_id} |
+            {txn.debit_to_id for txn in txns if txn.debit_to_id}
+        )
+        wallets = {
+            wallet.pk: wallet for wallet in
+            Wallet.objects.select_for_update(no_key=True).filter(pk__in=wallet_ids)
+            .order_by("pk")
+        }
+        for wallet in wallets.values():
+            wallet.balance = wallet.balance or Decimal("0.00")
+
+        now = timezone.now()
+        # Folded wallets must be written back even if nothing settles on them
+        changed_wallets = fold_stripes(wallets.values())
+        settled, ledger, removed = [], [], []
+        for txn in txns:
+            outcome = _settle(txn, wallets, ledger)
+            outcomes.append(outcome)
+            if not outcome.ok:
+                continue
+            removed += contributions(txn.rollup_values())
+            txn.status = TransactionStatus.SUCCESSFUL
+            if prefix_references:
+                txn.reference = update_transaction_reference(
+                    txn.credit_to_id, txn.debit_to_id, txn.reference or "")
+            txn.updated_by = updated_by
+            txn.updated_at = now
+            settled.append(txn)
+            changed_wallets.update(
+                pk for pk in (txn.credit_to_id, txn.debit_to_id) if pk in wallets)
+
+        for pk in changed_wallets:
+            wallets[pk].updated_at = now
+            wallets[pk].sync_balance_minor()
+        Wallet.objects.bulk_update(
+            [wallets[pk] for pk in sorted(changed_wallets)],
+            ["balance", "balance_minor", "updated_at"])
+        Transaction.objects.bulk_update(
+            settled, ["status", "reference", "updated_by", "updated_at"])
+        LedgerEntry.objects.bulk_create(ledger)
+        apply_rollups(
+            added=[c for txn in settled for c in contributions(txn.rollup_values())],
+            removed=removed,
+        )
+        bump_transaction_wallets(settled)
+    return outcomes
+
+
+def bump_transaction_wallets(txns):
+    bump_wallet_versions(
+        wallet_ids=[pk for txn in txns for pk in (txn.credit_to_id, txn.debit_to_id)],
+        user_ids=[txn.owner_id for txn in txns],
+    )
+
+
+def _settle(txn, wallets, ledger):
+    if txn.status != TransactionStatus.PENDING:
+        return Outcome(txn.reference, False, f"Transaction is already {txn.status}")
+    if txn.credit_to_id and txn.debit_to_id:
+        return Outcome(txn.reference, False,
+                       "Credited and Debited Wallet cannot be provided at the same time")
+    if not txn.value:
+        return Outcome(txn.reference, False, "Value is required")
+
+    # Soft-deleted wallets are not moved, same as process_successful_transaction
+    credit = wallets.get(txn.credit_to_id)
+    debit = wallets.get(txn.debit_to_id)
+    if debit and not debit.deleted_at:
+        if debit.balance < txn.value:
+            return Outcome(txn.reference, False,
+                           f"Insufficient funds. Balance is {debit.balance} USD")
+        _move(debit, -txn.value, txn, ledger)
+        return Outcome(txn.reference, True, f"${txn.value} removed from wallet {debit.pk}")
+    if credit and not credit.deleted_at:
+        _move(credit, txn.value, txn, ledger)
+        return Outcome(txn.reference, True, f"${txn.value} added to wallet {credit.pk}")
+    return Outcome(txn.reference, True, "Marked successful")
+
+
+def _move(wallet, amount, txn, ledger):
+    wallet.balance += amount
+    group = uuid.uuid4()
+    ledger += [
+        LedgerEntry(group=group, account=f"wallet:{wallet.pk}", wallet=wallet,
+                    amount=amount, balance_after=wallet.balance, transaction=txn),
+        LedgerEntry(group=group, account=LEDGER_EXTERNAL_ACCOUNT,
+                    amount=-amount, transaction=txn),
+    ]
+
+
+class ReconciliationStats:
+    def __init__(self):
+        self.checked = 0
+        self.settled = 0
+        self.failed = 0
+        self.still_pending = 0
+        self.mismatched = 0
+        self.errors = 0
+        self.latencies = []
+        self.started = time.perf_counter()
+
+    def percentile(self, pct):
+        return percentile(self.latencies, pct)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "checked": self.checked,
+            "settled": self.settled,
+            "failed": self.failed,
+            "still_pending": self.still_pending,
+            "mismatched": self.mismatched,
+            "errors": self.errors,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_per_s": round(self.checked / elapsed, 1) if elapsed else 0,
+            "latency_p50_ms": round(self.percentile(50) * 1000, 1),
+            "latency_p95_ms": round(self.percentile(95) * 1000, 1),
+            "latency_p99_ms": round(self.percentile(99) * 1000, 1),
+        }
+
+
+def _verify(client, provider_txn_id):
+    start = time.perf_counter()
+    try:
+        response = client.verify_transaction(provider_txn_id)
+        data = response.get("data") or {}
+        result = Verification(map_payment_status(data.get("status")), data.get("message"),
+                              data.get("amount"), data.get("currency"))
+    except Exception as e:
+        result = Verification(None, str(e), None, None)
+    return result, time.perf_counter() - start
+
+
+def amount_matches(value, currency, paid, paid_currency):
+    """
+    Whether the gateway's `paid` amount covers a transaction of `value` in
+    `currency`. Wallet fundings are valued in dollars but may be paid in
+    another currency, those are converted and compared within
+    `RATE_TOLERANCE`.
+    """
+    currency = (currency or "USD").upper()
+    try:
+        paid = Decimal(str(paid))
+    except (InvalidOperation, ValueError):
+        return False
+    if not paid_currency or paid_currency.upper() == currency:
+        return paid == value
+    converted, = rate_table.convert_many([(paid, paid_currency.upper())], currency)
+    return converted is not None and abs(converted - value) <= value * RATE_TOLERANCE
+
+
+def reconcile_stale_pending(older_than, workers=16, batch_size=500, limit=None,
+                            client=None, stats=None):
+    """
+    Re-verify transactions that have been pending for longer than `older_than`
+    against the gateway. Verifications run on a pool of `workers` threads,
+    results are applied one batch at a time from the calling thread so only
+    it touches the database. Payments whose amount or currency does not match
+    the transaction are left pending and counted as mismatched.
+    """
+    client = client or get_gateway_client()
+    stats = stats or ReconciliationStats()
+    cutoff = timezone.now() - older_than
+    pending = Transaction.active_objects.filter(
+        status=TransactionStatus.PENDING, created_at__lt=cutoff,
+        payment_provider_txn_id__isnull=False,
+    ).order_by("id")
+
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while limit is None or stats.checked < limit:
+            size = batch_size if limit is None else min(batch_size, limit - stats.checked)
+            batch = list(pending.filter(id__gt=last_id).values_list(
+                "id", "payment_provider_txn_id", "value", "currency")[:size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            results = pool.map(lambda row: _verify(client, row[1]), batch)
+            successful, failed = [], {}
+            for (pk, _, value, currency), (result, latency) in zip(batch, results):
+                stats.checked += 1
+                stats.latencies.append(latency)
+                if result.status is None:
+                    stats.errors += 1
+                elif result.status == TransactionStatus.SUCCESSFUL:
+                    if amount_matches(value, currency, result.amount, result.currency):
+                        successful.append(pk)
+                    else:
+                        stats.mismatched += 1
+                elif result.status == TransactionStatus.FAILED:
+                    failed[pk] = result.message
+                else:
+                    stats.still_pending += 1
+
+            if successful:
+                outcomes = settle_transactions(ids=successful)
+                stats.settled += sum(1 for outcome in outcomes if outcome.ok)
+            if failed:
+                stats.failed += _mark_failed(failed)
+    return stats
+
+
+def _mark_failed(reasons):
+    with transaction.atomic():
+        txns = list(Transaction.objects.select_for_update().filter(
+            pk__in=list(reasons), status=TransactionStatus.PENDING))
+        now = timezone.now()
+        removed = [c for txn in txns for c in contributions(txn.rollup_values())]
+        for txn in txns:
+            txn.status = TransactionStatus.FAILED
+            txn.reason_for_failure = (reasons[txn.pk] or "")[:250] or None
+            txn.updated_at = now
+        Transaction.objects.bulk_update(
+            txns, ["status", "reason_for_failure", "updated_at"])
+        apply_rollups(
+            added=[c for txn in txns for c in contributions(txn.rollup_values())],
+            removed=removed,
+        )
+        bump_transaction_wallets(txns)
+    return len(txns)
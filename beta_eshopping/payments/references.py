@@ -0,0 +1,73 @@
+import os
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+
+def _node_id():
+    node_id = getattr(settings, "PAYMENTS_NODE_ID", None)
+    if node_id is None:
+        node_id = zlib.crc32(socket.gethostname().encode())
+    return int(node_id) & 0xFFFF
+
+
+_node = None
+_pid = None
+# Millisecond of the last reference and its sequence within that millisecond
+_last_ms = 0
+_sequence = 0
+_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _pid, _last_ms, _sequence, _lock
+    _pid = os.getpid()
+    _last_ms = 0
+    _sequence = 0
+    _lock = threading.Lock()
+
+
+def _next_timestamp():
+    """
+    (millisecond, sequence), strictly increasing within the process. The
+    sequence restarts every millisecond; when it runs out, or the clock
+    steps back, the next reference borrows the following millisecond.
+    """
+    global _last_ms, _sequence
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms, _sequence = now_ms, 0
+        elif _sequence < 0xFFFF:
+            _sequence += 1
+        else:
+            _last_ms, _sequence = _last_ms + 1, 0
+        return _last_ms, _sequence
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def generate_reference(prefix):
+    """
+    Return `<prefix>-<UTC timestamp to the millisecond>-<node><pid><counter>`.
+
+    References from one process sort by creation time, and the node id,
+    process id and per-millisecond sequence keep them unique when many are
+    generated in the same millisecond on different machines or workers.
+    """
+    global _node, _pid
+    if _node is None:
+        _node = _node_id()
+    if _pid is None:
+        _pid = os.getpid()
+
+    ms, sequence = _next_timestamp()
+    now = datetime.fromtimestamp(ms / 1000, timezone.utc)
+    timestamp = now.strftime("%Y%m%d%H%M%S") + f"{ms % 1000:03d}"
+    return f"{prefix}-{timestamp}-{_node:04X}{_pid & 0xFFFFFF:06X}{sequence:04X}"
@@ -0,0 +1,234 @@
+import zlib
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .archive import live_archived
+from .models import (
+    RollupKind, Transaction, TransactionStatus, Wallet, WalletRollup,
+)
+
+ZERO = Decimal("0.00")
+# Advisory lock namespace, per wallet: writers take them shared and rebuilds
+# exclusive, on PostgreSQL. The two-key lock functions take int4 keys.
+ROLLUP_LOCK_ID = zlib.crc32(b"payments.wallet_rollups") & 0x7FFFFFFF
+# Rows per upsert statement, 7 parameters each stays under SQLite's limit
+UPSERT_BATCH_SIZE = 140
+# Spread the rollups of striped wallets over one row per stripe, so their
+# writers don't all queue on the month's row
+SHARD_STRIPED_ROLLUPS = getattr(settings, "PAYMENTS_SHARD_STRIPED_ROLLUPS", True)
+
+# One transaction's share of a rollup row. Order payments have no wallet on
+# the transaction, they are attributed to the owner's wallet.
+Contribution = namedtuple(
+    "Contribution", ["wallet_id", "owner_id", "period", "kind", "status", "value"])
+
+
+def period_of(created_at):
+    return timezone.localtime(created_at).date().replace(day=1)
+
+
+def contributions(values):
+    """Rollup contributions of a transaction, from its `rollup_values()`."""
+    if values["deleted_at"] or not values["created_at"]:
+        return []
+    period = period_of(values["created_at"])
+    value = values["value"] or ZERO
+    result = []
+    if values["credit_to_id"]:
+        result.append(Contribution(values["credit_to_id"], None, period,
+                                   RollupKind.FUNDED, values["status"], value))
+    if values["debit_to_id"]:
+        result.append(Contribution(values["debit_to_id"], None, period,
+                                   RollupKind.DEBITED, values["status"], value))
+    if not result and values["owner_id"]:
+        result.append(Contribution(None, values["owner_id"], period,
+                                   RollupKind.ORDER, values["status"], value))
+    return result
+
+
+def apply_rollups(added=(), removed=()):
+    """
+    Add `added` and subtract `removed` contributions from the rollup rows.
+    Must run in the DB transaction that changed the transactions. Each row
+    is an atomic upsert, so writers of one wallet only wait on each other
+    for the rows they share and never lock the wallet. A striped wallet's
+    deltas go to the shard of the stripe this transaction writes to.
+    """
+    if not added and not removed:
+        return
+
+    owner_ids = {c.owner_id for c in (*added, *removed) if c.wallet_id is None}
+    owner_wallets = dict(
+        Wallet.objects.filter(user_id__in=owner_ids).values_list("user_id", "pk")
+    ) if owner_ids else {}
+
+    deltas = defaultdict(lambda: [0, ZERO])
+    for sign, items in ((1, added), (-1, removed)):
+        for c in items:
+            wallet_id = c.wallet_id or owner_wallets.get(c.owner_id)
+            if wallet_id is None:
+                continue
+            delta = deltas[(wallet_id, c.period, c.kind, c.status)]
+            delta[0] += sign
+            delta[1] += sign * c.value
+    deltas = {key: delta for key, delta in deltas.items() if delta != [0, ZERO]}
+    if not deltas:
+        return
+    wallet_ids = {k[0] for k in deltas}
+    if SHARD_STRIPED_ROLLUPS:
+        from .striping import pick_stripe
+        shards = {pk: pick_stripe(count) for pk, count in Wallet.objects.filter(
+            pk__in=wallet_ids, stripe_count__gt=0).values_list("pk", "stripe_count")}
+        deltas = {(k[0], shards.get(k[0], 0), *k[1:]): delta for k, delta in deltas.items()}
+    else:
+        deltas = {(k[0], 0, *k[1:]): delta for k, delta in deltas.items()}
+
+    db = connections[WalletRollup.objects.db]
+    fields = [WalletRollup._meta.get_field(name) for name in
+              ("wallet", "shard", "period", "kind", "status", "count", "total")]
+    table = db.ops.quote_name(WalletRollup._meta.db_table)
+    columns = [db.ops.quote_name(field.column) for field in fields]
+    key, (count, total) = ", ".join(columns[:5]), columns[5:]
+    # Rows in key order, so concurrent upserts lock shared rows in one order
+    rows = [
+        [field.get_db_prep_value(value, db) for field, value in zip(fields, (*k, *deltas[k]))]
+        for k in sorted(deltas)
+    ]
+    with transaction.atomic(), db.cursor() as cursor:
+        _lock_rollups(cursor, wallet_ids, shared=True)
+        for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[i:i + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(batch))} "
+                f"ON CONFLICT ({key}) DO UPDATE SET "
+                f"{count} = {table}.{count} + EXCLUDED.{count}, "
+                f"{total} = {table}.{total} + EXCLUDED.{total}",
+                [value for row in batch for value in row],
+            )
+
+
+def _lock_rollups(cursor, wallet_ids, shared):
+    """
+    Lock the rollups of `wallet_ids`, in id order so writers and rebuilds
+    never deadlock. Writers hold the locks shared and don't contend, a
+    rebuild holds its wallets' exclusive so no delta lands between its read
+    and its rewrite. Ids that collide past the int4 key only share a lock.
+    SQLite serializes writers anyway.
+    """
+    if cursor.db.vendor == "postgresql" and wallet_ids:
+        cursor.execute(
+            f"SELECT pg_advisory_xact_lock{'_shared' if shared else ''}(%s, key) "
+            f"FROM unnest(%s::int[]) AS key",
+            [ROLLUP_LOCK_ID, sorted({pk & 0x7FFFFFFF for pk in wallet_ids})])
+
+
+def wallet_summary(wallet, months=12):
+    """
+    Monthly totals of a wallet read from its rollups, newest first: amounts
+    funded, debited and paid for orders, plus failed and pending attempts.
+    """
+    start = period_of(timezone.now())
+    for _ in range(months - 1):
+        start = (start.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+    periods = {}
+    for rollup in WalletRollup.objects.filter(wallet=wallet, period__gte=start):
+        summary = periods.setdefault(rollup.period, {
+            "period": rollup.period.strftime("%Y-%m"),
+            "funded": ZERO,
+            "debited": ZERO,
+            "spent_on_orders": ZERO,
+            "failed_attempts": 0,
+            "pending": 0,
+        })
+        if rollup.status == TransactionStatus.SUCCESSFUL:
+            key = {RollupKind.FUNDED: "funded", RollupKind.DEBITED: "debited",
+                   RollupKind.ORDER: "spent_on_orders"}[rollup.kind]
+            summary[key] += rollup.total
+        elif rollup.status == TransactionStatus.FAILED:
+            summary["failed_attempts"] += rollup.count
+        else:
+            summary["pending"] += rollup.count
+    return [periods[period] for period in sorted(periods, reverse=True)]
+
+
+def _aggregate(queryset, wallet_column, kind, wallet_ids):
+    rows = (
+        queryset.filter(**{f"{wallet_column}__in": wallet_ids})
+        .annotate(rollup_wallet=F(wallet_column),
+                  period=TruncMonth("created_at", output_field=DateField()))
+        .values("rollup_wallet", "period", "status")
+        .annotate(count=Count("id"), total=Sum("value"))
+        .order_by()
+    )
+    for row in rows:
+        yield (row["rollup_wallet"], row["period"], kind, row["status"]), \
+            (row["count"], row["total"] or ZERO)
+
+
+def rebuild_chunk(wallet_ids):
+    """
+    Recompute the rollups of `wallet_ids` from live and archived transactions.
+    Rollup writers of those wallets wait while the chunk is rebuilt, writers
+    of other wallets carry on.
+    """
+    with transaction.atomic():
+        wallet_ids = list(Wallet.objects.filter(pk__in=wallet_ids)
+                          .order_by("pk").values_list("pk", flat=True))
+        with connections[WalletRollup.objects.db].cursor() as cursor:
+            _lock_rollups(cursor, wallet_ids, shared=False)
+        totals = defaultdict(lambda: [0, ZERO])
+        for queryset in (Transaction.active_objects.all(), live_archived()):
+            sources = (
+                _aggregate(queryset, "credit_to", RollupKind.FUNDED, wallet_ids),
+                _aggregate(queryset, "debit_to", RollupKind.DEBITED, wallet_ids),
+                _aggregate(
+                    queryset.filter(credit_to__isnull=True, debit_to__isnull=True),
+                    "owner__wallet__id", RollupKind.ORDER, wallet_ids),
+            )
+            for source in sources:
+                for key, (count, total) in source:
+                    totals[key][0] += count
+                    totals[key][1] += total
+
+        WalletRollup.objects.filter(wallet_id__in=wallet_ids).delete()
+        WalletRollup.objects.bulk_create([
+            WalletRollup(wallet_id=wallet_id, period=period, kind=kind, status=status,
+                         count=count, total=total)
+            for (wallet_id, period, kind, status), (count, total) in totals.items()
+        ], batch_size=1000)
+    return len(wallet_ids)
+
+
+def _rebuild_in_thread(wallet_ids):
+    try:
+        return rebuild_chunk(wallet_ids)
+    finally:
+        # Each worker thread has its own connection
+        connection.close()
+
+
+def rebuild_rollups(chunk_size=500, workers=4, wallet_ids=None):
+    """
+    Rebuild the rollups of every wallet (or of `wallet_ids`) in chunks of
+    `chunk_size` wallets, `workers` chunks at a time. Returns the number of
+    wallets rebuilt.
+    """
+    wallets = Wallet.objects.order_by("pk")
+    if wallet_ids is not None:
+        wallets = wallets.filter(pk__in=wallet_ids)
+    ids = list(wallets.values_list("pk", flat=True))
+    chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+    if workers <= 1:
+        return sum(rebuild_chunk(chunk) for chunk in chunks)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(_rebuild_in_thread, chunks))
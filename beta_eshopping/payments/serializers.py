@@ -1,17 +1,77 @@
+from decimal import Decimal
+
+from django.conf import settings
 from rest_framework import serializers
 from .models import Wallet, Transaction
-from apps.shopping.utitlities import get_current_dollar_rate
+from .money import WALLET_CURRENCY, Money, exponent, format_minor
+from .rates import dollar_rate
+from .instrumentation import timed
+
+
+class MoneyField(serializers.Field):
+    """
+    Decimal string on the wire, `Money` in validated data. Represents `Money`,
+    decimals and minor-unit ints the way DecimalField(decimal_places=2) does,
+    ints without any Decimal arithmetic.
+    """
+
+    default_error_messages = {
+        "invalid": "A valid number is required.",
+        "max_decimal_places": "Ensure that there are no more than {places} decimal places.",
+        "min_value": "Ensure this value is greater than or equal to {min_value}.",
+    }
+
+    def __init__(self, currency=WALLET_CURRENCY, min_value=None, **kwargs):
+        self.currency = currency
+        self.min_value = min_value
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        try:
+            amount = Decimal(str(data).strip())
+        except ArithmeticError:
+            self.fail("invalid")
+        if not amount.is_finite():
+            self.fail("invalid")
+        try:
+            money = Money.of(amount, self.currency)
+        except ValueError:
+            self.fail("max_decimal_places", places=exponent(self.currency))
+        if self.min_value is not None and money < Money.of(self.min_value, self.currency):
+            self.fail("min_value", min_value=self.min_value)
+        return money
+
+    def to_representation(self, value):
+        if isinstance(value, Money):
+            return str(value)
+        if isinstance(value, int):
+            return format_minor(value, self.currency)
+        return str(Money.of(value, self.currency))
 
 
 class WalletSerializer(serializers.ModelSerializer):
+    balance = MoneyField(read_only=True)
     balance_naira = serializers.SerializerMethodField()
 
     class Meta:
         model = Wallet
-        exclude = ('created_at', 'deleted_at', 'uuid', 'updated_at')
+        # balance_minor is internal until every row is backfilled, version
+        # only feeds the ETag
+        exclude = ('created_at', 'deleted_at', 'uuid', 'updated_at', 'balance_minor',
+                   'stripe_count', 'version')
+
+    @timed("serialize_wallet")
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.stripe_count:
+            # The row only holds part of a striped wallet's balance
+            balance = instance.current_balance()
+            data["balance"] = self.fields["balance"].to_representation(balance)
+            data["balance_naira"] = balance * dollar_rate.get()
+        return data
 
     def get_balance_naira(self, obj):
-        naira_value = obj.balance * get_current_dollar_rate()
+        naira_value = obj.balance * dollar_rate.get()
         return naira_value
 
 
@@ -21,7 +81,12 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         exclude = ('deleted_at', 'uuid',
-                   'credit_to', 'debit_to', 'updated_at')
+                   'credit_to', 'debit_to', 'updated_at', 'value_minor')
+        extra_kwargs = {'owner': {'write_only': True}}
+
+    @timed("serialize_transaction")
+    def to_representation(self, instance):
+        return super().to_representation(instance)
 
     def get_transaction_type(self, obj):
         if obj.credit_to and obj.debit_to:
@@ -37,4 +102,21 @@ class TransactionSerializer(serializers.ModelSerializer):
 class GetTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
-        exclude = ('deleted_at', 'uuid', 'updated_at')
+        exclude = ('deleted_at', 'uuid', 'updated_at', 'value_minor')
+        extra_kwargs = {'owner': {'write_only': True}}
+
+    @timed("serialize_transaction")
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
+
+class TransferSerializer(serializers.Serializer):
+    debit_wallet = serializers.IntegerField()
+    credit_wallet = serializers.IntegerField()
+    amount = MoneyField(min_value=Decimal("0.01"))
+    description = serializers.CharField(max_length=100, required=False, allow_blank=True)
+
+
+class TransferBatchSerializer(serializers.Serializer):
+    transfers = TransferSerializer(many=True, allow_empty=False,
+                                   max_length=getattr(settings, "PAYMENTS_MAX_TRANSFERS", 5000))
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from apps.shopping.models import Order
+from .models import bump_wallet_versions
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, **kwargs):
+    # Linking a transaction to an order changes the shopper's `type=order` listing
+    if instance.transaction_id:
+        bump_wallet_versions(user_ids=[instance.shopper_id])
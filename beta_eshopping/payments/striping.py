@@ -0,0 +1,190 @@
+import random
+import threading
+import zlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Mod
+from django.utils import timezone
+
+from .exceptions import InsufficientFunds
+from .models import WALLET_REFRESH_FIELDS, Wallet, WalletStripe
+
+# "random" spreads credits evenly, "thread" keeps every worker thread on one
+# stripe so that with at least as many stripes as workers they never collide
+STRIPE_PICK = getattr(settings, "PAYMENTS_WALLET_STRIPE_PICK", "random")
+ZERO = Decimal("0.00")
+# Upper bound of the keys, any stripe count divides it evenly enough
+STRIPE_KEYS = 2 ** 15
+
+_local = threading.local()
+
+
+def stripe_key():
+    """
+    A number fixed for the current DB transaction of this thread. Every write
+    it makes to a striped wallet goes to stripe `key % stripe_count`, so a
+    funding's balance move, its version bump and its rollup shard share one
+    stripe. Two stripes picked independently would be locked in random order
+    and could deadlock with a concurrent writer.
+    """
+    if STRIPE_PICK == "thread":
+        return zlib.crc32(str(threading.get_ident()).encode()) % STRIPE_KEYS
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return random.randrange(STRIPE_KEYS)
+    # The callback is still queued only in the transaction that drew the
+    # key, after a commit or rollback the next transaction draws a new one
+    if getattr(_local, "key", None) is None or not any(
+            entry[1] is _forget_stripe_key for entry in connection.run_on_commit):
+        _local.key = random.randrange(STRIPE_KEYS)
+        transaction.on_commit(_forget_stripe_key)
+    return _local.key
+
+
+def _forget_stripe_key():
+    _local.key = None
+
+
+def pick_stripe(count):
+    return stripe_key() % count
+
+
+def restripe(wallet_id, count):
+    """
+    Split a wallet's balance across `count` stripes, 0 to turn striping off.
+    Whatever the old stripes hold is moved back to the wallet row first, and
+    their versions too, so the wallet's ETag version never goes back.
+    """
+    with transaction.atomic():
+        wallet = Wallet.objects.select_for_update(no_key=True).get(pk=wallet_id)
+        fold_stripes([wallet])
+        old = WalletStripe.objects.filter(wallet=wallet)
+        versions = old.aggregate(total=Sum("version"))["total"] or 0
+        old.delete()
+        if versions:
+            Wallet.objects.filter(pk=wallet.pk).update(version=F("version") + versions)
+        WalletStripe.objects.bulk_create(
+            [WalletStripe(wallet=wallet, index=i) for i in range(count)])
+        wallet.stripe_count = count
+        wallet.save(update_fields=["balance", "stripe_count", "updated_at"])
+    return wallet
+
+
+def credit_stripe(wallet, money):
+    """Add `money` to one stripe of `wallet`, locking only that stripe."""
+    now = timezone.now()
+    updated = WalletStripe.objects.filter(
+        wallet=wallet, index=pick_stripe(wallet.stripe_count)
+    ).update(
+        balance=F("balance") + money.amount,
+        balance_minor=F("balance_minor") + money.minor,
+        version=F("version") + 1,
+        updated_at=now,
+    )
+    if not updated:
+        # Restriped since `wallet` was loaded, the row takes it instead
+        Wallet.objects.filter(pk=wallet.pk).update(
+            balance=Coalesce(F("balance"), Value(ZERO)) + money.amount,
+            balance_minor=F("balance_minor") + money.minor,
+            version=F("version") + 1,
+            updated_at=now,
+        )
+
+
+def debit_stripes(wallet, money):
+    """
+    Take `money` from the transaction's stripe when it holds enough, else from the
+    wallet row, else fold every stripe into the row under lock and take it
+    from there. Returns True in the last case, when `wallet.balance` is the
+    whole balance again.
+    """
+    amount = money.amount
+    now = timezone.now()
+    if WalletStripe.objects.filter(
+        wallet=wallet, index=pick_stripe(wallet.stripe_count), balance__gte=amount
+    ).update(
+        balance=F("balance") - amount,
+        balance_minor=F("balance_minor") - money.minor,
+        version=F("version") + 1,
+        updated_at=now,
+    ):
+        return False
+    if Wallet.objects.filter(pk=wallet.pk, balance__gte=amount).update(
+        balance=F("balance") - amount,
+        balance_minor=F("balance_minor") - money.minor,
+        version=F("version") + 1,
+        updated_at=now,
+    ):
+        wallet.refresh_from_db(fields=WALLET_REFRESH_FIELDS)
+        return False
+
+    locked = Wallet.objects.select_for_update(no_key=True).get(pk=wallet.pk)
+    fold_stripes([locked])
+    balance = locked.balance or ZERO
+    if balance < amount:
+        raise InsufficientFunds()
+    locked.balance = balance - amount
+    locked.save(update_fields=["balance", "updated_at"])
+    for field in WALLET_REFRESH_FIELDS:
+        setattr(wallet, field, getattr(locked, field))
+    return True
+
+
+def fold_stripes(wallets):
+    """
+    Move the stripes of locked, striped `wallets` into their `balance`, in
+    memory, and empty the stripes. The caller must write the balances of the
+    returned wallet ids back in the same DB transaction.
+
+    Lock the wallets with `select_for_update(no_key=True)`: a credit holds
+    its stripe while its ledger entry takes a key share lock on the wallet,
+    which a plain FOR UPDATE would deadlock with.
+    """
+    striped = {wallet.pk: wallet for wallet in wallets if wallet.stripe_count}
+    if not striped:
+        return set()
+    # Wallets are locked first, then their stripes, always in this order
+    stripes = list(
+        WalletStripe.objects.select_for_update().filter(wallet_id__in=striped)
+        .order_by("wallet_id", "index")
+    )
+    for stripe in stripes:
+        wallet = striped[stripe.wallet_id]
+        wallet.balance = (wallet.balance or ZERO) + stripe.balance
+    WalletStripe.objects.filter(pk__in=[s.pk for s in stripes if s.balance]).update(
+        balance=ZERO, balance_minor=0, updated_at=timezone.now())
+    for wallet in striped.values():
+        wallet.sync_balance_minor()
+    return set(striped)
+
+
+def stripe_balance():
+    """Expression of the stripes' total, for annotating Wallet querysets."""
+    totals = (
+        WalletStripe.objects.filter(wallet=OuterRef("pk"))
+        .values("wallet").annotate(total=Sum("balance")).values("total")
+    )
+    return Coalesce(Subquery(totals), Value(ZERO))
+
+
+def stripe_versions():
+    """Expression of the sum of the stripes' versions, part of the wallet's ETag."""
+    totals = (
+        WalletStripe.objects.filter(wallet=OuterRef("pk"))
+        .values("wallet").annotate(total=Sum("version")).values("total")
+    )
+    return Coalesce(Subquery(totals), Value(0))
+
+
+def bump_stripe_versions(wallets):
+    """
+    Bump one stripe of each striped wallet in `wallets`, a Wallet queryset:
+    the one `credit_stripe` and `debit_stripes` use in this transaction.
+    """
+    WalletStripe.objects.filter(
+        wallet__in=wallets.filter(stripe_count__gt=0),
+        index=Mod(Value(stripe_key()), F("wallet__stripe_count")),
+    ).update(version=F("version") + 1)
@@ -0,0 +1,45 @@
+from model_bakery import baker
+from django.conf import settings
+from django.db import connection
+from django.db.models import signals
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from apps.payments.models import Transaction, TransactionStatus, Wallet
+
+
+class PaymentsAdminQueryCountTest(TestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.admin_user = baker.make(settings.AUTH_USER_MODEL, is_staff=True,
+                                     is_superuser=True, is_active=True)
+        self.client.force_login(self.admin_user)
+
+    def _add_rows(self, count):
+        for _ in range(count):
+            wallet = Wallet.objects.create(user=baker.make(settings.AUTH_USER_MODEL))
+            baker.make(Transaction, credit_to=wallet, status=TransactionStatus.SUCCESSFUL)
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for name in ("admin:payments_transaction_changelist",
+                     "admin:payments_wallet_changelist"):
+            url = reverse(name)
+            self._add_rows(2)
+            baseline = self._queries(url)
+            self._add_rows(10)
+            self.assertEqual(self._queries(url), baseline, name)
+
+    def test_wallet_filter_by_email(self):
+        self._add_rows(3)
+        wallet = Wallet.objects.select_related("user").first()
+        response = self.client.get(
+            reverse("admin:payments_transaction_changelist"),
+            {"credit_to_email": wallet.user.email})
+        self.assertEqual(response.context["cl"].result_count, 1)
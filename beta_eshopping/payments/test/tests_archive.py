@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from model_bakery import baker
+from django.conf import settings
+from django.db.models import signals
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from apps.payments.archive import archive_transactions
+from apps.payments.models import (
+    ArchivedTransaction, LedgerEntry, Transaction, TransactionStatus, Wallet,
+)
+
+
+class ArchiveTransactionsTest(APITestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        self.wallet = Wallet.objects.create(user=self.user)
+        self.client.force_authenticate(self.user)
+
+        self.old = self._create("BESW-old", TransactionStatus.SUCCESSFUL)
+        Transaction.objects.filter(pk=self.old.pk).update(
+            created_at=timezone.now() - timedelta(days=800))
+        self.old_pending = self._create("BESW-old-pending", TransactionStatus.PENDING)
+        Transaction.objects.filter(pk=self.old_pending.pk).update(
+            created_at=timezone.now() - timedelta(days=800))
+        self.recent = self._create("BESW-recent", TransactionStatus.SUCCESSFUL)
+
+    def _create(self, reference, status):
+        return Transaction.objects.create(
+            value=10, status=status, reference=reference, credit_to=self.wallet,
+            owner=self.user, description="Funded wallet with 10")
+
+    def test_old_settled_transactions_are_moved(self):
+        self.wallet.deposit(10, related_transaction=self.old)
+        self.assertEqual(archive_transactions(retention_days=730, batch_size=1), 1)
+
+        self.assertFalse(Transaction.objects.filter(pk=self.old.pk).exists())
+        archived = ArchivedTransaction.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.reference, "BESW-old")
+        self.assertTrue(Transaction.objects.filter(pk=self.old_pending.pk).exists())
+        # Ledger entries keep pointing at the archived id
+        self.assertTrue(LedgerEntry.objects.filter(transaction_id=self.old.pk).exists())
+
+    def test_listing_includes_archived_rows(self):
+        archive_transactions(retention_days=730)
+        url = reverse("payments:user-transactions")
+
+        response = self.client.get(url)
+        self.assertEqual([row["reference"] for row in response.data],
+                         ["BESW-recent", "BESW-old-pending", "BESW-old"])
+
+        response = self.client.get(url, {"page_size": 2})
+        response = self.client.get(url, {"page_size": 2, "cursor": response.data["next"]})
+        self.assertEqual([row["reference"] for row in response.data["results"]], ["BESW-old"])
+
+        response = self.client.get(url, {"archived": "false"})
+        self.assertEqual(len(response.data), 2)
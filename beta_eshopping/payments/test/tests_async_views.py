@@ -0,0 +1,105 @@
+import json
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from model_bakery import baker
+from django.conf import settings
+from django.db.models import signals
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.throttling import BaseThrottle
+from apps.payments.async_views import AsyncTransactionListAPIView, AsyncWalletAPIView
+from apps.payments.fake_gateway import FakeFlutterwaveGateway
+from apps.payments.gateway import AsyncFlutterwaveClient, set_async_gateway_client
+from apps.payments.models import Transaction, TransactionStatus, Wallet
+from apps.payments.views import TransactionListAPIView, WalletAPIView
+
+
+class DenyThrottle(BaseThrottle):
+
+    def allow_request(self, request, view):
+        return False
+
+    def wait(self):
+        return 7
+
+
+class AsyncViewsTest(TestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        self.wallet = Wallet.objects.create(user=self.user, balance=0)
+        self.factory = APIRequestFactory()
+        for i in range(3):
+            Transaction.objects.create(
+                value=10, status=TransactionStatus.SUCCESSFUL, reference=f"BESW-{i}",
+                credit_to=self.wallet, owner=self.user, description="Funded wallet with 10")
+
+    def _request(self, method, path, data=None):
+        request = getattr(self.factory, method)(path, data, format="json")
+        force_authenticate(request, self.user)
+        return request
+
+    async def test_list_matches_sync_view(self):
+        url = reverse("payments:user-transactions")
+        params = {"type": "wallet", "page_size": 2}
+        response = await AsyncTransactionListAPIView.as_view()(self._request("get", url, params))
+
+        # The ORM refuses to run straight from the event loop
+        @sync_to_async
+        def sync_view():
+            return TransactionListAPIView.as_view()(self._request("get", url, params)).render()
+
+        sync_response = await sync_view()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, sync_response.content)
+
+    async def _compare(self, async_view, sync_view, request):
+        response = await async_view(request)
+
+        @sync_to_async
+        def sync_response():
+            return sync_view(request).render()
+
+        expected = await sync_response()
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    async def test_unauthenticated(self):
+        request = self.factory.get(reverse("payments:user-transactions"))
+        response = await self._compare(AsyncTransactionListAPIView.as_view(),
+                                       TransactionListAPIView.as_view(), request)
+        self.assertIn(response.status_code, (401, 403))
+
+    async def test_throttled_like_sync_view(self):
+        response = await self._compare(
+            AsyncWalletAPIView.as_view(throttle_classes=[DenyThrottle]),
+            WalletAPIView.as_view(throttle_classes=[DenyThrottle]),
+            self._request("get", reverse("payments:user-wallet")))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "7")
+
+    async def test_method_not_allowed_like_sync_view(self):
+        response = await self._compare(
+            AsyncTransactionListAPIView.as_view(), TransactionListAPIView.as_view(),
+            self._request("delete", reverse("payments:user-transactions")))
+        self.assertEqual(response.status_code, 405)
+
+    async def test_wallet_funding(self):
+        with FakeFlutterwaveGateway(amount=10) as gateway:
+            set_async_gateway_client(
+                lambda: AsyncFlutterwaveClient(base_url=gateway.url, secret_key="test"))
+            try:
+                response = await AsyncWalletAPIView.as_view()(self._request(
+                    "post", reverse("payments:user-wallet"),
+                    {"transaction_id": 321, "dollar_value": 10}))
+            finally:
+                set_async_gateway_client(None)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.content)["status"], TransactionStatus.SUCCESSFUL)
+        wallet = await Wallet.objects.aget(pk=self.wallet.pk)
+        self.assertEqual(wallet.balance, Decimal("10.00"))
@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+from model_bakery import baker
+from django.conf import settings
+from django.db.models import signals
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from apps.payments.events import process_events
+from apps.payments.fake_gateway import FakeFlutterwaveGateway
+from apps.payments.gateway import FlutterwaveClient, set_gateway_client
+from apps.payments.models import (
+    PaymentEvent, PaymentEventStatus, Transaction, TransactionStatus, Wallet,
+)
+
+
+@override_settings(FLUTTERWAVE_WEBHOOK_HASH="secret-hash")
+class FlutterwaveWebhookTest(APITestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL, email="payer@example.com")
+        self.wallet = Wallet.objects.create(user=self.user, balance=0)
+        self.url = reverse("payments:flutterwave-webhook")
+        self.payload = {
+            "event": "charge.completed",
+            "data": {"id": 4321, "customer": {"email": "payer@example.com"},
+                     "meta": {"purpose": "wallet_funding", "dollar_value": "20.00"}},
+        }
+        self.gateway = FakeFlutterwaveGateway(amount=20).start()
+        set_gateway_client(FlutterwaveClient(base_url=self.gateway.url, secret_key="test"))
+
+    def tearDown(self):
+        set_gateway_client(None)
+        self.gateway.stop()
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.client.post(self.url, self.payload, format="json",
+                                    HTTP_VERIF_HASH="wrong")
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_event_is_queued_without_calling_gateway(self):
+        response = self.client.post(self.url, self.payload, format="json",
+                                    HTTP_VERIF_HASH="secret-hash")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PaymentEvent.objects.get().status, PaymentEventStatus.PENDING)
+        self.assertEqual(self.gateway.requests, 0)
+
+    def test_worker_applies_event_once(self):
+        self.client.post(self.url, self.payload, format="json",
+                         HTTP_VERIF_HASH="secret-hash")
+        self.client.post(self.url, self.payload, format="json",
+                         HTTP_VERIF_HASH="secret-hash")
+        self.assertEqual(process_events(), 2)
+
+        self.assertFalse(PaymentEvent.objects.exclude(
+            status=PaymentEventStatus.PROCESSED).exists())
+        txn = Transaction.objects.get(payment_provider_txn_id="4321")
+        self.assertEqual(txn.status, TransactionStatus.SUCCESSFUL)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("20.00"))
+
+    def _process(self, payload):
+        self.client.post(self.url, payload, format="json", HTTP_VERIF_HASH="secret-hash")
+        process_events()
+        return PaymentEvent.objects.get()
+
+    def test_unmatched_charge_is_parked(self):
+        self.payload["data"]["meta"] = {}
+        event = self._process(self.payload)
+        self.assertEqual(event.status, PaymentEventStatus.PARKED)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(self.gateway.requests, 0)
+
+    def test_unknown_customer_fails_without_retrying(self):
+        self.payload["data"]["customer"]["email"] = "nobody@example.com"
+        event = self._process(self.payload)
+        self.assertEqual((event.status, event.attempts), (PaymentEventStatus.FAILED, 1))
+        self.assertEqual(self.gateway.requests, 0)
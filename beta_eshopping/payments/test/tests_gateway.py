@@ -0,0 +1,70 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+from apps.payments.exceptions import PaymentGatewayUnavailable, PaymentVerificationFailed
+from apps.payments.fake_gateway import FakeFlutterwaveGateway
+from apps.payments.gateway import CircuitBreaker, FlutterwaveClient
+
+
+class FlutterwaveClientTest(SimpleTestCase):
+
+    def test_verify_transaction(self):
+        with FakeFlutterwaveGateway(amount=250) as gateway:
+            client = FlutterwaveClient(base_url=gateway.url, secret_key="test")
+            response = client.verify_transaction(1234)
+        self.assertEqual(response["data"]["id"], 1234)
+        self.assertEqual(response["data"]["amount"], 250)
+        self.assertEqual(response["data"]["status"], "successful")
+
+    def test_read_timeout_raises_unavailable(self):
+        with FakeFlutterwaveGateway(latency=0.5) as gateway:
+            client = FlutterwaveClient(base_url=gateway.url, secret_key="test",
+                                       read_timeout=0.1, retries=0)
+            with self.assertRaises(PaymentGatewayUnavailable):
+                client.verify_transaction(1)
+
+    def test_server_errors_are_retried(self):
+        with FakeFlutterwaveGateway(fail_with=503) as gateway:
+            client = FlutterwaveClient(base_url=gateway.url, secret_key="test",
+                                       retries=2, backoff_factor=0.01)
+            with self.assertRaises(PaymentGatewayUnavailable):
+                client.verify_transaction(1)
+            self.assertEqual(gateway.requests, 3)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        with FakeFlutterwaveGateway(fail_with=500) as gateway:
+            breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+            client = FlutterwaveClient(base_url=gateway.url, secret_key="test",
+                                       retries=0, breaker=breaker)
+            for _ in range(2):
+                with self.assertRaises(PaymentGatewayUnavailable):
+                    client.verify_transaction(1)
+            self.assertTrue(breaker.is_open)
+
+            with self.assertRaises(PaymentGatewayUnavailable):
+                client.verify_transaction(1)
+            # The open circuit short-circuits without reaching the gateway
+            self.assertEqual(gateway.requests, 2)
+
+    def test_client_errors_raise_verification_failed(self):
+        with FakeFlutterwaveGateway(fail_with=404) as gateway:
+            breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+            client = FlutterwaveClient(base_url=gateway.url, secret_key="test",
+                                       retries=0, breaker=breaker)
+            with self.assertRaises(PaymentVerificationFailed) as raised:
+                client.verify_transaction(1)
+        self.assertEqual(raised.exception.status_code, 404)
+        self.assertFalse(breaker.is_open)
+
+    def test_rate_limiting_counts_as_failure(self):
+        with FakeFlutterwaveGateway(fail_with=429) as gateway:
+            breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+            client = FlutterwaveClient(base_url=gateway.url, secret_key="test",
+                                       retries=0, breaker=breaker)
+            with self.assertRaises(PaymentGatewayUnavailable):
+                client.verify_transaction(1)
+        self.assertTrue(breaker.is_open)
+
+    @override_settings(FLUTTERWAVE_SECRET_KEY="")
+    def test_missing_secret_key_is_a_configuration_error(self):
+        with self.assertRaises(ImproperlyConfigured):
+            FlutterwaveClient(base_url="http://localhost")
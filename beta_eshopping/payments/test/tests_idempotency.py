@@ -0,0 +1,87 @@
+from decimal import Decimal
+from unittest import mock
+
+from model_bakery import baker
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import signals
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from apps.payments.fake_gateway import FakeFlutterwaveGateway
+from apps.payments.gateway import FlutterwaveClient, set_gateway_client
+from apps.payments.idempotency import claim
+from apps.payments.models import IdempotencyRecord, Transaction, TransactionStatus, Wallet
+
+
+class WalletFundingIdempotencyTest(APITestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        self.wallet = Wallet.objects.create(user=self.user, balance=0)
+        self.client.force_authenticate(self.user)
+        self.url = reverse("payments:user-wallet")
+        self.gateway = FakeFlutterwaveGateway(amount=10).start()
+        set_gateway_client(FlutterwaveClient(base_url=self.gateway.url, secret_key="test"))
+
+    def tearDown(self):
+        set_gateway_client(None)
+        self.gateway.stop()
+
+    def test_retry_replays_stored_response(self):
+        data = {"transaction_id": 987, "dollar_value": 10}
+        first = self.client.post(self.url, data, format="json")
+        second = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data["reference"], first.data["reference"])
+        self.assertEqual(self.gateway.requests, 1)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("10.00"))
+
+    def test_idempotency_key_header(self):
+        self.client.post(self.url, {"transaction_id": 1, "dollar_value": 10},
+                         format="json", HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertTrue(IdempotencyRecord.objects.filter(
+            key=f"user:{self.user.pk}:abc").exists())
+
+    def test_gateway_outage_is_not_stored(self):
+        self.gateway.fail_with = 503
+        response = self.client.post(
+            self.url, {"transaction_id": 55, "dollar_value": 10}, format="json")
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_pending_payment_is_verified_again(self):
+        data = {"transaction_id": 77, "dollar_value": 10}
+        self.gateway.status = "pending"
+        self.assertEqual(self.client.post(self.url, data, format="json").status_code, 502)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+        self.gateway.status = "successful"
+        self.assertEqual(self.client.post(self.url, data, format="json").status_code, 201)
+        self.assertEqual(Transaction.objects.get().status, TransactionStatus.SUCCESSFUL)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("10.00"))
+
+
+class ClaimTest(TestCase):
+
+    def test_key_released_between_attempts_is_claimed_again(self):
+        create = IdempotencyRecord.objects.create
+        calls = []
+
+        def racing_create(**kwargs):
+            # The first attempt loses to a request that then releases the key
+            if not calls:
+                calls.append(kwargs)
+                raise IntegrityError("duplicate key")
+            return create(**kwargs)
+
+        with mock.patch.object(IdempotencyRecord.objects, "create", side_effect=racing_create):
+            record, created = claim("user:1:wallet:1")
+        self.assertTrue(created)
+        self.assertEqual(record.key, "user:1:wallet:1")
@@ -0,0 +1,62 @@
+from model_bakery import baker
+from django.conf import settings
+from django.db.models import signals
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from apps.payments import instrumentation
+from apps.payments.models import Wallet
+
+
+class InstrumentationTest(TestCase):
+
+    def setUp(self):
+        instrumentation.reset()
+
+    def test_disabled_records_nothing(self):
+        with override_settings(PAYMENTS_METRICS_ENABLED=False):
+            with instrumentation.phase("process_payment"):
+                pass
+        self.assertEqual(instrumentation.render_prometheus(), "\n")
+
+    @override_settings(PAYMENTS_METRICS_ENABLED=True)
+    def test_histogram_exposition(self):
+        instrumentation.observe("payments_phase_seconds", 0.003, phase="wallet_deposit")
+        instrumentation.observe("payments_phase_seconds", 2, phase="wallet_deposit")
+        body = instrumentation.render_prometheus()
+        self.assertIn('payments_phase_seconds_bucket{phase="wallet_deposit",le="0.0025"} 0', body)
+        self.assertIn('payments_phase_seconds_bucket{phase="wallet_deposit",le="0.005"} 1', body)
+        self.assertIn('payments_phase_seconds_bucket{phase="wallet_deposit",le="+Inf"} 2', body)
+        self.assertIn('payments_phase_seconds_count{phase="wallet_deposit"} 2', body)
+
+
+@override_settings(PAYMENTS_METRICS_ENABLED=True, PAYMENTS_METRICS_TOKEN="scrape")
+class PaymentsMetricsViewTest(APITestCase):
+
+    def setUp(self):
+        instrumentation.reset()
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        Wallet.objects.create(user=self.user)
+        self.client.force_authenticate(self.user)
+
+    def test_requests_are_counted(self):
+        self.client.get(reverse("payments:user-transactions"))
+        response = self.client.get(reverse("payments:payments-metrics"),
+                                   HTTP_AUTHORIZATION="Bearer scrape")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(
+            'payments_request_queries_count{endpoint="TransactionListAPIView",method="GET"} 1',
+            body)
+        self.assertIn('phase="serialize_transaction_rows"', body)
+
+    def test_token_is_required(self):
+        response = self.client.get(reverse("payments:payments-metrics"))
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(PAYMENTS_METRICS_TOKEN=None)
+    def test_unset_token_denies_everyone(self):
+        response = self.client.get(reverse("payments:payments-metrics"),
+                                   HTTP_AUTHORIZATION="Bearer None")
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,55 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from model_bakery import baker
+from django.conf import settings
+from django.db.models import Sum, signals
+from django.test import TestCase
+from django.utils import timezone
+from apps.payments.ledger import (
+    balance_at, mismatched_wallets, open_balances, statement, take_snapshots,
+)
+from apps.payments.models import LedgerEntry, Wallet, WalletBalanceSnapshot
+
+
+class LedgerTest(TestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        self.wallet = Wallet.objects.create(user=self.user, balance=0)
+
+    def test_every_movement_is_double_entry(self):
+        self.wallet.deposit(100)
+        self.wallet.withdraw(30)
+        self.assertEqual(LedgerEntry.objects.count(), 4)
+        self.assertEqual(LedgerEntry.objects.aggregate(total=Sum("amount"))["total"], 0)
+        last = LedgerEntry.objects.filter(wallet=self.wallet).latest("id")
+        self.assertEqual(last.balance_after, Decimal("70.00"))
+
+    def test_snapshot_plus_tail(self):
+        self.wallet.deposit(100)
+        self.assertEqual(take_snapshots(), 1)
+        self.wallet.deposit(5)
+        self.assertEqual(WalletBalanceSnapshot.objects.get().balance, Decimal("100.00"))
+        self.assertEqual(balance_at(self.wallet), Decimal("105.00"))
+        self.assertFalse(mismatched_wallets().exists())
+
+    def test_statement(self):
+        start = timezone.now() - timedelta(seconds=1)
+        self.wallet.deposit(10)
+        self.wallet.deposit(20)
+        opening, entries = statement(self.wallet, start, timezone.now())
+        self.assertEqual(opening, Decimal("0.00"))
+        self.assertEqual([e.amount for e in entries], [Decimal("10.00"), Decimal("20.00")])
+
+    def test_verifier_flags_untracked_balance_changes(self):
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=50)
+        self.assertEqual(list(mismatched_wallets()), [self.wallet])
+
+    def test_opening_balances(self):
+        other = Wallet.objects.create(
+            user=baker.make(settings.AUTH_USER_MODEL), balance=75)
+        self.assertEqual(open_balances(), 2)
+        self.assertEqual(balance_at(other), Decimal("75.00"))
+        self.assertFalse(mismatched_wallets().exists())
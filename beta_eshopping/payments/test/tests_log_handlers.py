@@ -0,0 +1,72 @@
+import logging
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+from apps.payments.log_handlers import BatchedDatabaseLogHandler
+
+
+class CollectingHandler(BatchedDatabaseLogHandler):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def write(self, rows):
+        self.release.wait(5)
+        self.batches.append(rows)
+
+
+class BatchedDatabaseLogHandlerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("tests.db")
+        self.logger.propagate = False
+
+    def _attach(self, handler):
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+        return handler
+
+    def test_records_are_written_in_batches(self):
+        handler = self._attach(CollectingHandler(batch_size=50, flush_interval=0.2))
+        for i in range(120):
+            self.logger.warning("failure %s", i)
+        handler.flush()
+
+        rows = [row for batch in handler.batches for row in batch]
+        self.assertEqual(len(rows), 120)
+        self.assertLessEqual(max(len(batch) for batch in handler.batches), 50)
+        self.assertEqual(rows[0]["msg"], "failure 0")
+        self.assertEqual(handler.stats()["written"], 120)
+
+    def test_exception_trace_is_captured(self):
+        handler = self._attach(CollectingHandler(flush_interval=0.05))
+        try:
+            raise ValueError("gateway down")
+        except ValueError as e:
+            self.logger.exception(e)
+        handler.flush()
+        self.assertIn("ValueError: gateway down", handler.batches[0][0]["trace"])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = self._attach(CollectingHandler(capacity=5, batch_size=1, flush_interval=0.01))
+        handler.release.clear()
+        for i in range(50):
+            self.logger.error("failure %s", i)
+        stats = handler.stats()
+        handler.release.set()
+        handler.flush()
+        self.assertGreater(stats["dropped"], 0)
+        self.assertEqual(stats["queued"] + stats["dropped"], 50)
+
+    def test_failed_write_goes_to_handle_error(self):
+        handler = self._attach(CollectingHandler(flush_interval=0.01))
+        handler.write = mock.Mock(side_effect=RuntimeError("database gone"))
+        with mock.patch.object(handler, "handleError") as handle_error:
+            self.logger.error("failure")
+            handler.flush()
+        self.assertEqual(handler.stats()["failed"], 1)
+        record = handle_error.call_args[0][0]
+        self.assertEqual(record.getMessage(), "CollectingHandler: dropped 1 records")
@@ -0,0 +1,101 @@
+import io
+from decimal import ROUND_HALF_UP, Decimal
+
+from model_bakery import baker
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import signals
+from django.test import SimpleTestCase, TestCase
+from apps.payments.models import Transaction, TransactionStatus, Wallet
+from apps.payments.money import Money, format_minor, to_minor
+from apps.payments.serializers import MoneyField, TransferSerializer
+from apps.payments.utils import process_payment
+
+
+class MoneyTest(SimpleTestCase):
+
+    def test_minor_units(self):
+        self.assertEqual(to_minor("10.5"), 1050)
+        self.assertEqual(to_minor(Decimal("1500"), "JPY"), 1500)
+        self.assertEqual(Money.of("0.30") + Money.of("0.45"), Money(75))
+        self.assertEqual(Money(123450).amount, Decimal("1234.50"))
+        with self.assertRaises(ValueError):
+            to_minor("0.001")
+        self.assertEqual(to_minor("10.50", "XOF", rounding=ROUND_HALF_UP), 11)
+
+    def test_currencies_are_not_mixed(self):
+        with self.assertRaises(ValueError):
+            Money(100, "USD") + Money(100, "NGN")
+
+    def test_formatting_matches_decimal_field(self):
+        for minor in (0, 5, -5, 100, 123456789):
+            self.assertEqual(format_minor(minor), str(Decimal(minor) / 100))
+        self.assertEqual(MoneyField().to_representation(Decimal("7.1")), "7.10")
+
+    def test_transfer_amount_is_validated_as_money(self):
+        data = {"debit_wallet": 1, "credit_wallet": 2}
+        serializer = TransferSerializer(data={**data, "amount": "10.005"})
+        self.assertFalse(serializer.is_valid())
+        serializer = TransferSerializer(data={**data, "amount": "10.05"})
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data["amount"], Money(1005))
+
+
+class MinorUnitColumnsTest(TestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.wallet = Wallet.objects.create(
+            user=baker.make(settings.AUTH_USER_MODEL), balance=100)
+
+    def test_balance_minor_follows_balance(self):
+        self.assertEqual(self.wallet.balance_minor, 10000)
+        self.wallet.deposit("25.50")
+        self.wallet.withdraw(Money(550))
+        self.wallet.withdraw(10, lock=True)
+        wallet = Wallet.objects.get(pk=self.wallet.pk)
+        self.assertEqual((wallet.balance, wallet.balance_minor), (Decimal("110.00"), 11000))
+
+    def test_value_minor_is_set_on_save(self):
+        txn = baker.make(Transaction, value=Decimal("12.34"), currency="USD",
+                         status=TransactionStatus.PENDING)
+        self.assertEqual(txn.value_minor, 1234)
+        txn.value = Decimal("1.00")
+        txn.save(update_fields=["value"])
+        self.assertEqual(Transaction.objects.get(pk=txn.pk).value_minor, 100)
+
+    def test_value_minor_of_zero_exponent_currency(self):
+        txn = baker.make(Transaction, value=Decimal("1500.50"), currency="XOF",
+                         status=TransactionStatus.PENDING)
+        self.assertEqual((txn.value_minor, txn.money), (1501, Money(1501, "XOF")))
+
+    def test_dollar_values_are_recorded_in_dollars(self):
+        payment_verify = {"data": {"id": 7, "tx_ref": "FLW-7", "amount": 15000,
+                                   "currency": "NGN", "status": "successful"}}
+        data = process_payment({"dollar_value": "10.00"}, payment_verify=payment_verify)
+        self.assertEqual((data["value"], data["currency"]), ("10.00", "USD"))
+        data = process_payment({}, payment_verify=payment_verify)
+        self.assertEqual((data["value"], data["currency"]), (15000, "NGN"))
+
+    def test_backfill_fills_missing_minor_units(self):
+        txn = baker.make(Transaction, value=Decimal("12.34"), currency="USD",
+                         status=TransactionStatus.PENDING)
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance_minor=None)
+        Transaction.objects.filter(pk=txn.pk).update(value_minor=None)
+
+        call_command("backfill_minor_units", stdout=io.StringIO())
+        # Deposits after the backfill keep the column exact
+        self.wallet.deposit("0.01")
+
+        self.assertEqual(Wallet.objects.get(pk=self.wallet.pk).balance_minor, 10001)
+        self.assertEqual(Transaction.objects.get(pk=txn.pk).value_minor, 1234)
+        call_command("backfill_minor_units", verify=True, stdout=io.StringIO())
+
+    def test_backfill_rounds_like_save(self):
+        txn = baker.make(Transaction, value=Decimal("1500.50"), currency="XOF",
+                         status=TransactionStatus.PENDING)
+        Transaction.objects.filter(pk=txn.pk).update(value_minor=None)
+
+        call_command("backfill_minor_units", stdout=io.StringIO())
+        self.assertEqual(Transaction.objects.get(pk=txn.pk).value_minor, 1501)
+        call_command("backfill_minor_units", verify=True, stdout=io.StringIO())
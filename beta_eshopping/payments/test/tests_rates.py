@@ -0,0 +1,85 @@
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from apps.payments.models import ExchangeRate
+from apps.payments.rates import CachedRate, RateTable
+
+
+class CachedRateTest(SimpleTestCase):
+
+    def test_fresh_value_is_served_from_cache(self):
+        fetch = mock.Mock(return_value=1500)
+        rate = CachedRate(fetch, ttl=60)
+        self.assertEqual(rate.get(), 1500)
+        self.assertEqual(rate.get(), 1500)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(rate.stats()["misses"], 1)
+        self.assertEqual(rate.stats()["hits"], 1)
+
+    def test_stale_value_is_served_while_refreshing(self):
+        release = threading.Event()
+        values = iter([1500, 1600])
+
+        def fetch():
+            value = next(values)
+            if value == 1600:
+                release.wait(5)
+            return value
+
+        rate = CachedRate(fetch, ttl=0)
+        self.assertEqual(rate.get(), 1500)
+        # Both calls return immediately with the stale value and only one
+        # background refresh is started
+        self.assertEqual(rate.get(), 1500)
+        self.assertEqual(rate.get(), 1500)
+        release.set()
+        for _ in range(50):
+            if rate.stats()["refreshes"] == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(rate.stats()["refreshes"], 2)
+        self.assertEqual(rate.get(), 1600)
+
+    def test_failed_refresh_keeps_stale_value(self):
+        fetch = mock.Mock(side_effect=[1500, Exception("rate API down")])
+        rate = CachedRate(fetch, ttl=0)
+        rate.get()
+        self.assertEqual(rate.get(), 1500)
+        for _ in range(50):
+            if rate.stats()["refresh_errors"]:
+                break
+            time.sleep(0.01)
+        self.assertEqual(rate.stats()["refresh_errors"], 1)
+        self.assertEqual(rate.get(), 1500)
+
+
+class RateTableTest(TestCase):
+
+    def setUp(self):
+        ExchangeRate.objects.create(base="USD", quote="NGN", rate=Decimal("1500"))
+        ExchangeRate.objects.create(base="EUR", quote="USD", rate=Decimal("1.10"))
+        self.table = RateTable(ttl=60)
+
+    def test_pairs_are_resolved_directly_inverted_and_through_usd(self):
+        self.assertEqual(self.table.rate("USD", "NGN"), Decimal("1500"))
+        self.assertEqual(self.table.rate("USD", "USD"), Decimal(1))
+        self.assertEqual(self.table.rate("EUR", "NGN"), Decimal("1650"))
+        self.assertIsNone(self.table.rate("GBP", "NGN"))
+
+    def test_list_conversion_looks_up_each_pair_once(self):
+        items = [(10, "USD"), ("2.50", "EUR"), (None, "USD"), (1, "GBP"), (4, None)] * 50
+        with self.assertNumQueries(1):
+            converted = self.table.convert_many(items, "NGN")
+        self.assertEqual(converted[:5], [
+            Decimal("15000.00"), Decimal("4125.00"), None, None, Decimal("6000.00")])
+        with self.assertNumQueries(0):
+            self.table.convert_many(items, "NGN")
+        self.assertEqual(self.table.stats()["misses"], 3)
+
+    def test_fallback_rate(self):
+        ExchangeRate.objects.all().delete()
+        table = RateTable(fallbacks={("USD", "NGN"): lambda: 1400})
+        self.assertEqual(table.rate("NGN", "USD"), 1 / Decimal(1400))
@@ -0,0 +1,111 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from model_bakery import baker
+from django.conf import settings
+from django.db.models import signals
+from django.test import TestCase
+from django.utils import timezone
+from apps.payments.fake_gateway import FakeFlutterwaveGateway
+from apps.payments.gateway import FlutterwaveClient
+from apps.payments.ledger import mismatched_wallets
+from apps.payments.models import Transaction, TransactionStatus, Wallet
+from apps.payments.reconciliation import reconcile_stale_pending, settle_transactions
+
+
+class SettleTransactionsTest(TestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.wallet = Wallet.objects.create(
+            user=baker.make(settings.AUTH_USER_MODEL), balance=0)
+
+    def _pending(self, reference, value, **kwargs):
+        return Transaction.objects.create(
+            value=value, status=TransactionStatus.PENDING, reference=reference,
+            description="Admin adjustment", **kwargs)
+
+    def test_credits_and_debits_are_aggregated(self):
+        self._pending("R1", 50, credit_to=self.wallet)
+        self._pending("R2", 30, credit_to=self.wallet)
+        self._pending("R3", 60, debit_to=self.wallet)
+
+        outcomes = settle_transactions(references=["R1", "R2", "R3", "missing"])
+
+        self.assertEqual(
+            {outcome.reference: outcome.ok for outcome in outcomes},
+            {"R1": True, "R2": True, "R3": True, "missing": False})
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("20.00"))
+        self.assertEqual(Transaction.objects.filter(
+            status=TransactionStatus.SUCCESSFUL, reference__startswith="BESW-").count(), 3)
+        self.assertFalse(mismatched_wallets().exists())
+
+    def test_insufficient_funds_leaves_transaction_pending(self):
+        txn = self._pending("R1", 10, debit_to=self.wallet)
+        outcomes = settle_transactions(references=["R1"])
+        self.assertFalse(outcomes[0].ok)
+        txn.refresh_from_db()
+        self.assertEqual(txn.status, TransactionStatus.PENDING)
+
+    def test_already_settled_is_skipped(self):
+        txn = self._pending("R1", 10, credit_to=self.wallet)
+        settle_transactions(ids=[txn.pk])
+        outcomes = settle_transactions(ids=[txn.pk])
+        self.assertFalse(outcomes[0].ok)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("10.00"))
+
+
+class ReconcileStalePendingTest(TestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.wallet = Wallet.objects.create(
+            user=baker.make(settings.AUTH_USER_MODEL), balance=0)
+        self.txn = Transaction.objects.create(
+            value=25, status=TransactionStatus.PENDING, reference="FLW-1",
+            payment_provider_txn_id="1", credit_to=self.wallet,
+            description="Funded wallet with 25")
+        Transaction.objects.filter(pk=self.txn.pk).update(
+            created_at=timezone.now() - timedelta(hours=1))
+
+    def test_successful_payments_are_settled(self):
+        with FakeFlutterwaveGateway(amount=25) as gateway:
+            client = FlutterwaveClient(base_url=gateway.url, secret_key="test")
+            stats = reconcile_stale_pending(timedelta(minutes=30), workers=4, client=client)
+
+        self.assertEqual(stats.summary()["settled"], 1)
+        self.txn.refresh_from_db()
+        self.assertEqual(self.txn.status, TransactionStatus.SUCCESSFUL)
+        self.assertEqual(self.txn.reference, "BESW-FLW-1")
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("25.00"))
+
+    def test_mismatched_amount_or_currency_is_left_pending(self):
+        for options in ({"amount": 2}, {"amount": 25, "currency": "XOF"}):
+            with FakeFlutterwaveGateway(**options) as gateway:
+                client = FlutterwaveClient(base_url=gateway.url, secret_key="test")
+                stats = reconcile_stale_pending(timedelta(minutes=30), client=client)
+            self.assertEqual((stats.settled, stats.mismatched), (0, 1))
+        self.txn.refresh_from_db()
+        self.assertEqual(self.txn.status, TransactionStatus.PENDING)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("0.00"))
+
+    def test_failed_payments_record_reason(self):
+        with FakeFlutterwaveGateway(status="failure") as gateway:
+            client = FlutterwaveClient(base_url=gateway.url, secret_key="test")
+            stats = reconcile_stale_pending(timedelta(minutes=30), client=client)
+
+        self.assertEqual(stats.summary()["failed"], 1)
+        self.txn.refresh_from_db()
+        self.assertEqual(self.txn.status, TransactionStatus.FAILED)
+        self.assertEqual(self.txn.reason_for_failure, "Declined")
+
+    def test_recent_pending_is_left_alone(self):
+        with FakeFlutterwaveGateway() as gateway:
+            client = FlutterwaveClient(base_url=gateway.url, secret_key="test")
+            stats = reconcile_stale_pending(timedelta(hours=2), client=client)
+        self.assertEqual(stats.checked, 0)
+        self.assertEqual(gateway.requests, 0)
@@ -0,0 +1,34 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.test import SimpleTestCase
+from apps.payments.utils import generate_transaction_reference
+
+
+class TransactionReferenceTest(SimpleTestCase):
+
+    def test_prefix_is_kept(self):
+        self.assertTrue(generate_transaction_reference("BESW").startswith("BESW-"))
+        self.assertTrue(generate_transaction_reference("BES").startswith("BES-"))
+
+    def test_references_are_sorted_and_unique(self):
+        references = [generate_transaction_reference("BES") for _ in range(10000)]
+        self.assertEqual(len(set(references)), len(references))
+        self.assertEqual(references, sorted(references))
+
+    def test_unique_across_threads(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            batches = list(pool.map(
+                lambda _: [generate_transaction_reference("BES") for _ in range(2000)],
+                range(8)))
+        references = [ref for batch in batches for ref in batch]
+        self.assertEqual(len(set(references)), len(references))
+
+    def test_sorted_when_a_millisecond_runs_out_of_sequence(self):
+        # A frozen clock exhausts the 65536 references of one millisecond
+        with mock.patch("apps.payments.references.time.time_ns",
+                        return_value=time.time_ns()):
+            references = [generate_transaction_reference("BES") for _ in range(70000)]
+        self.assertEqual(len(set(references)), len(references))
+        self.assertEqual(references, sorted(references))
@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+from model_bakery import baker
+from django.conf import settings
+from django.db.models import signals
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from apps.payments.models import (
+    RollupKind, Transaction, TransactionStatus, Wallet, WalletRollup,
+)
+from apps.payments.reconciliation import settle_transactions
+from apps.payments.rollups import rebuild_rollups
+
+
+class WalletRollupTest(APITestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        self.wallet = Wallet.objects.create(user=self.user, balance=100)
+        self.client.force_authenticate(self.user)
+
+    def _create(self, reference, status, value=10, **kwargs):
+        return Transaction.objects.create(
+            value=value, status=status, reference=reference, owner=self.user,
+            description="Test", **kwargs)
+
+    def _rollups(self):
+        # Rows a status change emptied are kept at zero
+        return sorted(WalletRollup.objects.exclude(count=0)
+                      .values_list("kind", "status", "count", "total"))
+
+    def test_rollups_follow_creates_and_status_changes(self):
+        self._create("BESW-1", TransactionStatus.SUCCESSFUL, credit_to=self.wallet)
+        failed = self._create("BESW-2", TransactionStatus.PENDING, credit_to=self.wallet)
+        self._create("BES-3", TransactionStatus.SUCCESSFUL, value=25)
+        failed.status = TransactionStatus.FAILED
+        failed.save()
+        settle_transactions(references=[
+            self._create("BESW-4", TransactionStatus.PENDING, debit_to=self.wallet).reference])
+
+        self.assertEqual(self._rollups(), [
+            (RollupKind.DEBITED, TransactionStatus.SUCCESSFUL, 1, Decimal("10.00")),
+            (RollupKind.FUNDED, TransactionStatus.FAILED, 1, Decimal("10.00")),
+            (RollupKind.FUNDED, TransactionStatus.SUCCESSFUL, 1, Decimal("10.00")),
+            (RollupKind.ORDER, TransactionStatus.SUCCESSFUL, 1, Decimal("25.00")),
+        ])
+
+    def test_rebuild_matches_incremental(self):
+        self._create("BESW-1", TransactionStatus.SUCCESSFUL, credit_to=self.wallet)
+        self._create("BESW-2", TransactionStatus.FAILED, credit_to=self.wallet)
+        self._create("BES-3", TransactionStatus.SUCCESSFUL, value=25)
+        incremental = self._rollups()
+
+        WalletRollup.objects.all().delete()
+        self.assertEqual(rebuild_rollups(workers=1), 1)
+        self.assertEqual(self._rollups(), incremental)
+
+    def test_summary_api(self):
+        self._create("BESW-1", TransactionStatus.SUCCESSFUL, credit_to=self.wallet)
+        self._create("BESW-2", TransactionStatus.FAILED, credit_to=self.wallet)
+        self._create("BES-3", TransactionStatus.SUCCESSFUL, value=25)
+
+        response = self.client.get(reverse("payments:wallet-summary"))
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["funded"], Decimal("10.00"))
+        self.assertEqual(response.data[0]["spent_on_orders"], Decimal("25.00"))
+        self.assertEqual(response.data[0]["failed_attempts"], 1)
@@ -0,0 +1,158 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from model_bakery import baker
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Sum, signals
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from apps.payments.conditional import wallet_version
+from apps.payments.exceptions import InsufficientFunds
+from apps.payments.ledger import mismatched_wallets, open_balances, take_snapshots
+from apps.payments.models import (
+    Transaction, TransactionStatus, Wallet, WalletBalanceSnapshot, WalletRollup, WalletStripe,
+)
+from apps.payments.rollups import wallet_summary
+from apps.payments.striping import restripe
+from apps.payments.transfers import Transfer, execute_transfers
+
+
+class StripedWalletTest(TestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.wallet = Wallet.objects.create(
+            user=baker.make(settings.AUTH_USER_MODEL), balance=100)
+        self.wallet = restripe(self.wallet.pk, 4)
+
+    def _stripes(self):
+        return WalletStripe.objects.filter(wallet=self.wallet).aggregate(
+            total=Sum("balance"))["total"]
+
+    def test_credits_land_on_stripes(self):
+        version = self.wallet.version
+        for _ in range(8):
+            self.wallet.deposit("2.50")
+        wallet = Wallet.objects.get(pk=self.wallet.pk)
+        self.assertEqual((wallet.balance, wallet.version), (Decimal("100.00"), version))
+        self.assertEqual(self._stripes(), Decimal("20.00"))
+        self.assertEqual(wallet.current_balance(), Decimal("120.00"))
+
+    def test_debits_consolidate_when_no_stripe_is_enough(self):
+        self.wallet.deposit(30)
+        self.wallet.withdraw("120.00")
+        wallet = Wallet.objects.get(pk=self.wallet.pk)
+        self.assertEqual((wallet.current_balance(), self._stripes()), (Decimal("10.00"), 0))
+        with self.assertRaises(InsufficientFunds):
+            self.wallet.withdraw("10.01")
+        self.assertEqual(wallet.current_balance(), Decimal("10.00"))
+
+    def test_restripe_to_zero_folds_the_balance_back(self):
+        self.wallet.deposit(5)
+        wallet = restripe(self.wallet.pk, 0)
+        self.assertEqual((wallet.balance, wallet.stripe_count), (Decimal("105.00"), 0))
+        self.assertFalse(WalletStripe.objects.filter(wallet=wallet).exists())
+
+    def test_restripe_never_moves_the_version_back(self):
+        for _ in range(5):
+            self.wallet.deposit(1)
+        before = wallet_version(self.wallet)
+        wallet = restripe(self.wallet.pk, 2)
+        self.assertGreater(wallet_version(wallet), before)
+
+    def test_transactions_leave_the_wallet_row_alone(self):
+        version = Wallet.objects.get(pk=self.wallet.pk).version
+        etag_version = wallet_version(self.wallet)
+        Transaction.objects.create(
+            value=5, status=TransactionStatus.SUCCESSFUL, reference="BESW-1",
+            credit_to=self.wallet, owner=self.wallet.user, description="Funded wallet with 5")
+        self.assertEqual(Wallet.objects.get(pk=self.wallet.pk).version, version)
+        self.assertGreater(wallet_version(self.wallet), etag_version)
+
+    def test_funding_writes_one_stripe(self):
+        versions = dict(WalletStripe.objects.filter(wallet=self.wallet)
+                        .values_list("index", "version"))
+        with transaction.atomic():
+            txn = Transaction.objects.create(
+                value=5, status=TransactionStatus.SUCCESSFUL, reference="BESW-1",
+                credit_to=self.wallet, owner=self.wallet.user, description="Funded wallet with 5")
+            self.wallet.deposit(5, related_transaction=txn)
+        changed = [stripe for stripe in WalletStripe.objects.filter(wallet=self.wallet)
+                   if stripe.version != versions[stripe.index]]
+        self.assertEqual([stripe.balance for stripe in changed], [Decimal("5.00")])
+        # The rollup delta went to the same stripe's shard
+        self.assertEqual(
+            list(WalletRollup.objects.filter(wallet=self.wallet).values_list("shard", flat=True)),
+            [changed[0].index])
+        self.assertEqual(wallet_summary(self.wallet)[0]["funded"], Decimal("5.00"))
+
+    def test_busy_striped_wallets_are_snapshotted(self):
+        open_balances()
+        self.wallet.deposit(7)
+        self.assertEqual(take_snapshots(), 1)
+        snapshot = WalletBalanceSnapshot.objects.get(wallet=self.wallet)
+        self.assertEqual(snapshot.balance, Decimal("107.00"))
+        self.wallet.deposit(3)
+        self.assertFalse(mismatched_wallets().filter(pk=self.wallet.pk).exists())
+
+    def test_transfers_and_ledger_see_the_whole_balance(self):
+        other = Wallet.objects.create(user=baker.make(settings.AUTH_USER_MODEL), balance=0)
+        open_balances()
+        self.wallet.deposit(50)
+        execute_transfers([Transfer(self.wallet.pk, other.pk, Decimal("140"), None)])
+        self.assertEqual(Wallet.objects.get(pk=self.wallet.pk).current_balance(),
+                         Decimal("10.00"))
+        self.assertEqual(Wallet.objects.get(pk=other.pk).balance, Decimal("140.00"))
+        self.assertFalse(mismatched_wallets().filter(pk__in=[self.wallet.pk, other.pk]).exists())
+
+
+class StripedWalletAPITest(APITestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        self.wallet = Wallet.objects.create(user=self.user, balance=100)
+        self.wallet = restripe(self.wallet.pk, 4)
+        self.client.force_authenticate(self.user)
+        self.url = reverse("payments:user-wallet")
+
+    def test_balance_and_etag_include_stripes(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.wallet.deposit(1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["balance"], "101.00")
+
+
+@unittest.skipIf(connection.vendor == "sqlite", "sqlite serializes writers")
+class StripedWalletConcurrencyTest(TransactionTestCase):
+    threads = 16
+    operations = 50
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        wallet = Wallet.objects.create(user=baker.make(settings.AUTH_USER_MODEL), balance=0)
+        self.wallet = restripe(wallet.pk, 8)
+
+    def test_concurrent_credits_and_debits_stay_exact(self):
+        def worker(i):
+            try:
+                wallet = Wallet.objects.get(pk=self.wallet.pk)
+                for _ in range(self.operations):
+                    wallet.deposit(2)
+                    try:
+                        wallet.withdraw(1)
+                    except InsufficientFunds:
+                        pass
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            list(pool.map(worker, range(self.threads)))
+        wallet = Wallet.objects.get(pk=self.wallet.pk)
+        # Every withdrawal follows a deposit of twice the amount, none is refused
+        self.assertEqual(wallet.current_balance(), self.threads * self.operations)
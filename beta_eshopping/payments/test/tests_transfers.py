@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+from model_bakery import baker
+from django.conf import settings
+from django.db.models import Sum, signals
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from apps.payments.exceptions import InsufficientFunds
+from apps.payments.models import LedgerEntry, Transaction, Wallet
+from apps.payments.transfers import Transfer, execute_transfers
+
+
+class TransferTest(APITestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.wallets = [
+            Wallet.objects.create(user=baker.make(settings.AUTH_USER_MODEL), balance=balance)
+            for balance in (100, 0, 0)
+        ]
+        self.merchant, self.first, self.second = self.wallets
+
+    def _balances(self):
+        return [Wallet.objects.get(pk=w.pk).balance for w in self.wallets]
+
+    def test_transfers_are_applied_in_order(self):
+        results = execute_transfers([
+            Transfer(self.merchant.pk, self.first.pk, Decimal("60"), "Payout"),
+            Transfer(self.first.pk, self.second.pk, Decimal("25"), None),
+        ])
+        self.assertEqual(self._balances(), [Decimal("40.00"), Decimal("35.00"), Decimal("25.00")])
+        self.assertEqual(Transaction.objects.count(), 4)
+        self.assertEqual(results[0].credit.owner_id, self.first.user_id)
+        self.assertEqual(LedgerEntry.objects.aggregate(total=Sum("amount"))["total"], 0)
+
+    def test_batch_is_all_or_nothing(self):
+        with self.assertRaises(InsufficientFunds):
+            execute_transfers([
+                Transfer(self.merchant.pk, self.first.pk, Decimal("60"), None),
+                Transfer(self.merchant.pk, self.second.pk, Decimal("60"), None),
+            ])
+        self.assertEqual(self._balances(), [Decimal("100.00"), Decimal("0.00"), Decimal("0.00")])
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_api_requires_staff(self):
+        url = reverse("payments:wallet-transfers")
+        data = {"transfers": [{"debit_wallet": self.merchant.pk,
+                               "credit_wallet": self.first.pk, "amount": "10.00"}]}
+        self.client.force_authenticate(self.first.user)
+        self.assertEqual(self.client.post(url, data, format="json").status_code, 403)
+
+        self.client.force_authenticate(baker.make(settings.AUTH_USER_MODEL, is_staff=True))
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 1)
+
+        data["transfers"][0]["credit_wallet"] = self.merchant.pk
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["index"], 0)
@@ -0,0 +1,197 @@
+import gzip
+import json
+from decimal import Decimal
+from unittest import mock
+
+from model_bakery import baker
+from django.conf import settings
+from django.db.models import signals
+from django.test import TestCase
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from apps.payments.exports import parse_export_date
+from apps.payments.listing import represent, transaction_values
+from apps.payments.models import ExchangeRate, Wallet, Transaction, TransactionStatus
+from apps.payments.rates import dollar_rate, rate_table
+from apps.payments.serializers import TransactionSerializer
+
+
+class TransactionListAPIViewTest(APITestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        self.wallet = Wallet.objects.create(user=self.user)
+        self.client.force_authenticate(self.user)
+        self.url = reverse("payments:user-transactions")
+        for i in range(5):
+            Transaction.objects.create(
+                value=10,
+                status=TransactionStatus.SUCCESSFUL,
+                reference=f"BESW-{i}",
+                credit_to=self.wallet,
+                owner=self.user,
+                description="Funded wallet with 10",
+            )
+
+    def test_list_without_pagination(self):
+        response = self.client.get(self.url, {"type": "wallet"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+
+    def test_keyset_pagination_walks_all_rows(self):
+        references = []
+        params = {"type": "wallet", "page_size": 2}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            references += [row["reference"] for row in response.data["results"]]
+            if not response.data["next"]:
+                break
+            params["cursor"] = response.data["next"]
+        self.assertEqual(references, [f"BESW-{i}" for i in reversed(range(5))])
+
+    def test_default_list_is_scoped_to_owner(self):
+        other = baker.make(settings.AUTH_USER_MODEL)
+        Transaction.objects.create(
+            value=10, status=TransactionStatus.SUCCESSFUL,
+            reference="BES-other", owner=other, description="Other user")
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 5)
+        response = self.client.get(self.url, {"reference": "BES-other"})
+        self.assertEqual(len(response.data), 0)
+
+    def test_rows_without_owner_are_listed_until_backfilled(self):
+        Transaction.objects.create(
+            value=10, status=TransactionStatus.SUCCESSFUL, reference="BESW-legacy",
+            credit_to=self.wallet, description="Funded wallet with 10")
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 6)
+        with self.settings(PAYMENTS_TRANSACTION_OWNER_BACKFILLED=True):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 5)
+        ExchangeRate.objects.create(base="USD", quote="NGN", rate=Decimal("1500"))
+        rate_table.clear()
+        response = self.client.get(self.url, {"page_size": 2, "currency": "ngn"})
+        self.assertEqual(response.status_code, 200)
+        row = response.data["results"][0]
+        self.assertEqual((row["converted_value"], row["converted_currency"]),
+                         ("15000.00", "NGN"))
+        response = self.client.get(self.url, {"currency": "naira"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url, {"page_size": 2})
+        etag = response["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"page_size": 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        response = self.client.get(self.url, {"page_size": 2}, HTTP_IF_NONE_MATCH=f"W/{etag}")
+        self.assertEqual(response.status_code, 304)
+
+        # Other parameters, other representation
+        response = self.client.get(self.url, {"page_size": 3}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        txn = Transaction.objects.get(reference="BESW-0")
+        txn.status = TransactionStatus.FAILED
+        txn.save()
+        response = self.client.get(self.url, {"page_size": 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_wallet_conditional_get(self):
+        url = reverse("payments:user-wallet")
+        with mock.patch.object(dollar_rate, "get", return_value=Decimal("1500")):
+            etag = self.client.get(url)["ETag"]
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+            self.wallet.deposit(5)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["balance"], "5.00")
+            self.assertNotIn("version", response.data)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_streamed_response_matches_list(self):
+        expected = self.client.get(self.url, {"type": "wallet"}).data
+        response = self.client.get(self.url, {"type": "wallet", "stream": "true"})
+        body = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([row["reference"] for row in body],
+                         [row["reference"] for row in expected])
+
+
+class TransactionListingFastPathTest(TestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        self.wallet = Wallet.objects.create(user=self.user)
+        other = Wallet.objects.create(user=baker.make(settings.AUTH_USER_MODEL))
+        baker.make(Transaction, credit_to=self.wallet, value=Decimal("10.50"),
+                   status=TransactionStatus.SUCCESSFUL, _quantity=3)
+        baker.make(Transaction, debit_to=self.wallet, value=Decimal("2.00"),
+                   status=TransactionStatus.FAILED, reason_for_failure="Declined")
+        baker.make(Transaction, credit_to=self.wallet, debit_to=other, value=1,
+                   status=TransactionStatus.PENDING)
+        baker.make(Transaction, status=TransactionStatus.PENDING, updated_by=self.user)
+
+    def test_output_is_byte_identical_to_serializer(self):
+        queryset = Transaction.objects.order_by("-created_at", "-id")
+        renderer = JSONRenderer()
+        expected = renderer.render(TransactionSerializer(queryset, many=True).data)
+        self.assertEqual(renderer.render(represent(transaction_values(queryset))), expected)
+
+    def test_no_wallet_queries(self):
+        queryset = Transaction.objects.order_by("-created_at", "-id")
+        with self.assertNumQueries(1):
+            represent(transaction_values(queryset))
+
+
+class TransactionExportAPIViewTest(APITestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        self.wallet = Wallet.objects.create(user=self.user)
+        self.client.force_authenticate(self.user)
+        self.url = reverse("payments:transactions-export")
+        for i in range(3):
+            Transaction.objects.create(
+                value=10, status=TransactionStatus.SUCCESSFUL, reference=f"BESW-{i}",
+                credit_to=self.wallet, owner=self.user, description="Funded wallet with 10")
+        Transaction.objects.create(
+            value=5, status=TransactionStatus.SUCCESSFUL, reference="BES-other",
+            owner=baker.make(settings.AUTH_USER_MODEL), description="Other user")
+
+    def test_csv_export(self):
+        response = self.client.get(self.url)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn("reference", lines[0].split(","))
+
+    def test_gzipped_ndjson_export(self):
+        response = self.client.get(self.url, {"file_format": "ndjson", "gzip": "true"})
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        body = gzip.decompress(b"".join(response.streaming_content)).decode()
+        references = [json.loads(line)["reference"] for line in body.splitlines()]
+        self.assertEqual(references, ["BESW-0", "BESW-1", "BESW-2"])
+
+    def test_invalid_format(self):
+        response = self.client.get(self.url, {"file_format": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_date_bounds_are_aware(self):
+        for value in ("2024-03-01", "2024-03-01T00:00:00"):
+            parsed = parse_export_date(value)
+            self.assertTrue(timezone.is_aware(parsed))
+            self.assertEqual(timezone.localtime(parsed).date().isoformat(), "2024-03-01")
+        response = self.client.get(self.url, {"start": timezone.localdate().isoformat()})
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 4)
@@ -0,0 +1,84 @@
+import unittest
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+from model_bakery import baker
+from django.test import TestCase, TransactionTestCase
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import signals
+from apps.payments.models import Wallet
+from apps.payments.exceptions import InsufficientFunds
+
+
+class WalletBalanceTest(TestCase):
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        self.wallet = Wallet.objects.create(user=self.user, balance=100)
+
+    def test_deposit_updates_balance(self):
+        self.wallet.deposit("25.50")
+        self.assertEqual(self.wallet.balance, Decimal("125.50"))
+        self.assertEqual(Wallet.objects.get(pk=self.wallet.pk).balance, Decimal("125.50"))
+
+    def test_withdraw_insufficient_funds(self):
+        with self.assertRaises(InsufficientFunds):
+            self.wallet.withdraw(Decimal("100.01"))
+        self.assertEqual(Wallet.objects.get(pk=self.wallet.pk).balance, Decimal("100.00"))
+
+    def test_locked_withdraw(self):
+        self.wallet.withdraw(40, lock=True)
+        self.assertEqual(self.wallet.balance, Decimal("60.00"))
+        with self.assertRaises(InsufficientFunds):
+            self.wallet.withdraw(61, lock=True)
+
+
+@unittest.skipIf(connection.vendor == "sqlite", "sqlite serializes writers")
+class WalletConcurrencyTest(TransactionTestCase):
+    threads = 16
+    operations = 50
+
+    def setUp(self):
+        signals.post_save.receivers = []
+        self.user = baker.make(settings.AUTH_USER_MODEL)
+        self.wallet = Wallet.objects.create(user=self.user, balance=0)
+
+    def _run(self, func):
+        def worker(_):
+            try:
+                wallet = Wallet.objects.get(pk=self.wallet.pk)
+                for _ in range(self.operations):
+                    func(wallet)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            list(pool.map(worker, range(self.threads)))
+
+    def test_concurrent_deposits_are_not_lost(self):
+        def deposit(wallet):
+            wallet.deposit(1)
+        self._run(deposit)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, self.threads * self.operations)
+
+    def test_concurrent_locked_deposits_are_not_lost(self):
+        def locked_deposit(wallet):
+            wallet.deposit(1, lock=True)
+        self._run(locked_deposit)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, self.threads * self.operations)
+
+    def test_concurrent_withdrawals_never_overdraw(self):
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=100)
+
+        def withdraw(wallet):
+            try:
+                wallet.withdraw(1)
+            except InsufficientFunds:
+                pass
+        self._run(withdraw)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 0)
@@ -0,0 +1,114 @@
+import uuid
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .exceptions import InsufficientFunds, InvalidTransfer
+from .instrumentation import timed
+from .models import LedgerEntry, Transaction, TransactionStatus, Wallet
+from .money import WALLET_CURRENCY, Money
+from .references import generate_reference
+from .rollups import apply_rollups, contributions
+from .striping import fold_stripes
+
+Transfer = namedtuple("Transfer", ["debit_wallet", "credit_wallet", "amount", "description"])
+TransferResult = namedtuple("TransferResult", ["debit", "credit"])
+
+
+@timed("execute_transfers")
+def execute_transfers(transfers, updated_by=None):
+    """
+    Move funds between wallets, all transfers or none, in one DB transaction.
+
+    Wallets are locked in primary key order so concurrent batches can't
+    deadlock, transfers are applied in the given order against the locked
+    balances, and everything is written back in a fixed number of
+    statements: one `bulk_update` of the wallets and one `bulk_create` each
+    for the transactions and the ledger. Every transfer is recorded as a
+    debit row owned by the sender and a credit row owned by the recipient,
+    sharing a reference stem, so both see it in their history. Returns a
+    `TransferResult` per transfer.
+    """
+    transfers = [_validated(i, t) for i, t in enumerate(transfers)]
+    if not transfers:
+        return []
+
+    with transaction.atomic():
+        wallet_ids = sorted({pk for t in transfers for pk in (t.debit_wallet, t.credit_wallet)})
+        wallets = {
+            wallet.pk: wallet for wallet in
+            Wallet.objects.select_for_update(no_key=True).filter(pk__in=wallet_ids)
+            .order_by("pk")
+        }
+        # Every locked wallet is written back below
+        fold_stripes(wallets.values())
+
+        now = timezone.now()
+        results, ledger = [], []
+        for i, t in enumerate(transfers):
+            debit, credit = wallets.get(t.debit_wallet), wallets.get(t.credit_wallet)
+            for pk, wallet in ((t.debit_wallet, debit), (t.credit_wallet, credit)):
+                if wallet is None or wallet.deleted_at:
+                    raise InvalidTransfer(f"Wallet {pk} does not exist", index=i)
+            debit.balance = debit.balance or Decimal("0.00")
+            credit.balance = credit.balance or Decimal("0.00")
+            if debit.balance < t.amount:
+                raise InsufficientFunds(
+                    f"Insufficient funds for transfer {i}. Balance of wallet "
+                    f"{debit.pk} is {debit.balance} USD")
+
+            stem = generate_reference("BESW-TRF")
+            description = t.description or f"Transfer of {t.amount}"
+            results.append(TransferResult(
+                Transaction(value=t.amount, status=TransactionStatus.SUCCESSFUL,
+                            reference=f"{stem}-D", debit_to=debit, owner_id=debit.user_id,
+                            description=description, updated_by=updated_by),
+                Transaction(value=t.amount, status=TransactionStatus.SUCCESSFUL,
+                            reference=f"{stem}-C", credit_to=credit, owner_id=credit.user_id,
+                            description=description, updated_by=updated_by),
+            ))
+            debit.balance -= t.amount
+            credit.balance += t.amount
+            group = uuid.uuid4()
+            ledger += [
+                LedgerEntry(group=group, account=f"wallet:{debit.pk}", wallet=debit,
+                            amount=-t.amount, balance_after=debit.balance),
+                LedgerEntry(group=group, account=f"wallet:{credit.pk}", wallet=credit,
+                            amount=t.amount, balance_after=credit.balance),
+            ]
+
+        changed = [wallets[pk] for pk in wallet_ids]
+        for wallet in changed:
+            # The rows are locked, so incrementing in Python is safe
+            wallet.version += 1
+            wallet.updated_at = now
+            wallet.sync_balance_minor()
+        Wallet.objects.bulk_update(changed, ["balance", "balance_minor", "version", "updated_at"])
+
+        txns = [txn for result in results for txn in result]
+        for txn in txns:
+            txn.sync_value_minor()
+        txns = Transaction.objects.bulk_create(txns)
+        for entry, txn in zip(ledger, txns):
+            entry.transaction = txn
+        LedgerEntry.objects.bulk_create(ledger)
+        # bulk_create bypasses Transaction.save
+        apply_rollups(added=[c for txn in txns for c in contributions(txn.rollup_values())])
+    return results
+
+
+def _validated(index, transfer):
+    if not isinstance(transfer, Transfer):
+        transfer = Transfer(**transfer)
+    try:
+        amount = Money.of(transfer.amount, WALLET_CURRENCY).amount
+    except (ArithmeticError, ValueError):
+        raise InvalidTransfer("Amount must be a number with at most 2 decimal places",
+                              index=index)
+    if amount <= 0:
+        raise InvalidTransfer("Amount must be positive", index=index)
+    if transfer.debit_wallet == transfer.credit_wallet:
+        raise InvalidTransfer("Debited and credited wallet must differ", index=index)
+    return transfer._replace(amount=amount)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 # from rest_framework.urlpatterns import format_suffix_patterns
@@ -5,7 +6,22 @@ from apps.payments import views
 
 app_name = 'payments'
 
+# Serve the wallet and transaction list endpoints from the async views when
+# running under ASGI
+if getattr(settings, "PAYMENTS_ASYNC_VIEWS", False):
+    from apps.payments import async_views
+    wallet_view = async_views.AsyncWalletAPIView
+    transaction_list_view = async_views.AsyncTransactionListAPIView
+else:
+    wallet_view = views.WalletAPIView
+    transaction_list_view = views.TransactionListAPIView
+
 urlpatterns = [
-    path('wallet/', views.WalletAPIView.as_view(), name='user-wallet'),
-    path('transactions/', views.TransactionListAPIView.as_view(), name='user-transactions'),
+    path('wallet/', wallet_view.as_view(), name='user-wallet'),
+    path('wallet/summary/', views.WalletSummaryAPIView.as_view(), name='wallet-summary'),
+    path('transactions/', transaction_list_view.as_view(), name='user-transactions'),
+    path('transfers/', views.TransferAPIView.as_view(), name='wallet-transfers'),
+    path('transactions/export/', views.TransactionExportAPIView.as_view(), name='transactions-export'),
+    path('webhooks/flutterwave/', views.FlutterwaveWebhookAPIView.as_view(), name='flutterwave-webhook'),
+    path('metrics/', views.PaymentsMetricsView.as_view(), name='payments-metrics'),
 ]
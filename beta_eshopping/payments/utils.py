@@ -1,6 +1,8 @@
 from apps.payments.models import TransactionStatus
-from apps.shopping.services import FlutterWaveServices
-from datetime import datetime
+from .gateway import get_async_gateway_client, get_gateway_client
+from .money import WALLET_CURRENCY, Money
+from .references import generate_reference
+from .instrumentation import timed
 from .serializers import TransactionSerializer
 
 
@@ -13,17 +15,22 @@ def update_transaction_reference(credit_to, debit_to, reference):
     return "BES-" + reference
 
 
-def process_successful_transaction(credit_to, debit_to, value):
+def process_successful_transaction(credit_to, debit_to, value, lock=False,
+                                   related_transaction=None):
+    # Raises ValueError for sub-cent values instead of letting the DB round them
+    value = Money.of(value, WALLET_CURRENCY)
 
     if credit_to and not credit_to.deleted_at:
         # Credit the wallet associated with the Transaction
-        credit_to.deposit(value)
+        credit_to.deposit(
+            value, lock=lock, related_transaction=related_transaction)
         message = (f'''The transaction was successfully updated, and ${value} 
         has been added to {credit_to.user.email} wallet.''')
 
     if debit_to and not debit_to.deleted_at:
         # Debit the wallet associated with the Transaction
-        debit_to.withdraw(value)
+        debit_to.withdraw(
+            value, lock=lock, related_transaction=related_transaction)
         message = (
             f'''The transaction was successfully updated, and ${value} 
             has been removed from {debit_to.user.email} wallet.'''
@@ -42,27 +49,40 @@ def map_payment_status(payment_status):
 
 
 def generate_transaction_reference(prefix):
-    current_datetime = datetime.now()
-    formatted_datetime = current_datetime.strftime("%Y%m%d%H%M%S")
-    tx_ref = f"{prefix}-{formatted_datetime}"
-    return tx_ref
+    return generate_reference(prefix)
 
 
-def process_payment(req_data, wallet=None, order=None):
-    # Verify payment transaction using FlutterWaveServices
-    payment_verify = FlutterWaveServices.verify_transaction(
-        transaction_id=req_data.get("transaction_id")
-    )
+@timed("gateway_verify")
+def verify_payment(req_data):
+    return get_gateway_client().verify_transaction(req_data.get("transaction_id"))
+
+
+@timed("gateway_verify")
+async def averify_payment(req_data):
+    client = get_async_gateway_client()
+    return await client.verify_transaction(req_data.get("transaction_id"))
+
+
+@timed("process_payment")
+def process_payment(req_data, wallet=None, order=None, payment_verify=None):
+    # Callers that hold a DB transaction should verify beforehand and pass
+    # the result in, so the gateway round trip happens outside of it
+    if payment_verify is None:
+        payment_verify = verify_payment(req_data)
     # Extract data from the verification response
     data = payment_verify.get("data")
 
     transaction_amount = req_data.get('dollar_value', data.get("amount"))
+    # The value is in dollars when the client converted it, the payment type
+    # still records what the customer paid in
+    currency = WALLET_CURRENCY if 'dollar_value' in req_data else data.get("currency")
 
     # Construct transaction data dictionary
     transaction_data = {
         "reference": data.get("tx_ref"),
         "payment_provider_txn_id": data.get("id"),
         "value": transaction_amount,
+        "currency": currency,
         "status": map_payment_status(data.get("status")),
         "payment_type": f'{data.get("payment_type")}({data.get("currency")})'
     }
@@ -72,16 +92,19 @@ def process_payment(req_data, wallet=None, order=None):
 
     if wallet:
         transaction_data["credit_to"] = wallet.id
+        transaction_data["owner"] = wallet.user_id
         transaction_data["description"] = transaction_description(
             None, transaction_amount)
     else:
-        transaction_data["currency"] = data.get("currency")
+        if order:
+            transaction_data["owner"] = order.shopper_id
         transaction_data["description"] = transaction_description(order)
 
     # Return processed transaction data
     return transaction_data
 
 
+@timed("create_or_update_transaction")
 def create_or_update_transaction(data, instance=None):
     if instance:
         serializer = TransactionSerializer(instance, data=data, partial=True)
@@ -97,3 +120,4 @@ def transaction_description(order_obj=None, amount=None):
         return f'Payment for order #{order_obj.order_id}'
     elif amount:
         return f'Funded wallet with {amount}'
+
@@ -1,81 +1,215 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework import status
+from django.conf import settings
 from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.db.models import Q
 from drf_yasg.utils import swagger_auto_schema
 from betaeshopping.utilities import make_params
 
 
-from .serializers import WalletSerializer, TransactionSerializer, GetTransactionSerializer
+from .serializers import WalletSerializer, GetTransactionSerializer, TransferBatchSerializer
 from .models import Wallet, Transaction, TransactionStatus
 from apps.shopping.models import Order
-from .utils import process_payment
+from .utils import process_payment, verify_payment
+from .exceptions import (
+    InsufficientFunds, InvalidTransfer, PaymentGatewayUnavailable, PaymentVerificationFailed,
+)
+from .events import enqueue_event, is_valid_signature
+from .idempotency import idempotent, transfer_key, wallet_funding_key
+from .transfers import Transfer, execute_transfers
+from .pagination import get_page_size, paginate_by_keyset, stream_serialized
+from .listing import owner_scope, represent, transaction_values, with_converted
+from .instrumentation import InstrumentedViewMixin, render_prometheus
+from .rates import dollar_rate, rate_table
+from .exports import CONTENT_TYPES, export_rows, export_stream, parse_export_date
+from .archive import live_archived, unified
+from .rollups import wallet_summary
+from .log_handlers import handler_stats
+from .conditional import (
+    is_not_modified, list_etag, not_modified, wallet_etag, wallet_state, with_etag,
+)
+import hmac
 import logging
 
 db_logger = logging.getLogger("db")
 
 
-class TransactionListAPIView(APIView):
+class TransactionListAPIView(InstrumentedViewMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     type = make_params(title='type', description="type", type="STRING")
     reference = make_params(
         title='reference', description="reference", type="STRING")
+    cursor = make_params(
+        title='cursor', description="Cursor of the next page", type="STRING")
+    page_size = make_params(
+        title='page_size', description="Page size", type="NUM")
+    stream = make_params(
+        title='stream', description="Stream the full history as a JSON array", type="STRING")
+    archived = make_params(
+        title='archived', description="Include archived transactions (default true)", type="STRING")
+    currency = make_params(
+        title='currency', description="Add values converted to this currency", type="STRING")
 
-    @swagger_auto_schema(manual_parameters=[type, reference])
+    @swagger_auto_schema(manual_parameters=[type, reference, cursor, page_size, stream, archived,
+                                            currency])
     def get(self, request):
         _type = request.query_params.get("type")
         reference = request.query_params.get("reference")
+        cursor = request.query_params.get("cursor")
+        page_size = request.query_params.get("page_size")
+        stream = request.query_params.get("stream") in ("1", "true")
+        include_archived = request.query_params.get("archived") not in ("0", "false")
+        try:
+            currency = parse_currency(request.query_params.get("currency"))
+        except ValueError:
+            return Response({"currency": "Must be a 3 letter currency code."},
+                            status=status.HTTP_400_BAD_REQUEST)
         user = request.user
-        wallet = user.wallet
-        filter = {}
-
-        transactions_filtered = False
-        transactions = Transaction.active_objects.order_by("-created_at")
-        if reference:
-            filter["reference"] = reference
-            transactions_filtered = True
-
-        if _type == "wallet":
-            transactions = transactions.filter(
-                Q(debit_to=wallet) | Q(credit_to=wallet))
-            transactions_filtered = True
-
-        if _type == "order":
-            orders = Order.objects.filter(
-                transaction__isnull=False, shopper=user)
-            transaction_ids = orders.values_list('transaction_id', flat=True)
-            filter["id__in"] = transaction_ids
-            transactions_filtered = True
-
-        if not transactions_filtered:
-            orders = Order.objects.filter(
-                transaction__isnull=False, shopper=user)
-            transaction_ids = orders.values_list('transaction_id', flat=True)
-            transactions = transactions.filter(
-                Q(id__in=transaction_ids) | Q(
-                    debit_to=wallet) | Q(credit_to=wallet)
-            ).order_by('-created_at')
-        transactions = transactions.filter(**filter)
-
-        serializer = TransactionSerializer(transactions, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-
-
-class WalletAPIView(APIView):
+        # Answered from the wallet version alone, before any transaction is read
+        state = wallet_state(user)
+        etag = list_etag(state, request.query_params)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+
+        rows, archived_rows = transaction_list_querysets(
+            user, state[0] if state else user.wallet, _type, reference, include_archived)
+
+        present = represent
+        if currency:
+            def present(chunk):
+                return with_converted(represent(chunk), currency)
+
+        if stream:
+            if archived_rows is not None:
+                rows = unified(rows, archived_rows)
+            return with_etag(stream_serialized(rows, present), etag)
+
+        if cursor or page_size:
+            rows, next_cursor = paginate_by_keyset(
+                rows, cursor, get_page_size(page_size), union_with=archived_rows)
+            return with_etag(Response(
+                {"next": next_cursor, "results": present(rows)},
+                status=status.HTTP_200_OK
+            ), etag)
+
+        if archived_rows is not None:
+            rows = unified(rows, archived_rows)
+        return with_etag(Response(present(rows), status=status.HTTP_200_OK), etag)
+
+
+def transaction_list_querysets(user, wallet, _type=None, reference=None,
+                               include_archived=True):
+    """
+    `transaction_values()` querysets of the user's listing and of its
+    archived rows (None when excluded). Shared by the sync and async views.
+    """
+    # Every branch is scoped by the denormalized owner column so the
+    # partial (owner, created_at) index drives the scan.
+    conditions = [owner_scope(user)]
+
+    if reference:
+        conditions.append(Q(reference=reference))
+
+    if _type == "wallet":
+        conditions.append(Q(debit_to=wallet) | Q(credit_to=wallet))
+
+    if _type == "order":
+        orders = Order.objects.filter(
+            transaction__isnull=False, shopper=user)
+        transaction_ids = orders.values_list('transaction_id', flat=True)
+        conditions.append(Q(id__in=transaction_ids))
+
+    # Read-only fast path, same output as TransactionSerializer
+    rows = transaction_values(
+        Transaction.active_objects.filter(*conditions).order_by("-created_at", "-id"))
+    archived_rows = None
+    if include_archived:
+        archived_rows = transaction_values(live_archived().filter(*conditions))
+    return rows, archived_rows
+
+
+def parse_currency(value):
+    if not value:
+        return None
+    if len(value) != 3 or not value.isalpha():
+        raise ValueError(value)
+    return value.upper()
+
+
+class TransactionExportAPIView(InstrumentedViewMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    """
+    Stream the authenticated user's transactions as CSV or NDJSON
+    """
+
+    # Not `format`, DRF reserves that query parameter for content negotiation
+    file_format = make_params(
+        title='file_format', description="csv or ndjson", type="STRING")
+    start = make_params(
+        title='start', description="Created on or after (ISO date/datetime)", type="STRING")
+    end = make_params(
+        title='end', description="Created before (ISO date/datetime)", type="STRING")
+    type = make_params(title='type', description="wallet", type="STRING")
+    compress = make_params(
+        title='gzip', description="gzip the export", type="STRING")
+
+    @swagger_auto_schema(manual_parameters=[file_format, start, end, type, compress])
+    def get(self, request):
+        export_format = request.query_params.get("file_format", "csv")
+        if export_format not in CONTENT_TYPES:
+            return Response({"file_format": "Must be csv or ndjson."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start = parse_export_date(request.query_params.get("start"))
+            end = parse_export_date(request.query_params.get("end"))
+        except ValueError:
+            return Response({"message": "start and end must be ISO dates or datetimes."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get("gzip") in ("1", "true")
+
+        wallet_ids = None
+        if request.query_params.get("type") == "wallet":
+            wallet_ids = [request.user.wallet.pk]
+
+        rows = export_rows(owner=request.user, wallet_ids=wallet_ids, start=start, end=end)
+        response = StreamingHttpResponse(
+            export_stream(export_format, rows, compress),
+            content_type="application/gzip" if compress else CONTENT_TYPES[export_format],
+        )
+        filename = f"transactions.{export_format}" + (".gz" if compress else "")
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class WalletAPIView(InstrumentedViewMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     """
     Get authenticated user's wallet
     """
 
+    currency = make_params(
+        title='currency', description="Add the balance converted to this currency", type="STRING")
+
+    @swagger_auto_schema(manual_parameters=[currency])
     def get(self, request):
+        try:
+            currency = parse_currency(request.query_params.get("currency"))
+        except ValueError:
+            return Response({"currency": "Must be a 3 letter currency code."},
+                            status=status.HTTP_400_BAD_REQUEST)
         # Retrieve the user's wallet object
         wallet = Wallet.objects.get(user=request.user)
-        serializer = WalletSerializer(wallet, many=False)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        etag = wallet_representation_etag(wallet, currency)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        return with_etag(Response(wallet_representation(wallet, currency),
+                                  status=status.HTTP_200_OK), etag)
 
     transaction_id = make_params(
         title='transaction_id', description="Verify/Create Wallet Transaction", type="NUM")
@@ -83,34 +217,191 @@ class WalletAPIView(APIView):
         title='dollar_value', description="Dollar Value", type="NUM")
 
     @swagger_auto_schema(manual_parameters=[transaction_id, dollar_value])
+    @idempotent(wallet_funding_key)
     def post(self, request):
         req_data = request.data
         wallet = request.user.wallet
-        dollar_value = req_data['dollar_value']
 
-        # Wrap the payment processing in a transaction
         try:
-            with transaction.atomic():
-                transaction_data = process_payment(req_data, wallet)
-
-                serializer = GetTransactionSerializer(data=transaction_data)
-                if not serializer.is_valid():
-                    return Response(
-                        serializer.errors, status=status.HTTP_400_BAD_REQUEST
-                    )
-                else:
-                    serializer.save()
-
-                if serializer.instance.status == TransactionStatus.SUCCESSFUL:
-                    wallet.deposit(dollar_value)
-                    return Response(serializer.data, status=status.HTTP_201_CREATED)
-                else:
-                    if serializer.instance.status == TransactionStatus.FAILED:
-                        message = serializer.instance.reason_for_failure
-                        db_logger.warning(
-                            f'error depositing to {wallet.user.email} wallet - {message}')
-                    return Response(serializer.data, status=status.HTTP_502_BAD_GATEWAY)
-
-        except Exception as e:
-            db_logger.exception(e)
-            return Response({"message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            payment_verify = verify_payment(req_data)
+        except PaymentGatewayUnavailable as e:
+            db_logger.warning(f'payment verification unavailable - {e.message}')
+            return Response({"message": e.message}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except PaymentVerificationFailed as e:
+            return Response({"message": e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        return fund_wallet(wallet, req_data, payment_verify)
+
+
+def wallet_representation(wallet, currency=None):
+    data = WalletSerializer(wallet, many=False).data
+    if currency:
+        converted, = rate_table.convert_many([(wallet.current_balance(), "USD")], currency)
+        data["balance_converted"] = None if converted is None else str(converted)
+        data["converted_currency"] = currency
+    return data
+
+
+def wallet_representation_etag(wallet, currency=None):
+    # balance_naira depends on the dollar rate, the converted balance on its rate
+    rate = rate_table.rate("USD", currency) if currency else None
+    return wallet_etag(wallet, dollar_rate.get(), currency, rate)
+
+
+def fund_wallet(wallet, req_data, payment_verify):
+    """
+    Record a verified wallet funding and credit the wallet. Shared by the
+    sync and async wallet views.
+    """
+    dollar_value = req_data['dollar_value']
+    # Only the writes are wrapped in a transaction, the gateway call
+    # must not hold a DB connection open
+    try:
+        with transaction.atomic():
+            transaction_data = process_payment(
+                req_data, wallet, payment_verify=payment_verify)
+
+            # A retry of a payment that was still pending updates its row
+            existing = Transaction.objects.select_for_update().filter(
+                payment_provider_txn_id=transaction_data["payment_provider_txn_id"],
+                credit_to=wallet).first()
+            if existing and existing.status != TransactionStatus.PENDING:
+                return Response(
+                    GetTransactionSerializer(existing).data,
+                    status=status.HTTP_201_CREATED
+                    if existing.status == TransactionStatus.SUCCESSFUL
+                    else status.HTTP_502_BAD_GATEWAY)
+
+            serializer = GetTransactionSerializer(
+                existing, data=transaction_data, partial=existing is not None)
+            if not serializer.is_valid():
+                return Response(
+                    serializer.errors, status=status.HTTP_400_BAD_REQUEST
+                )
+            else:
+                serializer.save()
+
+            if serializer.instance.status == TransactionStatus.SUCCESSFUL:
+                wallet.deposit(
+                    dollar_value, related_transaction=serializer.instance)
+                return Response(serializer.data, status=status.HTTP_201_CREATED)
+            else:
+                if serializer.instance.status == TransactionStatus.FAILED:
+                    message = serializer.instance.reason_for_failure
+                    db_logger.warning(
+                        f'error depositing to {wallet.user.email} wallet - {message}')
+                return Response(serializer.data, status=status.HTTP_502_BAD_GATEWAY)
+
+    except Exception as e:
+        db_logger.exception(e)
+        return Response({"message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class WalletSummaryAPIView(InstrumentedViewMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    """
+    Monthly funding, spending and failed attempts of the authenticated
+    user's wallet, read from the wallet rollups
+    """
+
+    months = make_params(
+        title='months', description="Number of months (default 12, max 120)", type="NUM")
+
+    @swagger_auto_schema(manual_parameters=[months])
+    def get(self, request):
+        try:
+            months = int(request.query_params.get("months", 12))
+        except ValueError:
+            return Response({"months": "Must be a number."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        months = max(1, min(months, 120))
+        return Response(wallet_summary(request.user.wallet, months),
+                        status=status.HTTP_200_OK)
+
+
+class TransferAPIView(InstrumentedViewMixin, APIView):
+    """
+    Move funds between wallets, e.g. refunds, split payments and payouts.
+    All transfers of a request are applied or none is.
+    """
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(request_body=TransferBatchSerializer)
+    @idempotent(transfer_key)
+    def post(self, request):
+        serializer = TransferBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = execute_transfers(
+                [Transfer(**{"description": None, **t})
+                 for t in serializer.validated_data["transfers"]],
+                updated_by=request.user,
+            )
+        except InvalidTransfer as e:
+            return Response({"message": e.message, "index": e.index},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except InsufficientFunds as e:
+            return Response({"message": e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response([
+            {"debit_reference": result.debit.reference,
+             "credit_reference": result.credit.reference,
+             "amount": str(result.debit.value)}
+            for result in results
+        ], status=status.HTTP_201_CREATED)
+
+
+class FlutterwaveWebhookAPIView(InstrumentedViewMixin, APIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    """
+    Receive Flutterwave webhooks. Events are only queued here and applied
+    by the `process_payment_events` worker.
+    """
+
+    def post(self, request):
+        if not is_valid_signature(request.headers.get("verif-hash")):
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+        enqueue_event(request.data)
+        return Response(status=status.HTTP_200_OK)
+
+
+class PaymentsMetricsView(APIView):
+    """
+    Prometheus metrics for the payments app. Requires
+    `Authorization: Bearer <PAYMENTS_METRICS_TOKEN>`, nothing is served
+    while the token is not set.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        token = getattr(settings, "PAYMENTS_METRICS_TOKEN", None)
+        if not token or not hmac.compare_digest(
+                request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+
+        fx_stats = dollar_rate.stats()
+        pair_stats = rate_table.stats()
+        log_stats = handler_stats("db")
+        log_stats.pop("pending", None)
+        body = render_prometheus({
+            "payments_fx_rate_cache_total": (
+                "Dollar rate cache lookups and refreshes",
+                {(("result", key),): value for key, value in fx_stats.items()},
+            ),
+            "payments_fx_pair_cache_total": (
+                "Currency pair rate cache lookups",
+                {(("result", key),): value for key, value in pair_stats.items()},
+            ),
+            "payments_db_log_records_total": (
+                "Records of the db logger by outcome",
+                {(("outcome", key),): value for key, value in log_stats.items()},
+            ),
+        })
+        return HttpResponse(body, content_type="text/plain; version=0.0.4")